@@ -0,0 +1,262 @@
+"""In-process fake of the Jira Server REST API.
+
+Serves a deterministic, generated project over HTTP so the real ``jira``
+client and ``requests`` sessions can be pointed at it, and counts every
+request by method and route. Only the endpoints the toolkit uses are
+implemented; anything else answers 404 and is counted under ``unknown``.
+"""
+import json
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STORY_POINTS_FIELD = "customfield_10016"
+COMPONENTS = ["Checkout", "Search", "Accounts", "Reporting", "Notifications"]
+ACTIONS = ["export", "filter", "reset", "share", "schedule", "audit", "import", "archive"]
+OBJECTS = ["invoices", "saved searches", "passwords", "dashboards", "alerts", "orders", "reports", "profiles"]
+JIRA_TIME = "%Y-%m-%dT%H:%M:%S.000+0000"
+
+ROUTES = [
+    ("GET", r"/rest/api/2/serverInfo", "serverInfo"),
+    ("GET", r"/rest/api/[23]/field", "field"),
+    ("POST", r"/rest/api/[23]/field", "field.create"),
+    ("GET", r"/rest/api/2/search", "search"),
+    ("POST", r"/rest/api/2/search", "search"),
+    ("POST", r"/rest/api/2/issue/bulk", "issue.bulk"),
+    ("GET", r"/rest/api/2/issue/(?P<key>[^/]+)", "issue"),
+    ("PUT", r"/rest/api/2/issue/(?P<key>[^/]+)", "issue.update"),
+    ("GET", r"/rest/api/2/project/(?P<key>[^/]+)", "project"),
+]
+
+
+def _story(project_key, number, now):
+    action = ACTIONS[number % len(ACTIONS)]
+    obj = OBJECTS[(number // len(ACTIONS)) % len(OBJECTS)]
+    # The reference keeps every prompt unique, so concurrent LLM calls never
+    # race on the response cache and call counts stay deterministic.
+    description = f"As a user I want to {action} my {obj} so that I save time. Ref {number}.\n"
+    if number % 5 == 0:
+        # Some stories carry pasted logs, like real backlogs do.
+        description += "{code}\n" + "\n".join(
+            f"2024-03-0{number % 9 + 1} 10:{i:02d}:00 ERROR Failed to {action} {obj}" for i in range(30)
+        ) + "\n{code}"
+    created = now - timedelta(days=400 - number % 400, minutes=number)
+    return {
+        "summary": f"{action.capitalize()} {obj}",
+        "description": description,
+        "issuetype": {"name": "Story"},
+        "components": [{"name": COMPONENTS[number % len(COMPONENTS)]}] if number % 7 else [],
+        "created": created.strftime(JIRA_TIME),
+        "updated": created.strftime(JIRA_TIME),
+        STORY_POINTS_FIELD: [1, 2, 3, 5, 8][number % 5] if number % 3 == 0 else None,
+    }
+
+
+def _custom_field(field_id, name):
+    # The jira client builds its JQL name cache from clauseNames.
+    return {"id": field_id, "name": name, "custom": True, "clauseNames": [f"cf[{field_id.split('_')[-1]}]", name]}
+
+
+class FakeJira:
+    """Generated project data plus request counters, shared by the handler threads."""
+
+    def __init__(self, project_key="BENCH", issue_count=300):
+        self.project_key = project_key
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        now = datetime.now(timezone.utc)
+        self.issues = {
+            f"{project_key}-{n}": _story(project_key, n, now) for n in range(1, issue_count + 1)
+        }
+        self.modified = {}
+        self.fields = [
+            {"id": name, "name": name.capitalize(), "custom": False, "clauseNames": [name]}
+            for name in ("summary", "description", "components", "issuetype", "created", "updated", "labels")
+        ] + [_custom_field(STORY_POINTS_FIELD, "Story Points")]
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests.clear()
+
+    def counts(self):
+        with self.lock:
+            return dict(self.requests)
+
+    # ---- Endpoints ----
+    def server_info(self, base_url):
+        return {
+            "baseUrl": base_url, "version": "9.12.0", "versionNumbers": [9, 12, 0],
+            "deploymentType": "Server", "buildNumber": 9120000, "serverTitle": "Fake Jira",
+        }
+
+    def search(self, params, base_url):
+        jql = params.get("jql", "")
+        start = int(params.get("startAt", 0))
+        size = int(params.get("maxResults", 50))
+        fields = params.get("fields") or []
+        if isinstance(fields, str):
+            fields = fields.split(",")
+        keys = list(self.issues)
+        match = re.search(r"updated >= -(\d+)m", jql)
+        if match:
+            since = datetime.now(timezone.utc) - timedelta(minutes=int(match.group(1)))
+            keys = [k for k in keys if self.modified.get(k, datetime.min.replace(tzinfo=timezone.utc)) >= since]
+        page = keys[start:start + size]
+        return {
+            "startAt": start, "maxResults": size, "total": len(keys),
+            "issues": [self.issue(k, base_url, fields) for k in page],
+        }
+
+    def issue(self, key, base_url, fields=None):
+        data = self.issues[key]
+        if fields and "*all" not in fields:
+            data = {f: data.get(f) for f in fields}
+        if fields and "subtasks" in fields:
+            data["subtasks"] = [
+                {"key": k, "fields": {"summary": v["summary"]}}
+                for k, v in self.issues.items() if (v.get("parent") or {}).get("key") == key
+            ]
+        return {"id": key.split("-")[-1], "key": key, "self": f"{base_url}/rest/api/2/issue/{key}", "fields": data}
+
+    def update(self, key, body):
+        fields = dict(body.get("fields") or {})
+        self.issues[key].update(fields)
+        labels = self.issues[key].setdefault("labels", [])
+        for op in (body.get("update") or {}).get("labels", []):
+            if "add" in op and op["add"] not in labels:
+                labels.append(op["add"])
+            if "remove" in op and op["remove"] in labels:
+                labels.remove(op["remove"])
+        now = datetime.now(timezone.utc)
+        self.issues[key]["updated"] = now.strftime(JIRA_TIME)
+        self.modified[key] = now
+
+    def bulk_create(self, body, base_url):
+        created = []
+        for update in body.get("issueUpdates", []):
+            key = f"{self.project_key}-{len(self.issues) + 1}"
+            fields = dict(update["fields"])
+            now = datetime.now(timezone.utc)
+            fields.setdefault("created", now.strftime(JIRA_TIME))
+            fields["updated"] = now.strftime(JIRA_TIME)
+            self.issues[key] = fields
+            self.modified[key] = now
+            created.append({"id": key.split("-")[-1], "key": key, "self": f"{base_url}/rest/api/2/issue/{key}"})
+        return {"issues": created, "errors": []}
+
+    def project(self, key, base_url):
+        return {
+            "id": "10000", "key": key, "name": key, "self": f"{base_url}/rest/api/2/project/{key}",
+            "issueTypes": [
+                {"id": "1", "name": "Story", "subtask": False},
+                {"id": "2", "name": "Sub-task", "subtask": True},
+            ],
+        }
+
+    def create_field(self, body):
+        field = _custom_field(f"customfield_{20000 + len(self.fields)}", body["name"])
+        self.fields.append(field)
+        return field
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        jira = self.server.jira
+        url = urlparse(self.path)
+        params = {k: v[0] if len(v) == 1 else v for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        base_url = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+        for route_method, pattern, name in ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                break
+        else:
+            name, match = "unknown", None
+        key = match.group("key") if match and "key" in match.groupdict() else None
+        with jira.lock:
+            jira.requests[f"{method} {name}"] += 1
+            status, payload = self._handle(jira, name, key, params, body, base_url)
+        if status == 404 and payload is None:
+            payload = {"errorMessages": [f"Not implemented: {method} {url.path}"]}
+        self._send(status, payload)
+
+    @staticmethod
+    def _handle(jira, name, key, params, body, base_url):
+        if key and key not in jira.issues and name.startswith("issue"):
+            return 404, {"errorMessages": [f"Issue {key} does not exist"]}
+        if name == "serverInfo":
+            return 200, jira.server_info(base_url)
+        if name == "field":
+            return 200, jira.fields
+        if name == "field.create":
+            return 201, jira.create_field(body)
+        if name == "search":
+            return 200, jira.search({**params, **body}, base_url)
+        if name == "issue.bulk":
+            return 201, jira.bulk_create(body, base_url)
+        if name == "issue":
+            fields = params.get("fields")
+            return 200, jira.issue(key, base_url, fields.split(",") if fields else None)
+        if name == "issue.update":
+            jira.update(key, body)
+            return 204, None
+        if name == "project":
+            return 200, jira.project(key, base_url)
+        return 404, None
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+
+class FakeJiraServer:
+    """Serve a ``FakeJira`` on a local port from a background thread."""
+
+    def __init__(self, jira=None, host="127.0.0.1", port=0):
+        self.jira = jira or FakeJira()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.jira = self.jira
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-jira", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
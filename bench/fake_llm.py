@@ -0,0 +1,118 @@
+"""Deterministic stand-in for the chat model.
+
+``FakeChatModel`` answers each agent prompt in that agent's output format,
+derived from a hash of the prompt, so the pages' parsing and write-back run
+exactly as with OpenAI. Every call is counted with its prompt and completion
+tokens.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from core.prompt_budget import count_tokens
+
+STREAM_CHUNK_CHARS = 16
+
+
+def _pick(seed, options):
+    return options[seed % len(options)]
+
+
+def fake_completion(prompt):
+    """Completion for ``prompt`` in the format its agent asks for."""
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    score = _pick(seed, ["High", "Medium", "Low"])
+    priority = _pick(seed // 3, ["Must-have", "Should-have", "Nice-to-have"])
+    points = _pick(seed // 7, ["1-2", "2-3", "3-5", "5-8", "8-13"])
+    if "agile analysis agent" in prompt:
+        return json.dumps({
+            "refined_story": "As a customer I want the feature to work end to end so that I can finish my task.",
+            "acceptance_criteria": ["Given valid input the action succeeds", "Errors are shown inline"],
+            "suggestions": ["Clarify the expected volume"],
+            "point_range": points,
+            "confidence": round(0.5 + (seed % 50) / 100, 2),
+            "estimate_reasoning": "Comparable to the similar stories listed.",
+            "value_assessment": ["Customer impact: direct", "Risk of delay: moderate"],
+            "value_score": score,
+            "priority": priority,
+            "priority_justification": "Unblocks a frequent customer workflow.",
+            "granular": seed % 2 == 0,
+            "granularity_rationale": "Scope fits one sprint." if seed % 2 == 0 else "Covers several workflows.",
+            "suggested_splits": [] if seed % 2 == 0 else ["Happy path", "Error handling"],
+        })
+    if "User Story Refiner Agent" in prompt:
+        return (
+            "---\n**Refined User Story:**  \nAs a customer I want the feature to work end to end "
+            "so that I can finish my task.\n\n**Acceptance Criteria:**  \n"
+            "- Given valid input the action succeeds\n- Errors are shown inline\n---"
+        )
+    if "software analyst" in prompt:
+        return "- Add the API endpoint\n- Build the UI form\n- Write integration tests"
+    if "agile estimation agent" in prompt:
+        return (
+            f"---\n**Estimated Story Point Range:** {points}\n**Confidence Score:** 0.{seed % 9 + 1}\n"
+            "**Reasoning:** Comparable to the similar stories listed.\n---"
+        )
+    if "Business Value Analyst Agent" in prompt:
+        return (
+            "---\n**Business Value Assessment:**  \n- Customer impact: direct\n- Risk of delay: moderate\n\n"
+            f"**Business Value Score:** {score}\n\n**Priority Suggestion:** {priority}  \n"
+            "Justification: Unblocks a frequent customer workflow.\n---"
+        )
+    if "granular" in prompt:
+        return "Yes. Scope fits one sprint." if seed % 2 == 0 else "No. Covers several workflows; split by workflow."
+    return "OK"
+
+
+class FakeChatModel:
+    """Drop-in for the ``ChatOpenAI`` methods the toolkit calls, with call and token counters."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def reset_counts(self):
+        with self.lock:
+            self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    def counts(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+    def bind(self, **kwargs):
+        return self
+
+    def _complete(self, prompt):
+        text = fake_completion(prompt)
+        usage = {
+            "input_tokens": count_tokens(prompt),
+            "output_tokens": count_tokens(text),
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += usage["input_tokens"]
+            self.completion_tokens += usage["output_tokens"]
+        if self.latency:
+            time.sleep(self.latency)
+        return text, usage
+
+    def invoke(self, prompt):
+        text, usage = self._complete(prompt)
+        return AIMessage(content=text, usage_metadata=usage)
+
+    def stream(self, prompt):
+        text, usage = self._complete(prompt)
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            yield AIMessageChunk(content=text[start:start + STREAM_CHUNK_CHARS])
+        yield AIMessageChunk(content="", usage_metadata=usage)
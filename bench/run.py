@@ -0,0 +1,228 @@
+"""Performance regression benchmark for the agent pages.
+
+Drives every page headlessly with Streamlit's AppTest against the fake Jira
+server and the fake chat model, and records per scenario the wall time,
+the Jira requests by route, the LLM calls and their tokens. The run fails
+when any scenario makes more Jira requests or LLM calls than the baseline.
+
+    python -m bench.run                     # compare with bench/baseline.json
+    python -m bench.run --update-baseline   # accept the current numbers
+    python -m bench.run --latency-tolerance 0.5 --output results.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+PROJECT_KEY = "BENCH"
+
+# Settings are read at import time, so isolate caches before importing core.
+os.environ["AGILE_TOOLKIT_DATA_DIR"] = tempfile.mkdtemp(prefix="agile-bench-")
+os.environ.setdefault("ISSUE_SYNC_INTERVAL_SECONDS", "3600")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+sys.path.insert(0, str(REPO_ROOT))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import core.llm  # noqa: E402
+import core.pre_estimate  # noqa: E402
+from core.jobs import get_job_executor  # noqa: E402
+from core.prompt_budget import _get_encoding  # noqa: E402
+from bench.fake_jira import FakeJira, FakeJiraServer  # noqa: E402
+from bench.fake_llm import FakeChatModel  # noqa: E402
+
+PAGES = {
+    "refiner": "pages/1_Refine_User_Story.py",
+    "estimator": "pages/2_Effort_Estimator.py",
+    "business_value": "pages/3_Business_Value_Assessor.py",
+    "granularity": "pages/4_Granularity_Checker.py",
+}
+
+
+def settle(at, timeout=120):
+    """Wait for the background jobs an action submitted, then rerun so the page collects them."""
+    deadline = time.monotonic() + timeout
+    while get_job_executor().pending():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Background jobs did not finish")
+        time.sleep(0.01)
+    return at.run()
+
+
+def click(label=None, key=None):
+    """Action that presses the button with this label or key and waits for its jobs."""
+    def action(at):
+        for button in at.button:
+            if (key and button.key == key) or (label and button.label == label):
+                return settle(button.click().run())
+        raise LookupError(f"No button {label or key!r} on the page")
+    return action
+
+
+def rerun(at):
+    return at.run()
+
+
+def with_setting(module, name, value, action):
+    """Action that runs ``action`` with ``module.name`` set to ``value``, then restores it."""
+    def wrapped(at):
+        previous = getattr(module, name)
+        setattr(module, name, value)
+        try:
+            return action(at)
+        finally:
+            setattr(module, name, previous)
+    return wrapped
+
+
+# (scenario, page, setup actions, measured action). Scenarios run in order in
+# one process, as in a real server where connections and caches are shared.
+SCENARIOS = [
+    ("refiner.first_load", "refiner", [], None),
+    ("refiner.rerun", "refiner", [], rerun),
+    ("refiner.refine_story", "refiner", [], click("🔁 Refine Story")),
+    ("refiner.break_down", "refiner", [click("🔁 Refine Story")], click("🛠️ Break Down Into Tasks")),
+    ("estimator.load", "estimator", [], None),
+    ("estimator.rerun", "estimator", [], rerun),
+    ("estimator.estimate", "estimator", [], click("Estimate Story Points")),
+    # No pre-estimate is confident enough, so the LLM estimator runs.
+    ("estimator.estimate_llm", "estimator", [],
+     with_setting(core.pre_estimate, "PRE_ESTIMATE_CONFIDENCE", 1.01, click("Estimate Story Points"))),
+    ("business_value.load", "business_value", [], None),
+    ("business_value.rerun", "business_value", [], rerun),
+    ("business_value.assess", "business_value", [], click("🔍 Assess Business Value")),
+    ("business_value.score_backlog", "business_value", [], click(key="score_batch_btn")),
+    ("granularity.load", "granularity", [], None),
+    ("granularity.rerun", "granularity", [], rerun),
+    ("granularity.check", "granularity", [], click(key="granularity_btn")),
+    ("analysis.full", "granularity", [], click(key="full_analysis_btn")),
+]
+
+
+def connected_app(page, jira_url):
+    at = AppTest.from_file(str(REPO_ROOT / PAGES[page]), default_timeout=120)
+    at.session_state["connected"] = True
+    at.session_state["jira_host"] = jira_url
+    at.session_state["jira_email"] = "bench@example.com"
+    at.session_state["jira_api_token"] = "bench-token"
+    at.session_state["jira_project_key"] = PROJECT_KEY
+    return at
+
+
+def run_scenarios(issue_count):
+    jira = FakeJira(PROJECT_KEY, issue_count)
+    model = FakeChatModel()
+    core.llm.get_llm = lambda *args, **kwargs: model
+    results = {}
+    with FakeJiraServer(jira) as server:
+        for name, page, setup, action in SCENARIOS:
+            at = connected_app(page, server.url)
+            if action is not None:
+                at.run()
+                for step in setup:
+                    step(at)
+            jira.reset_counts()
+            model.reset_counts()
+            started = time.perf_counter()
+            if action is None:
+                at.run()
+            else:
+                action(at)
+            seconds = time.perf_counter() - started
+            requests = jira.counts()
+            llm = model.counts()
+            results[name] = {
+                "seconds": round(seconds, 4),
+                "jira_requests": sum(requests.values()),
+                "jira_by_route": dict(sorted(requests.items())),
+                "llm_calls": llm["calls"],
+                "prompt_tokens": llm["prompt_tokens"],
+                "completion_tokens": llm["completion_tokens"],
+                "errors": [e.value for e in at.exception],
+            }
+    return results
+
+
+def compare(results, baseline, latency_tolerance=None):
+    """Return a list of regressions of ``results`` against ``baseline``."""
+    regressions = []
+    same_tokenizer = baseline.get("tokenizer") == results["tokenizer"]
+    for name, current in results["scenarios"].items():
+        if current["errors"]:
+            regressions.append(f"{name}: page errors {current['errors']}")
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            # New scenarios must be recorded deliberately, with --update-baseline.
+            regressions.append(f"{name}: not in the baseline")
+            continue
+        checks = ["jira_requests", "llm_calls"]
+        if same_tokenizer:
+            checks.append("prompt_tokens")
+        for metric in checks:
+            if current[metric] > previous[metric]:
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+        if latency_tolerance is not None and current["seconds"] > previous["seconds"] * (1 + latency_tolerance):
+            regressions.append(f"{name}: seconds {previous['seconds']} -> {current['seconds']}")
+    for name in baseline.get("scenarios", {}):
+        if name not in results["scenarios"]:
+            regressions.append(f"{name}: in the baseline but no longer run")
+    return regressions
+
+
+def print_table(scenarios, baseline):
+    header = f"{'scenario':<30} {'seconds':>8} {'jira':>6} {'llm':>5} {'prompt tok':>11} {'compl tok':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, r in scenarios.items():
+        previous = baseline.get("scenarios", {}).get(name, {})
+        delta = r["jira_requests"] - previous.get("jira_requests", r["jira_requests"])
+        flag = f" ({delta:+d})" if delta else ""
+        print(
+            f"{name:<30} {r['seconds']:>8.3f} {r['jira_requests']:>6} {r['llm_calls']:>5} "
+            f"{r['prompt_tokens']:>11} {r['completion_tokens']:>10}{flag}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--issues", type=int, default=300, help="issues in the fake project")
+    parser.add_argument(
+        "--latency-tolerance", type=float, default=None,
+        help="also fail when a scenario is this fraction slower than the baseline (e.g. 0.5)",
+    )
+    parser.add_argument("--output", type=Path, help="write the full results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {
+        "issues": args.issues,
+        "tokenizer": "tiktoken" if _get_encoding() else "estimate",
+        "scenarios": run_scenarios(args.issues),
+    }
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print_table(results["scenarios"], baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+    if baseline and baseline.get("issues") != args.issues:
+        print(f"\nBaseline was recorded with {baseline.get('issues')} issues; not comparing.")
+        return 0
+    regressions = compare(results, baseline, args.latency_tolerance)
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        return 1
+    print("\nNo regressions." if baseline else "\nNo baseline to compare with.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Cold-start benchmark: time to first render of the launcher and each page.
+
+Every script is rendered once in a fresh Python process, the way the first
+visit to a page renders in a newly started server: Streamlit itself is
+already imported, but nothing the page imports is. The page is rendered
+disconnected, so the time is what a user waits for the connection form.
+Each process also reports which heavy libraries the render pulled in.
+
+    python -m bench.startup                       # this tree
+    python -m bench.startup --ref HEAD~1          # before (git ref) and after
+    python -m bench.startup --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS = [
+    "Home.py",
+    "pages/1_Refine_User_Story.py",
+    "pages/2_Effort_Estimator.py",
+    "pages/3_Business_Value_Assessor.py",
+    "pages/4_Granularity_Checker.py",
+]
+HEAVY_MODULES = ["langchain_openai", "langchain_core", "openai", "jira", "requests", "pandas", "numpy", "pydantic"]
+
+# Runs in the child process, inside the tree being measured.
+CHILD = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+started = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+seconds = time.perf_counter() - started
+print(json.dumps({
+    "seconds": seconds,
+    "errors": [e.value for e in at.exception],
+    "heavy": [name for name in sys.argv[2:] if name in sys.modules],
+}))
+"""
+
+
+def render_once(root, script):
+    env = dict(os.environ, PYTHONPATH=str(root), PYTHONDONTWRITEBYTECODE="1")
+    env["AGILE_TOOLKIT_DATA_DIR"] = tempfile.mkdtemp(prefix="agile-startup-")
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, str(root / script), *HEAVY_MODULES],
+        cwd=root, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(root, repeat):
+    """``{script: {"seconds": median, "heavy": [...], "errors": [...]}}`` for one tree."""
+    results = {}
+    for script in SCRIPTS:
+        if not (root / script).exists():
+            continue
+        runs = [render_once(root, script) for _ in range(repeat)]
+        results[script] = {
+            "seconds": round(statistics.median(run["seconds"] for run in runs), 4),
+            "heavy": runs[-1]["heavy"],
+            "errors": runs[-1]["errors"],
+        }
+    return results
+
+
+def checkout(ref, into):
+    """Extract the tree at git ``ref`` into the directory ``into``."""
+    archive = subprocess.run(["git", "archive", ref], cwd=REPO_ROOT, capture_output=True, check=True).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(into)
+    return Path(into)
+
+
+def report(after, before=None):
+    if before is None:
+        print(f"{'script':<38} {'first render':>12}  heavy imports")
+    else:
+        print(f"{'script':<38} {'before':>8} {'after':>8}  heavy imports (after)")
+    for script, result in after.items():
+        heavy = ", ".join(result["heavy"]) or "-"
+        if before is None:
+            print(f"{script:<38} {result['seconds']:>11.2f}s  {heavy}")
+        else:
+            old = before.get(script, {}).get("seconds")
+            old = f"{old:.2f}s" if old is not None else "-"
+            print(f"{script:<38} {old:>8} {result['seconds']:>7.2f}s  {heavy}")
+        for error in result["errors"]:
+            print(f"  error: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ref", help="also measure this git ref as the 'before' column")
+    parser.add_argument("--repeat", type=int, default=3, help="renders per script; the median is reported")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    before = None
+    if args.ref:
+        with tempfile.TemporaryDirectory(prefix="agile-startup-ref-") as tmp:
+            before = measure(checkout(args.ref, tmp), args.repeat)
+    after = measure(REPO_ROOT, args.repeat)
+    report(after, before)
+    if args.output:
+        args.output.write_text(json.dumps({"before": before, "after": after}, indent=2) + "\n")
+    return 1 if any(result["errors"] for result in after.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
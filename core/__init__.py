@@ -0,0 +1 @@
+"""Shared helpers used by the Agile AI Toolkit pages."""
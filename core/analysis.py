@@ -0,0 +1,159 @@
+"""Combined analysis of a story in a single model call.
+
+Refining, estimating, assessing value and checking granularity all read the
+same story text. ``get_story_analysis`` asks for all four in one JSON
+completion, validates it into a ``StoryAnalysis`` and keeps it in the issue
+store, so every agent page can reuse one result until the story changes.
+The ``*_output`` methods render each part in the format of the page's own
+prompt, which keeps the pages' parsing and write-back unchanged.
+"""
+import json
+from typing import List, Literal
+
+from pydantic import BaseModel, Field, ValidationError
+
+from core.prompt_budget import fit_inputs
+from core.routing import confidence_reason, run_routed
+from core.similarity import similar_story_examples
+
+ANALYSIS_KIND = "story_analysis"
+
+STORY_ANALYSIS_PROMPT = """
+You are an agile analysis agent acting as User Story Refiner, Estimation Agent, Business Value Analyst and user story coach at once. Analyse the user story below in four parts.
+
+1. Refinement: rewrite the story for clarity and completeness using the INVEST criteria, add actionable acceptance criteria, and list improvements if information is missing.
+2. Estimation: using the similar stories (with known story points), suggest a draft story point range (e.g., 5-8) and a confidence score from 0 to 1, with a short justification.
+3. Business value: assess the item considering business value or customer impact, deadlines or time sensitivity, dependencies, risk of delay or failure, effort or complexity, alignment with strategic goals, urgency (regulatory, competitive or other) and potential ROI. Suggest a business value score (High, Medium, Low) and a priority (Must-have, Should-have, Nice-to-have) with a brief justification.
+4. Granularity: decide if the story is granular (focused, specific, and achievable within a single sprint by one team). If not, explain why and suggest how to split it into smaller, granular stories.
+
+User Story:
+{user_story}
+
+Component: {component}
+
+Context (if any):
+{context}
+
+SIMILAR STORIES:
+{examples}
+
+Respond with a single JSON object with exactly these keys:
+{{
+  "refined_story": "<improved user story>",
+  "acceptance_criteria": ["<criterion>", ...],
+  "suggestions": ["<missing information or improvement>", ...],
+  "point_range": "<range, e.g. 5-8>",
+  "confidence": <number between 0 and 1>,
+  "estimate_reasoning": "<short justification>",
+  "value_assessment": ["<one bullet per factor>", ...],
+  "value_score": "High" | "Medium" | "Low",
+  "priority": "Must-have" | "Should-have" | "Nice-to-have",
+  "priority_justification": "<justification>",
+  "granular": true | false,
+  "granularity_rationale": "<rationale>",
+  "suggested_splits": ["<smaller story>", ...]
+}}
+"""
+
+
+class StoryAnalysis(BaseModel):
+    """Everything the four agents say about one story."""
+
+    refined_story: str
+    acceptance_criteria: List[str]
+    suggestions: List[str] = Field(default_factory=list)
+    point_range: str
+    confidence: float = Field(ge=0, le=1)
+    estimate_reasoning: str
+    value_assessment: List[str]
+    value_score: Literal["High", "Medium", "Low"]
+    priority: Literal["Must-have", "Should-have", "Nice-to-have"]
+    priority_justification: str
+    granular: bool
+    granularity_rationale: str
+    suggested_splits: List[str] = Field(default_factory=list)
+
+    def refiner_output(self):
+        # One criterion per line: the Refiner page adds the bullets itself.
+        criteria = list(self.acceptance_criteria)
+        if self.suggestions:
+            criteria += ["**Suggestions for Improvement:**"] + self.suggestions
+        return (
+            "---\n**Refined User Story:**  \n" + self.refined_story
+            + "\n\n**Acceptance Criteria:**  \n" + "\n".join(criteria) + "\n---"
+        )
+
+    def estimator_output(self):
+        return (
+            f"---\n**Estimated Story Point Range:** {self.point_range}\n"
+            f"**Confidence Score:** {self.confidence}\n"
+            f"**Reasoning:** {self.estimate_reasoning}\n---"
+        )
+
+    def business_value_output(self):
+        return (
+            "---\n**Business Value Assessment:**  \n"
+            + "\n".join(f"- {factor}" for factor in self.value_assessment)
+            + f"\n\n**Business Value Score:** {self.value_score}\n\n"
+            f"**Priority Suggestion:** {self.priority}  \n"
+            f"Justification: {self.priority_justification}\n---"
+        )
+
+    def granularity_output(self):
+        if self.granular:
+            return f"Yes. {self.granularity_rationale}"
+        splits = "".join(f"\n- {story}" for story in self.suggested_splits)
+        return f"No. {self.granularity_rationale}" + (f"\n\nSuggested split:{splits}" if splits else "")
+
+
+def parse_story_analysis(output):
+    """Validate a JSON completion into a ``StoryAnalysis``; raises ``ValueError`` if it does not fit."""
+    text = output.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        return StoryAnalysis.model_validate(json.loads(text))
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise ValueError(f"Malformed story analysis: {e}") from e
+
+
+def _escalation_reason(output):
+    try:
+        analysis = parse_story_analysis(output)
+    except ValueError:
+        return "malformed output"
+    return confidence_reason(analysis.confidence)
+
+
+def get_story_analysis(store, issue, points_field, context="", use_cache=True):
+    """Return the combined analysis of ``issue``, running the model only when needed.
+
+    A stored analysis is reused while the story is unchanged; extra
+    ``context`` always asks for a fresh one.
+    """
+    if use_cache and not context:
+        stored = store.analysis(issue.key, ANALYSIS_KIND)
+        if stored:
+            return StoryAnalysis.model_validate(stored)
+    summary = issue.fields.summary or ""
+    description = getattr(issue.fields, "description", "") or ""
+    component = issue.fields.components[0].name if issue.fields.components else "General"
+    inputs, _ = fit_inputs("story_analysis", {
+        "user_story": f"{summary}\n\n{description}".strip(),
+        "component": component,
+        "context": context,
+        "examples": similar_story_examples(store, points_field, summary, description, component, exclude_key=issue.key),
+    })
+    output = run_routed(ANALYSIS_KIND, STORY_ANALYSIS_PROMPT, inputs, check=_escalation_reason,
+                        max_tokens=2048, use_cache=use_cache, json_output=True)
+    try:
+        analysis = parse_story_analysis(output)
+    except ValueError:
+        if not use_cache:
+            raise
+        # A bad completion may be sitting in the response cache; ask once more.
+        output = run_routed(ANALYSIS_KIND, STORY_ANALYSIS_PROMPT, inputs, check=_escalation_reason,
+                            max_tokens=2048, use_cache=False, json_output=True)
+        analysis = parse_story_analysis(output)
+    store.save_analysis(issue.key, ANALYSIS_KIND, analysis.model_dump())
+    return analysis
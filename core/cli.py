@@ -0,0 +1,343 @@
+"""Headless batch runs of the agents over a whole Jira project, e.g. from cron.
+
+    python -m core.cli estimate --project PROJ                   # dry run
+    python -m core.cli refine --project PROJ --apply             # write back to Jira
+    python -m core.cli business_value --project PROJ --apply --workers 8
+
+The Jira connection comes from ``--host``/``--email``/``--token`` or the
+``JIRA_HOST``, ``JIRA_EMAIL`` and ``JIRA_API_TOKEN`` settings. Each agent
+picks the issues its page would offer: unrefined issues, Stories without
+story points, issues without a Business Value, or every issue for the
+granularity check. Issues run through the page's prompt and parser on a
+worker pool and, with ``--apply``, are written back as the page's save
+button would.
+
+Every finished issue is appended to a JSON-lines checkpoint, which doubles
+as the run's report. Running the same command again skips the issues the
+checkpoint already has, so an interrupted run resumes where it stopped;
+failed issues are retried, and a dry run's results are applied by rerunning
+with ``--apply`` (answered from the response cache). ``--restart`` starts
+the checkpoint over.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from core.config import DATA_DIR, get_setting
+from core.issue_store import get_issue_store
+from core.jira_client import close_connection, get_jira, update_issue
+from core.jira_fields import BUSINESS_VALUE_FIELD_DESCRIPTION, BUSINESS_VALUE_FIELD_NAME, get_field_registry
+from core.llm import BATCH_CONCURRENCY
+from core.parsing import (
+    REFINED_LABEL, UNREFINED_FILTERS, VALUE_ASSESSED_LABEL, build_refined_description,
+    parse_business_value_output, parse_estimator_output, parse_granularity_verdict, parse_refined_output,
+    save_business_value, save_estimate, save_granularity,
+)
+from core.prompt_budget import fit_inputs
+from core.prompts import BUSINESS_VALUE_PROMPT, ESTIMATOR_PROMPT, GRANULARITY_AGENT_PROMPT, REFINER_PROMPT
+from core.routing import escalation_stats, run_routed
+from core.similarity import similar_story_examples
+
+CHECKPOINT_DIR = DATA_DIR / "checkpoints"
+
+
+class ParseError(Exception):
+    """The model's output could not be parsed into a result."""
+
+
+def story_text(issue):
+    return f"{issue.fields.summary}\n\n{issue.fields.description or ''}".strip()
+
+
+# ---- Agents ----
+@dataclass
+class Agent:
+    """How one agent selects, prompts, parses and writes back an issue.
+
+    ``filters`` returns issue-store filters, ``inputs`` the prompt inputs of
+    an issue, ``parse`` a JSON-able result (raising ``ParseError``) and
+    ``fields`` the Jira fields to write for a result, or None for agents that
+    only report. ``label`` is added to the issue along with the fields, and
+    ``save`` keeps a result in the issue store for the page.
+    """
+    prompt: str
+    budget: str
+    filters: Callable
+    inputs: Callable
+    parse: Callable
+    fields: Callable = None
+    label: str = None
+    save: Callable = None
+    prompt_kwargs: dict = field(default_factory=dict)
+
+
+def _parse_refined(output):
+    summary, criteria = parse_refined_output(output)
+    if not summary:
+        raise ParseError("could not parse the refined output")
+    return {"summary": summary, "criteria": criteria}
+
+
+def _parse_estimate(output):
+    point_range, confidence, reasoning = parse_estimator_output(output)
+    # Like the page's default, the low end of the range becomes the estimate.
+    points = re.search(r"\d+(?:\.\d+)?", point_range)
+    if not points:
+        raise ParseError("could not parse the estimate")
+    return {"points": float(points.group()), "range": point_range, "confidence": confidence, "reasoning": reasoning}
+
+
+def _parse_business_value(output):
+    score, priority, justification = parse_business_value_output(output)
+    if not score:
+        raise ParseError("could not parse the business value score")
+    return {"score": score, "priority": priority, "justification": justification, "assessment": output}
+
+
+def _estimator_inputs(ctx, issue):
+    summary = issue.fields.summary or ""
+    description = getattr(issue.fields, "description", "") or ""
+    component = issue.fields.components[0].name if issue.fields.components else "General"
+    examples = similar_story_examples(
+        ctx.store, ctx.story_points_field, summary, description, component, exclude_key=issue.key, n=5
+    )
+    return {"summary": summary, "description": description, "component": component, "examples": examples}
+
+
+AGENTS = {
+    "refine": Agent(
+        prompt=REFINER_PROMPT,
+        budget="refiner",
+        filters=lambda ctx: UNREFINED_FILTERS,
+        inputs=lambda ctx, issue: {"user_story": story_text(issue)},
+        parse=_parse_refined,
+        fields=lambda ctx, result: {
+            "summary": result["summary"][:255],
+            "description": build_refined_description(result["summary"], result["criteria"]),
+        },
+        label=REFINED_LABEL,
+    ),
+    "estimate": Agent(
+        prompt=ESTIMATOR_PROMPT,
+        budget="estimator",
+        filters=lambda ctx: {"issuetype": "Story", "missing_field": ctx.story_points_field},
+        inputs=_estimator_inputs,
+        parse=_parse_estimate,
+        fields=lambda ctx, result: {ctx.story_points_field: result["points"]},
+        save=lambda ctx, issue, result, written: save_estimate(
+            ctx.store, issue.key, result["range"], result["confidence"], result["reasoning"]
+        ),
+    ),
+    "business_value": Agent(
+        prompt=BUSINESS_VALUE_PROMPT,
+        budget="business_value",
+        filters=lambda ctx: {"missing_field": ctx.value_field, "without_label": VALUE_ASSESSED_LABEL},
+        inputs=lambda ctx, issue: {"user_story": story_text(issue), "context": ""},
+        parse=_parse_business_value,
+        fields=lambda ctx, result: {ctx.value_field: result["assessment"]},
+        label=VALUE_ASSESSED_LABEL,
+        save=lambda ctx, issue, result, written: save_business_value(
+            ctx.store, issue.key, result["assessment"], written=written
+        ),
+        prompt_kwargs={"temperature": 0.2, "max_tokens": 1024},
+    ),
+    "granularity": Agent(
+        prompt=GRANULARITY_AGENT_PROMPT,
+        budget="granularity",
+        filters=lambda ctx: {},
+        inputs=lambda ctx, issue: {"user_story": story_text(issue)},
+        parse=lambda output: {"granular": parse_granularity_verdict(output), "verdict": output.strip()},
+        save=lambda ctx, issue, result, written: save_granularity(ctx.store, issue.key, result["verdict"]),
+    ),
+}
+
+
+@dataclass
+class RunContext:
+    jira: object
+    store: object
+    story_points_field: str = None
+    value_field: str = None
+
+
+# ---- Checkpoint ----
+class Checkpoint:
+    """Append-only JSON-lines record of the issues a run has finished.
+
+    Each line is flushed to disk as soon as its issue finishes, so at most the
+    issues in flight are lost when a run is killed. A torn last line is
+    ignored on load.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.records = {}
+        text = self.path.read_text(encoding="utf-8") if self.path.exists() else ""
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.records[record["key"]] = record
+        if text and not text.endswith("\n"):
+            # Start the next record on a fresh line after a torn write.
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    def finished(self, issue_key, write):
+        """Whether the issue needs no more work: parsed, and also written when ``write``."""
+        record = self.records.get(issue_key)
+        return bool(record) and record["status"] == "ok" and (record["written"] or not write)
+
+    def add(self, record):
+        with self._lock:
+            self.records[record["key"]] = record
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def default_checkpoint_path(agent_name, project_key):
+    return CHECKPOINT_DIR / f"{agent_name}-{project_key.upper()}.jsonl"
+
+
+# ---- Run ----
+def process_issue(agent, ctx, issue, apply, models=None):
+    """Prompt, parse and (with ``apply``) write back one issue; returns its checkpoint record."""
+    record = {"key": issue.key, "status": "ok", "written": False, "result": None, "error": "", "at": time.time()}
+    try:
+        inputs, _ = fit_inputs(agent.budget, agent.inputs(ctx, issue))
+        output = run_routed(agent.budget, agent.prompt, inputs, models=models, **agent.prompt_kwargs)
+        record["result"] = agent.parse(output)
+    except ParseError as e:
+        record.update(status="failed", error=str(e))
+        return record
+    except Exception as e:
+        record.update(status="failed", error=f"OpenAI Error: {e}")
+        return record
+
+    if apply and agent.fields is not None:
+        try:
+            labels = [agent.label] if agent.label else []
+            update_issue(ctx.jira, issue.key, agent.fields(ctx, record["result"]), add_labels=labels)
+            record["written"] = True
+        except Exception as e:
+            record.update(status="failed", error=f"Jira Error: {e}")
+    if agent.save is not None:
+        agent.save(ctx, issue, record["result"], record["written"])
+    return record
+
+
+def run(agent_name, jira_host, jira_email, jira_api_token, project_key, apply=False,
+        workers=BATCH_CONCURRENCY, limit=None, search=None, checkpoint_path=None, restart=False,
+        models=None, log=print):
+    """Run ``agent_name`` over the project's matching issues; returns ``(ok, failed)`` counts.
+
+    ``models`` replaces the agent's model cascade.
+    """
+    agent = AGENTS[agent_name]
+    checkpoint_path = Path(checkpoint_path or default_checkpoint_path(agent_name, project_key))
+    if restart and checkpoint_path.exists():
+        checkpoint_path.unlink()
+    checkpoint = Checkpoint(checkpoint_path)
+
+    jira = get_jira(jira_host, jira_email, jira_api_token)
+    registry = get_field_registry(jira_host, jira_email, jira_api_token)
+    ctx = RunContext(jira, get_issue_store(jira_host, jira_email, jira_api_token, project_key))
+    if agent_name in ("estimate", "business_value"):
+        ctx.story_points_field = registry.story_points_field()
+    if agent_name == "business_value":
+        ctx.value_field, _ = registry.ensure_field(BUSINESS_VALUE_FIELD_NAME, BUSINESS_VALUE_FIELD_DESCRIPTION)
+        if not ctx.value_field:
+            raise RuntimeError(f"Could not create or find the custom field '{BUSINESS_VALUE_FIELD_NAME}'.")
+    ctx.store.track_fields([ctx.story_points_field, ctx.value_field])
+    ctx.store.sync(jira)
+
+    write = apply and agent.fields is not None
+    issues = [
+        issue for issue in ctx.store.issues(search=search, **agent.filters(ctx))
+        if not checkpoint.finished(issue.key, write)
+    ][:limit]
+    already = sum(checkpoint.finished(key, write) for key in checkpoint.records)
+    log(f"{agent_name}: {len(issues)} issues to process, {already} already done "
+        f"({'apply' if apply else 'dry run'}; checkpoint {checkpoint_path})")
+
+    ok = failed = 0
+    started = time.time()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cli")
+    try:
+        futures = [pool.submit(process_issue, agent, ctx, issue, apply, models) for issue in issues]
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            checkpoint.add(record)
+            if record["status"] == "ok":
+                ok += 1
+            else:
+                failed += 1
+            detail = record["error"] or ("written" if record["written"] else "parsed")
+            log(f"[{done}/{len(issues)}] {record['key']}: {detail}")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        close_connection(jira_host, jira_email, jira_api_token)
+    log(f"{agent_name}: {ok} done, {failed} failed")
+    routed = escalation_stats(since=started).get(agent.budget)
+    if routed:
+        log(f"{agent_name}: {routed['escalations']} of {routed['calls']} calls escalated ({routed['rate']:.0%})")
+    return ok, failed
+
+
+def add_connection_arguments(parser):
+    """Add ``--project`` and the Jira connection flags, defaulting to the ``JIRA_*`` settings."""
+    parser.add_argument("--project", required=True, help="Jira project key")
+    parser.add_argument("--host", default=get_setting("JIRA_HOST"), help="Jira host URL (default: JIRA_HOST)")
+    parser.add_argument("--email", default=get_setting("JIRA_EMAIL"), help="Jira email (default: JIRA_EMAIL)")
+    parser.add_argument("--token", default=get_setting("JIRA_API_TOKEN"),
+                        help="Jira API token (default: JIRA_API_TOKEN)")
+
+
+def check_connection_arguments(parser, args):
+    if not (args.host and args.email and args.token):
+        parser.error("Jira host, email and API token are required (flags or JIRA_* settings)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("agent", choices=sorted(AGENTS))
+    add_connection_arguments(parser)
+    parser.add_argument("--apply", action="store_true", help="write the results to Jira (default: dry run)")
+    parser.add_argument("--workers", type=int, default=BATCH_CONCURRENCY, help="concurrent issues")
+    parser.add_argument("--limit", type=int, default=None, help="process at most this many issues")
+    parser.add_argument("--search", default=None, help="only issues whose key or summary contains this")
+    parser.add_argument("--models", default=None,
+                        help="comma-separated models to use instead of the agent's cascade (e.g. gpt-4o)")
+    parser.add_argument("--checkpoint", type=Path, default=None,
+                        help=f"checkpoint file (default: {CHECKPOINT_DIR}/<agent>-<PROJECT>.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="discard the checkpoint and start over")
+    args = parser.parse_args(argv)
+    check_connection_arguments(parser, args)
+
+    try:
+        _, failed = run(
+            args.agent, args.host, args.email, args.token, args.project, apply=args.apply,
+            workers=args.workers, limit=args.limit, search=args.search, checkpoint_path=args.checkpoint,
+            restart=args.restart, models=args.models and [m.strip() for m in args.models.split(",")],
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+        return 130
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
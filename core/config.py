@@ -0,0 +1,27 @@
+"""Runtime settings read from the environment or Streamlit secrets."""
+import os
+from pathlib import Path
+
+
+def get_setting(name, default=None):
+    """Return setting ``name`` from the environment, then ``st.secrets``, else ``default``.
+
+    Values are coerced to the type of ``default`` so numeric and boolean
+    settings can be given as strings in either place.
+    """
+    value = os.environ.get(name)
+    if value is None:
+        try:
+            import streamlit as st
+            value = st.secrets.get(name)
+        except Exception:
+            value = None
+    if value is None or default is None:
+        return default if value is None else value
+    if isinstance(default, bool):
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
+    return type(default)(value)
+
+
+# Where local caches and mirrors are kept.
+DATA_DIR = Path(get_setting("AGILE_TOOLKIT_DATA_DIR", ".agile_cache"))
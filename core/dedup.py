@@ -0,0 +1,257 @@
+"""Near-duplicate detection over a project's issues with MinHash and LSH.
+
+Each issue's summary and description are reduced to a set of word unigrams
+and bigrams and summarised by a MinHash signature, whose agreement with
+another signature estimates the Jaccard similarity of the two sets.
+Signatures are split into bands and bucketed by band (locality-sensitive
+hashing), so only issues sharing a bucket are ever compared. Clustering a
+5,000-issue backlog therefore stays far from the 12.5 million pairs a full
+comparison would need.
+
+Short texts such as suggested splits or implementation tasks are matched
+against a second index over summaries only, because their word sets are
+too small to reach a meaningful Jaccard similarity with a whole story.
+"""
+import re
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from core import telemetry
+from core.config import get_setting
+from core.parsing import REFINED_MARKER
+from core.similarity import tokenize
+
+NUM_PERM = 128
+BANDS = 32
+# Estimated Jaccard similarity from which two issues count as near-duplicates.
+DEDUP_THRESHOLD = get_setting("DEDUP_THRESHOLD", 0.6)
+DEDUP_TITLE_THRESHOLD = get_setting("DEDUP_TITLE_THRESHOLD", 0.5)
+_PRIME = (1 << 31) - 1
+# Text the agents write into every refined description; it says nothing about the story.
+BOILERPLATE = re.compile(
+    r"\*\*(?:Refined User Story|Acceptance Criteria|Implementation Tasks):\*\*|"
+    + re.escape(REFINED_MARKER) + r"|_Refined and broken down by AI agent_"
+)
+
+
+def shingles(text):
+    return set(tokenize(BOILERPLATE.sub(" ", text or "")))
+
+
+class MinHashLSH:
+    """MinHash signatures of token sets, bucketed by LSH bands for candidate lookup."""
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.int64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._signatures = {}
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def copy(self):
+        """Independent copy that can be changed without affecting readers of this one."""
+        other = MinHashLSH.__new__(MinHashLSH)
+        other._a, other._b, other.bands, other.rows = self._a, self._b, self.bands, self.rows
+        other._signatures = dict(self._signatures)
+        other._buckets = [
+            defaultdict(set, ((band_key, set(keys)) for band_key, keys in buckets.items()))
+            for buckets in self._buckets
+        ]
+        return other
+
+    def signature(self, tokens):
+        """MinHash signature of a token set, or None for an empty set."""
+        if not tokens:
+            return None
+        hashes = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.int64, count=len(tokens))
+        return ((np.outer(self._a, hashes % _PRIME) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def upsert(self, key, tokens):
+        self.remove(key)
+        signature = self.signature(tokens)
+        if signature is None:
+            return
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band][band_key].add(key)
+
+    def remove(self, key):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band][band_key]
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[band][band_key]
+
+    def similarity(self, a, b):
+        """Estimated Jaccard similarity of two indexed keys."""
+        return float(np.mean(self._signatures[a] == self._signatures[b]))
+
+    def query(self, tokens, threshold, exclude=()):
+        """``(key, similarity)`` of indexed sets similar to ``tokens``, most similar first."""
+        signature = self.signature(tokens)
+        if signature is None:
+            return []
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates |= self._buckets[band].get(band_key, set())
+        matches = [
+            (key, float(np.mean(self._signatures[key] == signature)))
+            for key in candidates - set(exclude)
+        ]
+        return sorted((m for m in matches if m[1] >= threshold), key=lambda m: -m[1])
+
+    def clusters(self, threshold):
+        """Groups of two or more keys linked by similarities at or above ``threshold``, largest first.
+
+        Keys with identical signatures are grouped up front, and a bucket
+        holding the same groups as one already compared is skipped. Within a
+        bucket, groups already linked are compared once, and the rest are
+        compared with a leader rather than with each other: the first group
+        leads, and groups too far from every leader so far start a new one.
+        That keeps large buckets of templated stories linear, not quadratic.
+        """
+        identical = defaultdict(list)
+        for key, signature in self._signatures.items():
+            identical[signature.tobytes()].append(key)
+        leader_of = {key: keys[0] for keys in identical.values() for key in keys}
+        parent = {keys[0]: keys[0] for keys in identical.values()}
+
+        def find(key):
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        compared = set()
+        for buckets in self._buckets:
+            for bucket in buckets.values():
+                roots = {}
+                for key in bucket:
+                    roots.setdefault(find(leader_of[key]), leader_of[key])
+                members = tuple(sorted(roots.values()))
+                if len(members) < 2 or members in compared:
+                    continue
+                compared.add(members)
+                signatures = np.stack([self._signatures[key] for key in members])
+                unmatched = np.arange(len(members))
+                while len(unmatched):
+                    leader, rest = unmatched[0], unmatched[1:]
+                    similarity = (signatures[rest] == signatures[leader]).mean(axis=1)
+                    for i in rest[similarity >= threshold]:
+                        parent[find(members[i])] = find(members[leader])
+                    unmatched = rest[similarity < threshold]
+
+        groups = defaultdict(list)
+        for keys in identical.values():
+            groups[find(keys[0])].extend(keys)
+        found = (sorted(keys) for keys in groups.values() if len(keys) > 1)
+        return sorted(found, key=lambda keys: (-len(keys), keys))
+
+
+class DuplicateIndex:
+    """MinHash indexes over a store's issues, kept in step with its syncs.
+
+    ``refresh`` changes copies of the indexes and publishes them together as
+    one snapshot, so a query running alongside a sync in another session
+    reads one consistent set of indexes that never changes under it.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._snapshot = (MinHashLSH(), MinHashLSH(), {})
+        self._generation = None
+        self._revision = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stories(self):
+        return self._snapshot[0]
+
+    @property
+    def titles(self):
+        return self._snapshot[1]
+
+    @property
+    def summaries(self):
+        return self._snapshot[2]
+
+    def refresh(self):
+        """Fold in issues written since the last refresh; rebuild after a full reload."""
+        with self._lock:
+            snapshot, since = self._snapshot, self._revision
+            generation = self.store.generation
+            if generation != self._generation:
+                snapshot, since = (MinHashLSH(), MinHashLSH(), {}), 0
+            revision = self.store.revision
+            if revision != since:
+                stories, titles, summaries = snapshot
+                if snapshot is self._snapshot:
+                    stories, titles, summaries = stories.copy(), titles.copy(), dict(summaries)
+                with telemetry.span("app", "dedup.index") as span:
+                    changed = self.store.issues(changed_after=since)
+                    for issue in changed:
+                        summary = issue.fields.summary or ""
+                        summaries[issue.key] = summary
+                        stories.upsert(issue.key, shingles(f"{summary}\n{issue.fields.description or ''}"))
+                        titles.upsert(issue.key, shingles(summary))
+                    span.update(issues=len(changed))
+                snapshot = (stories, titles, summaries)
+            self._snapshot = snapshot
+            self._revision, self._generation = revision, generation
+
+    def _refreshed(self):
+        """The ``(stories, titles, summaries)`` snapshot after a refresh."""
+        self.refresh()
+        return self._snapshot
+
+    def clusters(self, threshold=DEDUP_THRESHOLD):
+        """Groups of near-duplicate issue keys, largest first."""
+        stories, _, _ = self._refreshed()
+        with telemetry.span("app", "dedup.clusters", issues=len(stories)):
+            return stories.clusters(threshold)
+
+    def existing_matches(self, texts, threshold=DEDUP_TITLE_THRESHOLD, exclude=()):
+        """For each short text (a suggested split or task), ``(key, summary, similarity)`` of issues covering it."""
+        _, titles, summaries = self._refreshed()
+        found = {}
+        for text in texts:
+            matches = titles.query(shingles(text), threshold, exclude)
+            if matches:
+                found[text] = [(key, summaries[key], s) for key, s in matches]
+        return found
+
+
+def list_items(text):
+    """Bullet or numbered list items in a model's answer, e.g. suggested splits."""
+    items = re.findall(r"^\s*(?:[-*•]|\d+[.)])\s+(?:\[[ xX]\]\s+)?(.+?)\s*$", text or "", re.M)
+    return [item.strip("*_ ") for item in items if item.strip("*_ ")]
+
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def get_duplicate_index(store):
+    """Return the shared duplicate index for this store."""
+    key = str(store.path)
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = DuplicateIndex(store)
+            _indexes[key] = index
+        return index
@@ -0,0 +1,269 @@
+"""Streaming export of issues and their AI analyses for reporting.
+
+Every result the agents produce is kept in the issue store: the combined
+story analysis, and the single-agent estimates, business value assessments
+and granularity verdicts. This module flattens them into one row per issue
+(story points, estimate range and confidence, value score, priority,
+granularity verdict) and streams the rows to Parquet or CSV a page at a
+time, so memory stays flat for projects of any size:
+
+    python -m core.export --project PROJ --output reports/PROJ.parquet
+    python -m core.export --project PROJ --output PROJ.csv
+
+Exports are incremental. A watermark next to the output records the store
+revision and analysis time the last export reached, and the next run only
+appends issues synced or analysed since. A Parquet export is a directory
+that gains one part file per run; a CSV export is a single file that gains
+rows. An issue that changed is exported again, so readers keep the row with
+the latest ``exported_at`` per key. ``--full`` starts the output over.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from core.analysis import ANALYSIS_KIND
+from core.config import get_setting
+
+EXPORT_PAGE_SIZE = get_setting("EXPORT_PAGE_SIZE", 1000)
+# Analyses saved while an export runs may carry a time just before its
+# start, so each export re-reads a few seconds before the last watermark.
+EXPORT_MARGIN_SECONDS = 5
+KINDS = (ANALYSIS_KIND, "estimate", "business_value", "granularity")
+COLUMNS = [
+    ("key", "string"),
+    ("summary", "string"),
+    ("issuetype", "string"),
+    ("created", "string"),
+    ("updated", "string"),
+    ("story_points", "float64"),
+    ("estimate_range", "string"),
+    ("estimate_points", "float64"),
+    ("estimate_confidence", "float64"),
+    ("estimate_source", "string"),
+    ("value_score", "string"),
+    ("priority", "string"),
+    ("value_in_jira", "bool"),
+    ("granular", "bool"),
+    ("granularity_rationale", "string"),
+    ("analysed_at", "timestamp"),
+    ("exported_at", "timestamp"),
+]
+
+
+def _number(value):
+    """First number in ``value`` (e.g. the low end of ``"5-8"``), or None."""
+    match = re.search(r"\d*\.?\d+", str(value or ""))
+    return float(match.group()) if match else None
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc) if seconds else None
+
+
+def _latest(analyses, kind):
+    """``(data, analysed_at)`` of ``kind`` if it is newer than the combined analysis, else None."""
+    own = analyses.get(kind)
+    combined = analyses.get(ANALYSIS_KIND)
+    if own and (not combined or own[1] >= combined[1]):
+        return own
+    return None
+
+
+def export_row(issue, points_field=None, exported_at=None):
+    """Flatten one row of ``IssueStore.analysis_pages`` into the export columns."""
+    analyses = issue["analyses"]
+    combined = analyses.get(ANALYSIS_KIND, (None, None))[0] or {}
+    row = {
+        "key": issue["key"],
+        "summary": issue["summary"],
+        "issuetype": issue["issuetype"],
+        "created": issue["created"],
+        "updated": issue["updated"],
+        "story_points": _number(issue.get(points_field)) if points_field else None,
+        "estimate_range": combined.get("point_range"),
+        "estimate_confidence": combined.get("confidence"),
+        "estimate_source": "analysis" if combined else None,
+        "value_score": combined.get("value_score"),
+        "priority": combined.get("priority"),
+        "value_in_jira": None,
+        "granular": combined.get("granular"),
+        "granularity_rationale": combined.get("granularity_rationale"),
+        "analysed_at": _timestamp(max((at for _, at in analyses.values()), default=None)),
+        "exported_at": exported_at,
+    }
+    estimate = _latest(analyses, "estimate")
+    if estimate:
+        data = estimate[0]
+        row.update(estimate_range=data["range"], estimate_confidence=_number(data["confidence"]),
+                   estimate_source=data.get("source", "llm"))
+    value = _latest(analyses, "business_value")
+    if value:
+        data = value[0]
+        row.update(value_score=data["score"] or None, priority=data["priority"] or None,
+                   value_in_jira=data["written"])
+    granularity = _latest(analyses, "granularity")
+    if granularity:
+        data = granularity[0]
+        row.update(granular=data["granular"], granularity_rationale=data["verdict"])
+    row["estimate_points"] = _number(row["estimate_range"])
+    return row
+
+
+# ---- Writers ----
+class CsvWriter:
+    """Appends rows to one CSV file, with a header when the file is new."""
+
+    @staticmethod
+    def watermark_path(path):
+        return path.with_name(f"{path.name}.watermark.json")
+
+    def __init__(self, path, full):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        new = full or not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, "w" if full else "a", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, [name for name, _ in COLUMNS])
+        if new:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(
+            {k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()} for row in rows
+        )
+        self._file.flush()
+
+    def close(self, ok=True):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Writes a run's rows as one new part file of a Parquet dataset directory."""
+
+    @staticmethod
+    def watermark_path(path):
+        return path / "_watermark.json"
+
+    def __init__(self, path, full):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:  # pragma: no cover - pyarrow is in requirements.txt
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow), or export to .csv") from e
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        if full:
+            for part in self.path.glob("part-*.parquet"):
+                part.unlink()
+        types = {"string": pa.string(), "float64": pa.float64(), "bool": pa.bool_(),
+                 "timestamp": pa.timestamp("us", tz="UTC")}
+        self.schema = pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        self.part = self.path / f"part-{stamp}.parquet"
+        # Hidden until complete: readers skip names starting with "_".
+        self._pending = self.path / f"_{self.part.name}.tmp"
+        self._writer = None
+
+    def write(self, rows):
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._pending, self.schema)
+        # One row group per page of issues.
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self, ok=True):
+        if self._writer is None:
+            return
+        self._writer.close()
+        if ok:
+            os.replace(self._pending, self.part)
+        else:
+            self._pending.unlink(missing_ok=True)
+
+
+def _writer_for(path, fmt):
+    fmt = fmt or ("csv" if path.suffix.lower() == ".csv" else "parquet")
+    return CsvWriter if fmt == "csv" else ParquetWriter
+
+
+# ---- Export ----
+def export_analyses(store, output, fmt=None, points_field=None, full=False, page_size=EXPORT_PAGE_SIZE):
+    """Append the issues synced or analysed since the last export of ``store`` to ``output``.
+
+    ``fmt`` is ``parquet`` or ``csv`` (default: from the suffix of
+    ``output``). Returns ``{"rows": n, "path": ..., "watermark": {...}}``.
+    """
+    output = Path(output)
+    writer_class = _writer_for(output, fmt)
+    watermark_path = writer_class.watermark_path(output)
+    previous = None if full or not watermark_path.exists() else json.loads(watermark_path.read_text())
+    if previous and previous["project"] != store.project_key:
+        raise ValueError(f"{output} holds an export of {previous['project']}, not {store.project_key}")
+    started = time.time()
+    revision = store.revision
+    if previous and previous["revision"] > revision:
+        # The mirror was rebuilt since, so its revisions started over.
+        previous = None
+    since = {} if previous is None else {
+        "changed_after": previous["revision"], "analysed_after": previous["analysed_at"] - EXPORT_MARGIN_SECONDS,
+    }
+    exported_at = _timestamp(started)
+    writer = writer_class(output, full)
+    rows = 0
+    try:
+        for page in store.analysis_pages(KINDS, fields=[points_field] if points_field else [],
+                                         page_size=page_size, **since):
+            writer.write([export_row(issue, points_field, exported_at) for issue in page])
+            rows += len(page)
+    except BaseException:
+        writer.close(ok=False)
+        raise
+    writer.close()
+    watermark = {"project": store.project_key, "revision": revision, "analysed_at": started,
+                 "exported_at": exported_at.isoformat(), "rows": rows}
+    watermark_path.write_text(json.dumps(watermark, indent=2) + "\n")
+    return {"rows": rows, "path": str(writer.path), "watermark": watermark}
+
+
+def main(argv=None):
+    from core.cli import add_connection_arguments, check_connection_arguments
+    from core.issue_store import get_issue_store
+    from core.jira_client import close_connection, get_jira
+    from core.jira_fields import get_field_registry
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_connection_arguments(parser)
+    parser.add_argument("--output", type=Path, required=True,
+                        help="a .csv file, or a Parquet dataset directory for any other name")
+    parser.add_argument("--format", choices=["parquet", "csv"], default=None,
+                        help="override the format implied by --output")
+    parser.add_argument("--full", action="store_true", help="export every issue and start the output over")
+    parser.add_argument("--no-sync", action="store_true", help="export the local mirror without syncing it first")
+    args = parser.parse_args(argv)
+    check_connection_arguments(parser, args)
+
+    jira = get_jira(args.host, args.email, args.token)
+    try:
+        points_field = get_field_registry(args.host, args.email, args.token).story_points_field()
+        store = get_issue_store(args.host, args.email, args.token, args.project)
+        store.track_fields([points_field])
+        if not args.no_sync:
+            store.sync(jira)
+    finally:
+        close_connection(args.host, args.email, args.token)
+    try:
+        result = export_analyses(store, args.output, args.format, points_field, full=args.full)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Exported {result['rows']} issues to {result['path']} (store revision {result['watermark']['revision']}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,427 @@
+"""Local SQLite mirror of a Jira project's issues.
+
+The first visit loads the whole project once; after that only issues updated
+since the last sync are fetched, either on demand or from a background
+refresh thread. Pages read issues from here instead of running
+``search_issues`` on every rerun.
+
+Only the fields the pages actually use are mirrored, and loads are streamed
+page by page so even very large projects never sit in memory at once.
+
+The same file also keeps the structured results of AI analyses per issue,
+so they outlive the Streamlit session that produced them.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from core import jira_client, telemetry
+from core.config import DATA_DIR, get_setting
+from core.shared_cache import get_shared_cache
+
+log = logging.getLogger(__name__)
+
+SYNC_INTERVAL_SECONDS = get_setting("ISSUE_SYNC_INTERVAL_SECONDS", 120)
+# Extra minutes added to every delta window so clock skew and JQL's minute
+# resolution never drop an update.
+SYNC_MARGIN_MINUTES = 2
+PAGE_SIZE = 100
+# Most options a page puts in a selectbox; the search box narrows the rest.
+SELECTBOX_LIMIT = 200
+
+# Fields every page needs. Pages add instance-specific ones such as story
+# points or Business Value with ``track_fields``.
+ISSUE_FIELDS = [
+    "summary", "description", "components", "issuetype", "created", "updated", "labels",
+]
+
+SCHEMA_VERSION = "4"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    key TEXT PRIMARY KEY,
+    summary TEXT,
+    issuetype TEXT,
+    created TEXT,
+    updated TEXT,
+    fields TEXT NOT NULL,
+    generation INTEGER NOT NULL DEFAULT 0,
+    revision INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS issues_revision ON issues(revision);
+CREATE INDEX IF NOT EXISTS issues_created ON issues(created);
+CREATE INDEX IF NOT EXISTS issues_updated ON issues(updated);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    issue_key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    issue_updated TEXT,
+    analysed_at REAL NOT NULL,
+    PRIMARY KEY (issue_key, kind)
+);
+"""
+
+
+def _namespace(value):
+    """Turn raw issue JSON into attribute objects shaped like ``jira.Issue``."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_namespace(v) for v in value]
+    return value
+
+
+def _to_issue(key, fields_json):
+    return SimpleNamespace(key=key, fields=_namespace(json.loads(fields_json)))
+
+
+class IssueStore:
+    """Issues of one project, mirrored into a local SQLite file."""
+
+    def __init__(self, path, project_key):
+        self.path = Path(path)
+        self.project_key = project_key
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._jira = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            if self._get_meta(conn, "schema_version") != SCHEMA_VERSION:
+                # The mirror is only a cache: rebuild it rather than migrate.
+                conn.executescript("DROP TABLE issues; DROP TABLE meta;")
+                conn.executescript(SCHEMA)
+                self._set_meta(conn, "schema_version", SCHEMA_VERSION)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ---- Sync state ----
+    def _get_meta(self, conn, name):
+        row = conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, conn, name, value):
+        conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    @property
+    def last_sync(self):
+        """Epoch seconds of the last successful sync, or None if never synced."""
+        with self._connect() as conn:
+            value = self._get_meta(conn, "last_sync")
+        return float(value) if value else None
+
+    @property
+    def generation(self):
+        """Bumped by every full load, which may also drop deleted issues."""
+        with self._connect() as conn:
+            return int(self._get_meta(conn, "generation") or 0)
+
+    @property
+    def revision(self):
+        """Bumped by every sync; each issue row carries the revision that last wrote it."""
+        with self._connect() as conn:
+            return int(self._get_meta(conn, "revision") or 0)
+
+    @property
+    def fields(self):
+        """Field ids mirrored for each issue."""
+        with self._connect() as conn:
+            extra = self._get_meta(conn, "extra_fields")
+        return ISSUE_FIELDS + (json.loads(extra) if extra else [])
+
+    def track_fields(self, field_ids):
+        """Also mirror ``field_ids``; a newly tracked field forces the next sync to be full."""
+        current = self.fields
+        missing = [f for f in field_ids if f and f not in current]
+        if not missing:
+            return
+        with self._connect() as conn:
+            self._set_meta(conn, "extra_fields", json.dumps(current[len(ISSUE_FIELDS):] + missing))
+            conn.execute("DELETE FROM meta WHERE name = 'last_sync'")
+
+    # ---- Sync ----
+    def sync(self, jira, full=False):
+        """Pull issues from Jira: everything on the first run or when ``full``, else the delta.
+
+        Returns the number of issues written.
+        """
+        with self._sync_lock, telemetry.span("app", "store.sync") as span:
+            started = time.time()
+            last_sync = self.last_sync
+            full = full or not last_sync
+            jql = f"project={self.project_key}"
+            if not full:
+                minutes = int((started - last_sync) // 60) + SYNC_MARGIN_MINUTES
+                jql += f" AND updated >= -{minutes}m"
+            with self._connect() as conn:
+                generation = int(self._get_meta(conn, "generation") or 0) + (1 if full else 0)
+                revision = int(self._get_meta(conn, "revision") or 0) + 1
+            written = 0
+            # Each page is committed on its own so readers keep seeing the
+            # previous mirror while a full load streams in.
+            for page in jira_client.iter_issue_pages(jira, f"{jql} ORDER BY updated ASC", self.fields, PAGE_SIZE):
+                rows = [
+                    (
+                        i["key"],
+                        i["fields"].get("summary"),
+                        (i["fields"].get("issuetype") or {}).get("name"),
+                        i["fields"].get("created"),
+                        i["fields"].get("updated"),
+                        json.dumps(i["fields"]),
+                        generation,
+                        revision,
+                    )
+                    for i in page
+                ]
+                with self._connect() as conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO issues "
+                        "(key, summary, issuetype, created, updated, fields, generation, revision) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                written += len(rows)
+            with self._connect() as conn:
+                if full:
+                    # Anything not seen in a full load was deleted or moved in Jira.
+                    conn.execute("DELETE FROM issues WHERE generation < ?", (generation,))
+                self._set_meta(conn, "generation", generation)
+                self._set_meta(conn, "revision", revision)
+                self._set_meta(conn, "last_sync", started)
+            span.update(full=full, written=written)
+            return written
+
+    def ensure_loaded(self, jira):
+        """Do the initial full load if this project has never been synced.
+
+        Sessions arriving while the load runs wait for it instead of loading
+        the project again.
+        """
+        if self.last_sync is None:
+            get_shared_cache("store.load").get_or_load(
+                str(self.path), lambda: self.sync(jira, full=True) if self.last_sync is None else 0
+            )
+
+    def start_background_refresh(self, jira, interval=SYNC_INTERVAL_SECONDS):
+        """Keep the mirror fresh with delta syncs every ``interval`` seconds."""
+        self._jira = jira
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._refresh_loop,
+            args=(interval,),
+            name=f"issue-sync-{self.project_key}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
+        self._jira = None
+
+    def _refresh_loop(self, interval):
+        while not self._stop.wait(interval):
+            jira = self._jira
+            if jira is None:
+                return
+            try:
+                self.sync(jira)
+            except Exception:
+                log.exception("Background sync of %s failed", self.project_key)
+
+    # ---- Reads ----
+    def _where(self, issuetype=None, component=None, has_field=None, missing_field=None,
+               search=None, description_excludes=None, without_label=None, changed_after=None):
+        clauses, params = [], []
+        if changed_after is not None:
+            clauses.append("revision > ?")
+            params.append(changed_after)
+        if issuetype:
+            clauses.append("issuetype = ?")
+            params.append(issuetype)
+        if component:
+            clauses.append(
+                "EXISTS (SELECT 1 FROM json_each(issues.fields, '$.components') c "
+                "WHERE json_extract(c.value, '$.name') = ?)"
+            )
+            params.append(component)
+        if has_field:
+            clauses.append(f"json_extract(fields, '$.\"{has_field}\"') IS NOT NULL")
+        if missing_field:
+            clauses.append(f"json_extract(fields, '$.\"{missing_field}\"') IS NULL")
+        if search:
+            clauses.append("(key LIKE ? OR summary LIKE ?)")
+            params += [f"%{search.strip()}%"] * 2
+        if description_excludes:
+            clauses.append("IFNULL(json_extract(fields, '$.description'), '') NOT LIKE ?")
+            params.append(f"%{description_excludes}%")
+        if without_label:
+            clauses.append(
+                "NOT EXISTS (SELECT 1 FROM json_each(issues.fields, '$.labels') l WHERE l.value = ?)"
+            )
+            params.append(without_label)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def count(self, **filters):
+        """Number of mirrored issues matching the same filters as ``issues``."""
+        where, params = self._where(**filters)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM issues{where}", params).fetchone()[0]
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT key, fields FROM issues WHERE key = ?", (key,)).fetchone()
+        return _to_issue(*row) if row else None
+
+    def issues(self, order_by="created ASC", limit=None, **filters):
+        """Return mirrored issues as ``jira.Issue``-like objects.
+
+        Filters: ``issuetype``, ``component``, ``has_field``/``missing_field``
+        (a field id such as ``customfield_10016``), ``search`` (key or summary
+        substring), ``description_excludes``, ``without_label`` and
+        ``changed_after`` (a store ``revision``).
+        """
+        where, params = self._where(**filters)
+        sql = f"SELECT key, fields FROM issues{where} ORDER BY {order_by}"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            return [_to_issue(*row) for row in conn.execute(sql, params)]
+
+    # ---- Analyses ----
+    def save_analysis(self, issue_key, kind, data):
+        """Store the latest ``kind`` analysis (a JSON-serialisable dict) for an issue."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (issue_key, kind, data, issue_updated, analysed_at) "
+                "VALUES (?, ?, ?, (SELECT updated FROM issues WHERE key = ?), ?)",
+                (issue_key, kind, json.dumps(data), issue_key, time.time()),
+            )
+
+    def analysis(self, issue_key, kind):
+        """Latest ``kind`` analysis of an issue, or None if there is none or the issue changed since."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT a.data FROM analyses a JOIN issues i ON i.key = a.issue_key "
+                "WHERE a.issue_key = ? AND a.kind = ? AND a.issue_updated IS i.updated",
+                (issue_key, kind),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def carry_analysis(self, issue_key, kind):
+        """Mark the ``kind`` analysis as current for the issue's latest version.
+
+        For updates known not to touch what the analysis read, such as a
+        status change or a story-points write-back.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE analyses SET issue_updated = (SELECT updated FROM issues WHERE key = ?) "
+                "WHERE issue_key = ? AND kind = ?",
+                (issue_key, issue_key, kind),
+            )
+
+    def analyses(self, kind):
+        """Latest ``kind`` analyses as dicts with ``key``, ``summary``, ``data`` and ``analysed_at``."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT a.issue_key, i.summary, a.data, a.analysed_at FROM analyses a "
+                "LEFT JOIN issues i ON i.key = a.issue_key WHERE a.kind = ? ORDER BY a.issue_key",
+                (kind,),
+            ).fetchall()
+        return [
+            {"key": key, "summary": summary, "data": json.loads(data), "analysed_at": analysed_at}
+            for key, summary, data, analysed_at in rows
+        ]
+
+    def analysis_pages(self, kinds, fields=(), changed_after=None, analysed_after=None, page_size=PAGE_SIZE):
+        """Yield pages of issues with their latest ``kinds`` analyses, in key order.
+
+        Each row is a dict with the issue's ``key``, ``summary``, ``issuetype``,
+        ``created``, ``updated`` and ``revision``, the values of ``fields`` and
+        ``analyses``, mapping each kind the issue has to ``(data, analysed_at)``.
+        With ``changed_after`` (a store ``revision``) or ``analysed_after``
+        (epoch seconds) only issues written or analysed since are included.
+        Pages are read one query at a time, so memory stays flat however
+        large the project.
+        """
+        joins = "".join(
+            f" LEFT JOIN analyses a{n} ON a{n}.issue_key = i.key AND a{n}.kind = ?" for n in range(len(kinds))
+        )
+        columns = "".join(f", a{n}.data, a{n}.analysed_at" for n in range(len(kinds)))
+        columns += "".join(f", json_extract(i.fields, '$.\"{f}\"')" for f in fields)
+        since, since_params = [], []
+        if changed_after is not None:
+            since.append("i.revision > ?")
+            since_params.append(changed_after)
+        if analysed_after is not None:
+            since += [f"a{n}.analysed_at > ?" for n in range(len(kinds))]
+            since_params += [analysed_after] * len(kinds)
+        sql = (
+            f"SELECT i.key, i.summary, i.issuetype, i.created, i.updated, i.revision{columns} "
+            f"FROM issues i{joins} WHERE i.key > ?"
+            + (f" AND ({' OR '.join(since)})" if since else "")
+            + " ORDER BY i.key LIMIT ?"
+        )
+        last_key = ""
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(sql, [*kinds, last_key, *since_params, page_size]).fetchall()
+            if not rows:
+                return
+            page = []
+            for row in rows:
+                found = row[6:6 + 2 * len(kinds)]
+                page.append({
+                    "key": row[0], "summary": row[1], "issuetype": row[2],
+                    "created": row[3], "updated": row[4], "revision": row[5],
+                    **dict(zip(fields, row[6 + 2 * len(kinds):])),
+                    "analyses": {
+                        kind: (json.loads(found[2 * n]), found[2 * n + 1])
+                        for n, kind in enumerate(kinds) if found[2 * n] is not None
+                    },
+                })
+            yield page
+            last_key = rows[-1][0]
+
+
+# ---- Shared stores ----
+_lock = threading.Lock()
+_stores = {}
+
+
+def get_issue_store(jira_host, jira_email, jira_api_token, project_key):
+    """Return the shared store for this connection and project."""
+    conn_key = jira_client.connection_key(jira_host, jira_email, jira_api_token)
+    key = (conn_key, project_key.upper())
+    with _lock:
+        store = _stores.get(key)
+        if store is None:
+            digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:16]
+            store = IssueStore(DATA_DIR / f"issues-{project_key.upper()}-{digest}.sqlite3", project_key)
+            _stores[key] = store
+        return store
+
+
+def _stop_stores(conn_key):
+    with _lock:
+        stores = [_stores.pop(key) for key in [key for key in _stores if key[0] == conn_key]]
+    for store in stores:
+        store.stop_background_refresh()
+
+
+jira_client.on_close(_stop_stores)
@@ -0,0 +1,266 @@
+"""Shared, pooled Jira connections.
+
+Streamlit re-executes every page script on each interaction. Building a new
+``JIRA`` object on every rerun means a fresh HTTP session, TLS handshake and
+server-info probe each time, so the clients live here instead: one per host
+and credential set, shared by all reruns, pages and sessions of the process.
+
+Sessions using the same credentials also share their GETs: identical
+requests in flight at the same time are sent once, and responses other than
+searches are kept for ``JIRA_GET_CACHE_SECONDS``. Any write made with those
+credentials drops their kept responses, so a session always reads its own
+writes.
+
+Browser sessions ``attach_session`` to the connection they use and
+``detach_session`` when they disconnect. The connection is closed, with its
+issue stores' background refreshes and field registry, once no live session
+is attached to it any more, including when the last tab using it was closed
+without disconnecting.
+"""
+import copy
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from core import telemetry
+from core.config import get_setting
+from core.rate_limit import RateLimitedAdapter, get_limiter
+from core.shared_cache import get_shared_cache
+
+POOL_SIZE = 16
+JIRA_GET_CACHE_SECONDS = get_setting("JIRA_GET_CACHE_SECONDS", 10.0)
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+_lock = threading.Lock()
+_clients = {}
+_sessions = {}
+_attached = {}
+_close_callbacks = []
+
+
+def connection_key(jira_host, jira_email, jira_api_token):
+    """Key a connection by host and credentials without keeping the raw token around."""
+    token_digest = hashlib.sha256(jira_api_token.strip().encode("utf-8")).hexdigest()
+    return (jira_host.strip().rstrip("/"), jira_email.strip().lower(), token_digest)
+
+
+class SharedGetAdapter(RateLimitedAdapter):
+    """Rate-limited adapter that shares GET responses between sessions with the same credentials."""
+
+    def send(self, request, **kwargs):
+        # The Authorization header scopes sharing to one credential set.
+        scope = hashlib.sha256(request.headers.get("Authorization", "").encode("utf-8")).hexdigest()
+        cache = get_shared_cache("jira.get", ttl=JIRA_GET_CACHE_SECONDS)
+        if request.method != "GET" or kwargs.get("stream"):
+            response = super().send(request, **kwargs)
+            if request.method in WRITE_METHODS:
+                cache.invalidate(lambda key: key[0] == scope)
+            return response
+        sent = []
+
+        def load():
+            sent.append(True)
+            response = super(SharedGetAdapter, self).send(request, **kwargs)
+            response.content  # Read the body once so every sharer can use it.
+            return response
+
+        response = cache.get_or_load(
+            (scope, request.url, request.headers.get("Accept")),
+            load,
+            # Searches feed delta syncs, which must see the latest updates.
+            cacheable=lambda r: r.status_code == 200 and "/search" not in urlparse(r.url).path,
+            size=lambda r: len(r.content or b""),
+        )
+        shared = copy.copy(response)
+        shared.request = request
+        shared.shared = not sent
+        return shared
+
+
+def _mount_pool(session, jira_host):
+    # Every session for this host shares its limiter, which also retries throttled requests.
+    adapter = SharedGetAdapter(
+        get_limiter(f"jira:{urlparse(jira_host).netloc or jira_host}"),
+        pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def get_jira(jira_host, jira_email, jira_api_token):
+    """Return the shared JIRA client for these credentials, connecting on first use."""
+    key = connection_key(jira_host, jira_email, jira_api_token)
+    with _lock:
+        jira = _clients.get(key)
+        if jira is None:
+            # Imported on first connect so pages render their connection form without it.
+            from jira import JIRA
+
+            # The constructor probes serverInfo before its session can be instrumented.
+            with telemetry.span("jira", "JIRA()"):
+                jira = JIRA(server=key[0], basic_auth=(jira_email.strip(), jira_api_token.strip()), max_retries=0)
+            _mount_pool(jira._session, key[0])
+            telemetry.instrument_session(jira._session)
+            _clients[key] = jira
+        return jira
+
+
+def get_http_session(jira_host, jira_email, jira_api_token):
+    """Return a keep-alive ``requests.Session`` for raw REST calls against this Jira."""
+    key = connection_key(jira_host, jira_email, jira_api_token)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.auth = HTTPBasicAuth(jira_email.strip(), jira_api_token.strip())
+            session.headers.update({"Accept": "application/json"})
+            _mount_pool(session, key[0])
+            telemetry.instrument_session(session)
+            _sessions[key] = session
+        return session
+
+
+def on_close(callback):
+    """Register ``callback(key)`` to run whenever a connection is closed."""
+    _close_callbacks.append(callback)
+
+
+def _drop_inactive(is_active):
+    """Forget attached sessions that ended; return the keys no session uses any more."""
+    unused = []
+    for key, sessions in list(_attached.items()):
+        if is_active is not None:
+            sessions = {s for s in sessions if is_active(s)}
+        if sessions:
+            _attached[key] = sessions
+        else:
+            del _attached[key]
+            unused.append(key)
+    return unused
+
+
+def attach_session(session_id, jira_host, jira_email, jira_api_token, is_active=None):
+    """Record that browser session ``session_id`` uses the connection for these credentials.
+
+    ``is_active(session_id)``, when given, tells whether a session is still
+    alive; connections left only to sessions that ended without
+    disconnecting are closed.
+    """
+    key = connection_key(jira_host, jira_email, jira_api_token)
+    with _lock:
+        _attached.setdefault(key, set()).add(session_id)
+        unused = _drop_inactive(is_active)
+    for other in unused:
+        _close(other)
+
+
+def detach_session(session_id, jira_host, jira_email, jira_api_token, is_active=None):
+    """Forget that ``session_id`` uses this connection; close it if no other live session does.
+
+    ``is_active`` is as for ``attach_session``. Returns True if the
+    connection was closed.
+    """
+    key = connection_key(jira_host, jira_email, jira_api_token)
+    with _lock:
+        _attached.setdefault(key, set()).discard(session_id)
+        unused = _drop_inactive(is_active)
+    for other in unused:
+        _close(other)
+    return key in unused
+
+
+def close_connection(jira_host, jira_email, jira_api_token):
+    """Close and forget the client and session for these credentials.
+
+    This tears the connection down for the whole process, stopping the issue
+    stores' background refreshes too. The command-line tools call it on
+    exit; pages go through ``detach_session``, which calls it once the last
+    session using the connection has gone.
+    """
+    _close(connection_key(jira_host, jira_email, jira_api_token))
+
+
+def _close(key):
+    with _lock:
+        jira = _clients.pop(key, None)
+        session = _sessions.pop(key, None)
+    for callback in _close_callbacks:
+        callback(key)
+    if jira is not None:
+        jira.close()
+    if session is not None:
+        session.close()
+
+
+def iter_issue_pages(jira, jql, fields, page_size=100):
+    """Yield successive pages of raw issue dicts matching ``jql``.
+
+    Only ``fields`` are requested, and pages are fetched lazily, so callers
+    can stream a whole project without holding it in memory. Jira Cloud pages
+    with ``nextPageToken``; Server/Data Center with ``startAt``.
+    """
+    if jira._is_cloud:
+        token = None
+        while True:
+            page = jira.enhanced_search_issues(
+                jql, nextPageToken=token, maxResults=page_size,
+                fields=list(fields), json_result=True,
+            )
+            issues = page.get("issues", [])
+            if issues:
+                yield issues
+            token = page.get("nextPageToken")
+            if page.get("isLast", True) or not token:
+                return
+    else:
+        start = 0
+        while True:
+            page = jira.search_issues(
+                jql, startAt=start, maxResults=page_size,
+                fields=list(fields), json_result=True,
+            )
+            issues = page.get("issues", [])
+            if issues:
+                yield issues
+            start += len(issues)
+            if not issues or start >= page.get("total", 0):
+                return
+
+
+def update_issue(jira, issue_key, fields, add_labels=()):
+    """Write ``fields`` to one issue with a single ``PUT /issue/{key}``, without fetching it first.
+
+    ``add_labels`` are added to the issue's labels in the same request.
+    """
+    body = {"fields": fields}
+    if add_labels:
+        body["update"] = {"labels": [{"add": label} for label in add_labels]}
+    jira._session.put(jira._get_url(f"issue/{issue_key}"), data=json.dumps(body))
+
+
+def update_issues(jira, updates, max_workers=8, add_labels=()):
+    """Write ``(issue_key, fields)`` pairs to Jira over the pooled session, several at a time.
+
+    Returns ``(updated_keys, failures)`` with ``(key, error)`` failures.
+    """
+    def put(item):
+        key, fields = item
+        try:
+            update_issue(jira, key, fields, add_labels)
+            return key, None
+        except Exception as e:
+            return key, str(e)
+
+    updated, failures = [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for key, error in pool.map(put, updates):
+            if error:
+                failures.append((key, error))
+            else:
+                updated.append(key)
+    return updated, failures
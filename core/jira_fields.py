@@ -0,0 +1,124 @@
+"""Shared registry of Jira field metadata.
+
+``GET /rest/api/3/field`` returns the whole field schema and rarely changes,
+so it is fetched once per connection and TTL instead of on every rerun.
+Pages resolve fields such as "Story Points" or "Business Value" by name
+here, and custom fields are only ever created once. A project's sub-task
+issue type is kept here too, for the same TTL.
+"""
+import threading
+import time
+
+from core import jira_client
+from core.config import get_setting
+
+FIELD_TTL_SECONDS = get_setting("JIRA_FIELD_TTL_SECONDS", 3600)
+# Company-managed projects call it "Story Points", team-managed ones "Story point estimate".
+STORY_POINTS_NAMES = ("Story Points", "Story point estimate")
+DEFAULT_STORY_POINTS_FIELD = "customfield_10016"
+# Created on first use by the business value agent.
+BUSINESS_VALUE_FIELD_NAME = "Business Value"
+BUSINESS_VALUE_FIELD_DESCRIPTION = "Business Value assessment generated by AI."
+TEXTAREA_FIELD_TYPE = "com.atlassian.jira.plugin.system.customfieldtypes:textarea"
+
+
+class FieldRegistry:
+    """Field schema of one Jira instance, reloaded at most once per TTL."""
+
+    def __init__(self, session, jira_host, ttl=FIELD_TTL_SECONDS):
+        self.session = session
+        self.host = jira_host.rstrip("/")
+        self.url = f"{self.host}/rest/api/3/field"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._fields = None
+        self._loaded_at = 0.0
+        self._create_attempted = set()
+        self._subtask_types = {}
+
+    def fields(self):
+        """All fields as returned by Jira, from cache when fresh."""
+        with self._lock:
+            if self._fields is None or time.time() - self._loaded_at > self.ttl:
+                response = self.session.get(self.url)
+                response.raise_for_status()
+                self._fields = response.json()
+                self._loaded_at = time.time()
+            return self._fields
+
+    def invalidate(self):
+        with self._lock:
+            self._fields = None
+
+    def field_id(self, *names):
+        """Id of the first field whose name matches one of ``names``, or None."""
+        by_name = {f["name"]: f["id"] for f in self.fields()}
+        for name in names:
+            if name in by_name:
+                return by_name[name]
+        return None
+
+    def story_points_field(self):
+        return self.field_id(*STORY_POINTS_NAMES) or DEFAULT_STORY_POINTS_FIELD
+
+    def subtask_issue_type(self, project_key):
+        """Name of the sub-task issue type of ``project_key``, from cache when fresh."""
+        with self._lock:
+            cached = self._subtask_types.get(project_key)
+            if cached is None or time.time() - cached[1] > self.ttl:
+                response = self.session.get(f"{self.host}/rest/api/2/project/{project_key}")
+                response.raise_for_status()
+                names = [t["name"] for t in response.json().get("issueTypes", []) if t.get("subtask")]
+                if not names:
+                    raise ValueError(f"Sub-task issue type not found in project {project_key}")
+                cached = (names[0], time.time())
+                self._subtask_types[project_key] = cached
+            return cached[0]
+
+    def ensure_field(self, name, description, field_type=TEXTAREA_FIELD_TYPE, searcher_key="textsearcher"):
+        """Return ``(field_id, created)``, creating the custom field if it does not exist yet.
+
+        Creation is attempted at most once per registry, so a missing
+        permission does not turn into a POST on every rerun.
+        """
+        field_id = self.field_id(name)
+        if field_id or name in self._create_attempted:
+            return field_id, False
+        self._create_attempted.add(name)
+        payload = {
+            "name": name,
+            "description": description,
+            "type": field_type,
+            "searcherKey": searcher_key,
+        }
+        response = self.session.post(self.url, json=payload)
+        if response.status_code == 201:
+            self.invalidate()
+            return response.json().get("id"), True
+        # Someone else may have created it in the meantime.
+        self.invalidate()
+        return self.field_id(name), False
+
+
+_lock = threading.Lock()
+_registries = {}
+
+
+def get_field_registry(jira_host, jira_email, jira_api_token):
+    """Return the shared field registry for this connection."""
+    key = jira_client.connection_key(jira_host, jira_email, jira_api_token)
+    with _lock:
+        registry = _registries.get(key)
+        if registry is None:
+            session = jira_client.get_http_session(jira_host, jira_email, jira_api_token)
+            registry = FieldRegistry(session, key[0])
+            _registries[key] = registry
+        return registry
+
+
+def _forget(conn_key):
+    with _lock:
+        _registries.pop(conn_key, None)
+
+
+jira_client.on_close(_forget)
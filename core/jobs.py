@@ -0,0 +1,202 @@
+"""Background jobs for long AI and Jira actions.
+
+A page submits a slow action (an LLM call, sub-task creation) to a shared
+thread pool instead of running it inline, so the script run finishes
+at once and widget interactions no longer throw the call away. Jobs live in
+the process, while each browser session only keeps their ids in
+``st.session_state["jobs"]`` under a name such as ``"refine:PROJ-12"``, so
+they survive reruns and page switches. ``show_running`` polls a running job
+from a fragment, showing any partial output, and reruns the page when it
+finishes; the page then picks the result up with ``finished_job``.
+
+Job functions run outside the Streamlit script thread and must not call
+``st.*``. Streaming actions submit ``collect`` with their chunk generator so
+the partial text is shown while it arrives, and batch actions call
+``report_progress`` as items finish so a progress bar is shown instead.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from core.config import get_setting
+
+JOB_WORKERS = get_setting("JOB_WORKERS", 4)
+JOB_POLL_SECONDS = get_setting("JOB_POLL_SECONDS", 1.0)
+# Finished jobs are forgotten after this long even if no session collects them.
+JOB_RETENTION_SECONDS = get_setting("JOB_RETENTION_SECONDS", 3600)
+
+
+@dataclass
+class Job:
+    id: str
+    name: str
+    label: str
+    status: str = "queued"
+    result: object = None
+    error: str = ""
+    partial: str = ""
+    progress: tuple = None
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: float = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.submitted_at
+
+
+_current = threading.local()
+# A stream yields this to drop the text it has yielded so far.
+RESTART = object()
+
+
+def collect(chunks):
+    """Join streamed text chunks, exposing them as the running job's ``partial`` output."""
+    job = getattr(_current, "job", None)
+    text = ""
+    for chunk in chunks:
+        text = "" if chunk is RESTART else text + chunk
+        if job is not None:
+            job.partial = text
+    return text
+
+
+def report_progress(done, total, text=""):
+    """Expose ``done`` of ``total`` items, and an optional caption, as the running job's progress."""
+    job = getattr(_current, "job", None)
+    if job is not None:
+        job.progress = (done, total, text)
+
+
+class JobExecutor:
+    """Thread pool that keeps each submitted job's status and result by id."""
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, name, label, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` in the pool and return the new job."""
+        job = Job(id=uuid.uuid4().hex[:12], name=name, label=label)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        _current.job = job
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.status = "failed"
+        finally:
+            _current.job = None
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self):
+        """Jobs that have not finished yet."""
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
+
+    def forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [i for i, j in self._jobs.items() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+
+_lock = threading.Lock()
+_executor = None
+
+
+def get_job_executor():
+    """Return the process-wide job executor."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = JobExecutor()
+        return _executor
+
+
+# ---- Session helpers ----
+def _session_jobs():
+    import streamlit as st
+    return st.session_state.setdefault("jobs", {})
+
+
+def submit_job(name, label, fn, *args, **kwargs):
+    """Submit a job for this session under ``name``, replacing any earlier one of that name."""
+    job = get_job_executor().submit(name, label, fn, *args, **kwargs)
+    _session_jobs()[name] = job.id
+    return job
+
+
+def session_job(name):
+    """This session's job called ``name``, or None."""
+    job_id = _session_jobs().get(name)
+    job = get_job_executor().get(job_id) if job_id else None
+    if job_id and job is None:
+        _session_jobs().pop(name, None)
+    return job
+
+
+def finished_job(name):
+    """Return this session's finished ``name`` job once, then forget it; None while running."""
+    job = session_job(name)
+    if job is None or not job.finished:
+        return None
+    _session_jobs().pop(name, None)
+    get_job_executor().forget(job.id)
+    return job
+
+
+def show_running(name, interval=JOB_POLL_SECONDS):
+    """While job ``name`` runs, show its progress and rerun the page once it finishes."""
+    import streamlit as st
+
+    job = session_job(name)
+    if job is None or job.finished:
+        return
+
+    @st.fragment(run_every=interval)
+    def _poll():
+        if job.finished:
+            st.rerun()
+        st.caption(f"⏳ {job.label} ({job.elapsed:.0f}s)")
+        if job.progress:
+            done, total, text = job.progress
+            st.progress(done / total if total else 0.0, text=text or f"{done} of {total}")
+        if job.partial:
+            st.markdown(job.partial)
+
+    _poll()
+
+
+def render_sidebar_jobs():
+    """List this session's background jobs in the sidebar."""
+    import streamlit as st
+
+    jobs = [job for job in (session_job(name) for name in list(_session_jobs())) if job]
+    if not jobs:
+        return
+    with st.sidebar.expander(f"Background jobs ({sum(not j.finished for j in jobs)} running)"):
+        for job in jobs:
+            icon = {"queued": "🕒", "running": "⏳", "done": "✅", "failed": "❌"}[job.status]
+            st.caption(f"{icon} {job.label} · {job.elapsed:.0f}s")
@@ -0,0 +1,177 @@
+"""Chat model access shared by the agent pages.
+
+``run_prompt`` renders a prompt template, answers from the response cache
+when it can and otherwise calls the model and stores the completion.
+``stream_prompt`` yields the completion as it is generated, and
+``run_prompt_batch`` runs many inputs with bounded concurrency, directly or
+through the model cascade of ``core.routing``. Model calls go through the
+shared ``openai`` rate limiter (see ``core.rate_limit``), and identical
+prompts requested by several sessions at once share one call.
+
+LangChain and the OpenAI client take over a second to import, so they are
+imported on the first prompt rather than when a page imports this module.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core import telemetry
+from core.config import get_setting
+from core.llm_cache import ResponseCache, get_response_cache
+from core.prompt_budget import count_tokens
+from core.rate_limit import get_limiter
+from core.shared_cache import get_shared_cache
+
+DEFAULT_MODEL = "gpt-4o"
+BATCH_CONCURRENCY = get_setting("LLM_BATCH_CONCURRENCY", 4)
+
+
+def get_llm(model=DEFAULT_MODEL, temperature=0, max_tokens=None, json_output=False):
+    from langchain_openai import ChatOpenAI
+
+    llm = ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        api_key=get_setting("OPENAI_API_KEY"),
+        stream_usage=True,
+        # Retries go through the shared limiter, which knows about every other caller.
+        max_retries=0,
+    )
+    if json_output:
+        # JSON mode: the completion is always a single parseable JSON object.
+        return llm.bind(response_format={"type": "json_object"})
+    return llm
+
+
+def render_prompt(template, inputs):
+    """Fill the prompt ``template`` with ``inputs``."""
+    from langchain_core.prompts import PromptTemplate
+
+    return PromptTemplate.from_template(template).format(**inputs)
+
+
+def _prompt_name(template):
+    """Short span name for a prompt: the first sentence of its template."""
+    first_line = next((line for line in template.splitlines() if line.strip()), "prompt")
+    return first_line.split(".")[0].strip()[:60]
+
+
+def _record(template, model, start, prompt, completion, usage=None, cached=False):
+    usage = usage or {}
+    telemetry.record_llm(
+        _prompt_name(template), model, start, time.time() - start,
+        usage.get("input_tokens") or count_tokens(prompt),
+        usage.get("output_tokens") or count_tokens(completion),
+        cached=cached,
+    )
+
+
+def run_prompt(template, inputs, model=DEFAULT_MODEL, temperature=0, max_tokens=None, use_cache=True,
+               json_output=False):
+    """Fill ``template`` with ``inputs`` and return the model's text completion.
+
+    With ``json_output`` the model is constrained to answer with a JSON object.
+    """
+    prompt = render_prompt(template, inputs)
+    cache = get_response_cache()
+    params = {"max_tokens": max_tokens}
+    if json_output:
+        params["json_output"] = True
+    key = ResponseCache.make_key(prompt, model, temperature, **params)
+    start = time.time()
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            _record(template, model, start, prompt, cached, cached=True)
+            return cached
+        # Another session may be asking the model the same thing right now.
+        flights = get_shared_cache("llm")
+        flight, leader = flights.begin(key)
+        if not leader:
+            response = flight.wait()
+            _record(template, model, start, prompt, response, cached=True)
+            return response
+    try:
+        message = get_limiter("openai").call(get_llm(model, temperature, max_tokens, json_output).invoke, prompt)
+    except BaseException as e:
+        if use_cache:
+            flights.finish(key, flight, error=e)
+        raise
+    response = message.content
+    _record(template, model, start, prompt, response, getattr(message, "usage_metadata", None))
+    cache.put(key, response, model=model)
+    if use_cache:
+        flights.finish(key, flight, response)
+    return response
+
+
+def stream_prompt(template, inputs, model=DEFAULT_MODEL, temperature=0, max_tokens=None, use_cache=True):
+    """Like ``run_prompt`` but yields text chunks as the model produces them.
+
+    A cached completion is yielded in one piece; a fresh one is cached once
+    the stream finishes. A caller asking for a prompt that is already being
+    streamed waits for it and gets the whole completion in one piece too.
+    """
+    prompt = render_prompt(template, inputs)
+    cache = get_response_cache()
+    key = ResponseCache.make_key(prompt, model, temperature, max_tokens=max_tokens)
+    start = time.time()
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            _record(template, model, start, prompt, cached, cached=True)
+            yield cached
+            return
+        flights = get_shared_cache("llm")
+        flight, leader = flights.begin(key)
+        if not leader:
+            response = flight.wait()
+            _record(template, model, start, prompt, response, cached=True)
+            yield response
+            return
+    chunks, usage = [], None
+    try:
+        for chunk in get_limiter("openai").stream(get_llm(model, temperature, max_tokens).stream, prompt):
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            if chunk.content:
+                chunks.append(chunk.content)
+                yield chunk.content
+    except GeneratorExit:
+        if use_cache:
+            flights.finish(key, flight, error=RuntimeError("The shared completion stream was abandoned"))
+        raise
+    except BaseException as e:
+        if use_cache:
+            flights.finish(key, flight, error=e)
+        raise
+    response = "".join(chunks)
+    _record(template, model, start, prompt, response, usage)
+    cache.put(key, response, model=model)
+    if use_cache:
+        flights.finish(key, flight, response)
+
+
+def run_prompt_batch(template, inputs_list, max_concurrency=BATCH_CONCURRENCY, run=None, **kwargs):
+    """Run ``template`` over every entry of ``inputs_list``, at most ``max_concurrency`` at a time.
+
+    Yields ``(index, result)`` as each call finishes, where ``result`` is the
+    completion text or the exception that call raised, so one failure never
+    aborts the rest of the batch. ``run`` replaces ``run_prompt`` for each
+    call, e.g. with a routed one (see ``core.routing.run_routed_batch``).
+    If the caller stops iterating early, calls not started yet are dropped
+    rather than waited for.
+    """
+    run = run or run_prompt
+    pool = ThreadPoolExecutor(max_workers=max_concurrency)
+    try:
+        futures = {
+            pool.submit(run, template, inputs, **kwargs): index
+            for index, inputs in enumerate(inputs_list)
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
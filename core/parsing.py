@@ -0,0 +1,138 @@
+"""Parsers for the agents' markdown output, and what is written back from it."""
+import re
+
+REFINED_MARKER = "_Refined by AI agent_"
+# Labels recording what the agents wrote back, so Jira filters and the issue
+# store can select on them without reading descriptions.
+REFINED_LABEL = "ai-refined"
+VALUE_ASSESSED_LABEL = "ai-value-assessed"
+# Stories refined before the label existed only carry the description marker.
+UNREFINED_FILTERS = {"without_label": REFINED_LABEL, "description_excludes": REFINED_MARKER}
+
+
+def is_refined(issue):
+    labels = getattr(issue.fields, "labels", None) or []
+    return REFINED_LABEL in labels or REFINED_MARKER in (issue.fields.description or "")
+
+
+def build_refined_description(refined_summary, refined_criteria):
+    """Description written back to Jira for a refined story."""
+    return (
+        f"**Refined User Story:**  {refined_summary}\n\n"
+        f"**Acceptance Criteria:**  \n"
+        f"- " + "\n- ".join(refined_criteria.splitlines()) +
+        f"\n\n{REFINED_MARKER}"
+    )
+
+
+def parse_refined_output(output):
+    """Split refiner output into the refined summary and the acceptance criteria lines."""
+    lines = output.splitlines()
+    refined_summary_lines = []
+    refined_criteria_lines = []
+    mode = None
+    for line in lines:
+        if "**Refined User Story:**" in line:
+            mode = "summary"
+            continue
+        if "**Acceptance Criteria:**" in line:
+            mode = "criteria"
+            continue
+        if line.strip() == "---":
+            mode = None
+            continue
+        if mode == "summary":
+            refined_summary_lines.append(line.strip())
+        elif mode == "criteria":
+            refined_criteria_lines.append(line.strip())
+    return (
+        " ".join(refined_summary_lines).strip(),
+        "\n".join(refined_criteria_lines).strip()
+    )
+
+
+def parse_estimator_output(output):
+    """Pull the point range, confidence and reasoning out of an estimate."""
+    range_ = ""
+    confidence = ""
+    reasoning = ""
+    range_match = re.search(r"\*\*Estimated Story Point Range:\*\*\s*([^\n]*)", output)
+    conf_match = re.search(r"\*\*Confidence Score:\*\*\s*([^\n]*)", output)
+    reasoning_match = re.search(r"\*\*Reasoning:\*\*\s*([\s\S]*)", output)
+    if range_match:
+        range_ = range_match.group(1).strip()
+    if conf_match:
+        confidence = conf_match.group(1).strip()
+    if reasoning_match:
+        reasoning = reasoning_match.group(1).strip().split('\n---')[0].strip()
+    return range_, confidence, reasoning
+
+
+def save_estimate(store, issue_key, point_range, confidence, reasoning, source="llm"):
+    """Keep an estimate in the local store for reporting; ``source`` is ``llm`` or ``pre-estimate``."""
+    store.save_analysis(issue_key, "estimate", {
+        "range": point_range,
+        "confidence": confidence,
+        "reasoning": reasoning,
+        "source": source,
+    })
+
+
+def parse_granularity_verdict(output):
+    """True for a "Yes" verdict, False for "No", None when the answer is neither."""
+    match = re.match(r"[\s*_#>]*(yes|no)\b", output, re.I)
+    return match.group(1).lower() == "yes" if match else None
+
+
+def save_granularity(store, issue_key, output):
+    """Keep a granularity verdict in the local store for reporting."""
+    store.save_analysis(issue_key, "granularity", {
+        "granular": parse_granularity_verdict(output),
+        "verdict": output,
+    })
+
+
+# Sort weights for the ranked backlog table
+SCORE_RANK = {"high": 3, "medium": 2, "low": 1}
+PRIORITY_RANK = {"must-have": 3, "high": 3, "should-have": 2, "medium": 2, "nice-to-have": 1, "low": 1}
+
+
+def _labelled(label):
+    """Pattern for ``label:`` in an answer, bold, italic or plain, up to its value."""
+    return rf"[*_]*{label}[*_]*:[*_]*[ \t]*[*_]*"
+
+
+def parse_business_value_output(output):
+    """Pull the value score, priority and justification out of an assessment.
+
+    Labels and values may be bold, italic or plain, in any case, e.g.
+    ``**Business Value Score:** **High**`` or ``business value score: high``.
+    """
+    score = ""
+    priority = ""
+    justification = ""
+    score_match = re.search(_labelled("Business Value Score") + r"(High|Medium|Low)(?![a-z-])", output, re.I)
+    priority_match = re.search(
+        _labelled("Priority Suggestion") + r"(Must-have|Should-have|Nice-to-have|High|Medium|Low)(?![a-z-])",
+        output, re.I,
+    )
+    justification_match = re.search(_labelled("Justification") + r"([^\n]*)", output, re.I)
+    if score_match:
+        score = score_match.group(1).capitalize()
+    if priority_match:
+        priority = priority_match.group(1).capitalize()
+    if justification_match:
+        justification = justification_match.group(1).strip()
+    return score, priority, justification
+
+
+def save_business_value(store, issue_key, assessment, written=False):
+    """Keep the parsed assessment in the local store for the ranked backlog view."""
+    score, priority, justification = parse_business_value_output(assessment)
+    store.save_analysis(issue_key, "business_value", {
+        "score": score,
+        "priority": priority,
+        "justification": justification,
+        "assessment": assessment,
+        "written": written,
+    })
@@ -0,0 +1,319 @@
+"""Instant story-point pre-estimates from a project's own history, without an LLM.
+
+A story is estimated from the ``PRE_ESTIMATE_NEIGHBOURS`` most similar
+estimated stories in the story index (summary, description and component,
+see ``core.similarity``). Their points, weighted by squared similarity, give
+the estimate (weighted median) and the range (weighted quartiles). How much
+the neighbours agree and how similar they are gives a raw score, which is
+calibrated into the probability that the true points fall inside the range:
+a leave-one-out run over a sample of estimated stories is fitted with
+isotonic regression. The Effort Estimator only asks the LLM when that
+confidence is below ``PRE_ESTIMATE_CONFIDENCE``.
+
+    python -m core.pre_estimate --project PROJ             # backtest the pre-estimate
+    python -m core.pre_estimate --project PROJ --llm 30    # ...and the LLM on 30 stories
+"""
+import argparse
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from core import telemetry
+from core.config import get_setting
+from core.llm import BATCH_CONCURRENCY
+from core.parsing import parse_estimator_output
+from core.prompt_budget import fit_inputs
+from core.prompts import ESTIMATOR_PROMPT
+from core.similarity import get_story_index, similar_story_examples, story_text
+
+PRE_ESTIMATE_NEIGHBOURS = get_setting("PRE_ESTIMATE_NEIGHBOURS", 10)
+# Calibrated confidence from which the pre-estimate is used instead of the LLM.
+PRE_ESTIMATE_CONFIDENCE = get_setting("PRE_ESTIMATE_CONFIDENCE", 0.7)
+CALIBRATION_SAMPLE = get_setting("PRE_ESTIMATE_CALIBRATION_SAMPLE", 1000)
+# Fewer estimated stories than this give no pre-estimate.
+MIN_HISTORY = 20
+
+
+def _format_points(value):
+    return f"{value:g}"
+
+
+@dataclass
+class PreEstimate:
+    low: float
+    high: float
+    points: float
+    confidence: float
+    neighbours: list  # (issue key, similarity, points), most similar first
+
+    @property
+    def point_range(self):
+        if self.low == self.high:
+            return _format_points(self.low)
+        return f"{_format_points(self.low)}-{_format_points(self.high)}"
+
+    def reasoning(self):
+        examples = ", ".join(
+            f"{key} ({_format_points(points)} pts, {similarity:.2f} similar)"
+            for key, similarity, points in self.neighbours[:5]
+        )
+        return f"Weighted by similarity from the {len(self.neighbours)} most similar estimated stories: {examples}."
+
+
+def _points(payloads, points_field):
+    values = np.full(len(payloads), np.nan)
+    for row, issue in enumerate(payloads):
+        try:
+            values[row] = float(getattr(issue.fields, points_field))
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+def _predict(scores, values):
+    """Row-wise ``(low, median, high, raw score)`` from neighbour similarities and points."""
+    weights = np.where(np.isnan(values), 0.0, np.clip(scores, 0, None) ** 2)
+    values = np.nan_to_num(values)
+    total = weights.sum(axis=1)
+    safe_total = np.where(total == 0, 1.0, total)
+    order = np.argsort(values, axis=1)
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    cumulative = np.cumsum(np.take_along_axis(weights, order, axis=1), axis=1) / safe_total[:, None]
+    rows = np.arange(len(values))
+
+    def quantile(q):
+        column = np.minimum((cumulative < q - 1e-9).sum(axis=1), values.shape[1] - 1)
+        return sorted_values[rows, column]
+
+    low, median, high = quantile(0.25), quantile(0.5), quantile(0.75)
+    inside = (values >= low[:, None]) & (values <= high[:, None])
+    agreement = (weights * inside).sum(axis=1) / safe_total
+    closeness = (weights * np.clip(scores, 0, None)).sum(axis=1) / safe_total
+    raw = np.where(total == 0, 0.0, agreement * closeness)
+    return low, median, high, raw
+
+
+def _isotonic(x, y):
+    """Pool-adjacent-violators fit of non-decreasing ``y`` over ``x``: ``(knots, values)`` for ``np.interp``."""
+    order = np.argsort(x)
+    blocks = []  # [mean x, mean y, count]
+    for xi, yi in zip(x[order], y[order]):
+        blocks.append([float(xi), float(yi), 1])
+        while len(blocks) > 1 and blocks[-2][1] > blocks[-1][1]:
+            x2, y2, n2 = blocks.pop()
+            x1, y1, n1 = blocks[-1]
+            n = n1 + n2
+            blocks[-1] = [(x1 * n1 + x2 * n2) / n, (y1 * n1 + y2 * n2) / n, n]
+    return np.array([b[0] for b in blocks]), np.array([b[1] for b in blocks])
+
+
+class PreEstimator:
+    """kNN story-point estimates over a story index, with calibrated confidence."""
+
+    def __init__(self, story_index, neighbours=PRE_ESTIMATE_NEIGHBOURS, calibration_sample=CALIBRATION_SAMPLE):
+        self.story_index = story_index
+        self.neighbours = neighbours
+        self.calibration_sample = calibration_sample
+        self._calibration = None
+        self._calibrated_on = (None, 0)
+        # (index snapshot, its story points), replaced in one assignment.
+        self._snapshot = (None, None)
+        self._lock = threading.Lock()
+
+    def _history(self):
+        """The story index snapshot and its points array, always taken together.
+
+        Callers use only the returned pair, never ``story_index.index``
+        again, so a refresh published meanwhile cannot mix rows of two
+        versions.
+        """
+        self.story_index.refresh()
+        index = self.story_index.index
+        snapshot = self._snapshot
+        if snapshot[0] is not index:
+            snapshot = (index, _points(index.payloads, self.story_index.points_field))
+            self._snapshot = snapshot
+        return snapshot
+
+    def _leave_one_out(self, index, points, keys):
+        rows, scores = index.neighbours(keys=keys, k=self.neighbours)
+        return _predict(scores, points[rows])
+
+    def _sample(self, index, points, size, seed):
+        estimated = [key for key, value in zip(index.keys, points) if not np.isnan(value)]
+        rng = np.random.default_rng(seed)
+        return list(rng.permutation(estimated)[:size])
+
+    def calibration(self):
+        """``(knots, confidences)`` mapping raw scores to calibrated confidence; refitted as history grows."""
+        with self._lock:
+            index, points = self._history()
+            generation, size = self._calibrated_on
+            if (
+                self._calibration is None
+                or generation != self.story_index.store.generation
+                or abs(len(index) - size) > 0.1 * size
+            ):
+                with telemetry.span("app", "pre_estimate.calibrate", stories=len(index)):
+                    keys = self._sample(index, points, self.calibration_sample, seed=1)
+                    low, _, high, raw = self._leave_one_out(index, points, keys)
+                    actual = points[index.rows(keys)]
+                    self._calibration = _isotonic(raw, ((actual >= low) & (actual <= high)).astype(float))
+                self._calibrated_on = (self.story_index.store.generation, len(index))
+            return self._calibration
+
+    def confidence(self, raw):
+        knots, values = self.calibration()
+        return np.interp(raw, knots, values)
+
+    def estimate(self, issue):
+        """``PreEstimate`` for an issue, or None while there is too little history."""
+        with telemetry.span("app", "pre_estimate"):
+            index, points = self._history()
+            if np.count_nonzero(~np.isnan(points)) < MIN_HISTORY:
+                return None
+            if issue.key in index:
+                rows, scores = index.neighbours(keys=[issue.key], k=self.neighbours)
+            else:
+                rows, scores = index.neighbours(texts=[story_text(issue)], k=self.neighbours)
+            low, median, high, raw = _predict(scores, points[rows])
+            if raw[0] == 0:
+                return None
+            return PreEstimate(
+                low=float(low[0]), high=float(high[0]), points=float(median[0]),
+                confidence=float(self.confidence(raw)[0]),
+                neighbours=[
+                    (index.keys[row], float(score), float(points[row])) for row, score in zip(rows[0], scores[0])
+                ],
+            )
+
+    def backtest(self, sample=500, threshold=PRE_ESTIMATE_CONFIDENCE):
+        """Leave-one-out accuracy on estimated stories kept out of the calibration sample."""
+        index, points = self._history()
+        if np.count_nonzero(~np.isnan(points)) < MIN_HISTORY:
+            return None
+        calibration = set(self._sample(index, points, self.calibration_sample, seed=1))
+        held_out = [key for key in self._sample(index, points, len(index), seed=2) if key not in calibration]
+        keys = (held_out or list(calibration))[:sample]
+        started = time.perf_counter()
+        low, median, high, raw = self._leave_one_out(index, points, keys)
+        confidence = self.confidence(raw)
+        seconds = time.perf_counter() - started
+        actual = points[index.rows(keys)]
+        hit = (actual >= low) & (actual <= high)
+        confident = confidence >= threshold
+        return {
+            "keys": keys,
+            "actual": actual,
+            "stories": len(keys),
+            "range_hit_rate": float(hit.mean()),
+            "mean_abs_error": float(np.abs(median - actual).mean()),
+            "mean_confidence": float(confidence.mean()),
+            "ms_per_story": 1000 * seconds / len(keys),
+            "confident_share": float(confident.mean()),
+            "confident_hit_rate": float(hit[confident].mean()) if confident.any() else None,
+        }
+
+
+def llm_backtest(store, points_field, keys, actual, workers=BATCH_CONCURRENCY):
+    """Accuracy of the LLM estimator on the same stories, each estimated without its own points."""
+    from core.routing import run_routed
+
+    def estimate(key):
+        issue = store.get(key)
+        summary = issue.fields.summary or ""
+        description = getattr(issue.fields, "description", "") or ""
+        component = issue.fields.components[0].name if issue.fields.components else "General"
+        examples = similar_story_examples(store, points_field, summary, description, component, exclude_key=key)
+        inputs, _ = fit_inputs("estimator", {
+            "summary": summary, "description": description, "component": component, "examples": examples,
+        })
+        started = time.perf_counter()
+        try:
+            point_range, _, _ = parse_estimator_output(run_routed("estimator", ESTIMATOR_PROMPT, inputs))
+        except Exception:
+            point_range = ""
+        numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", point_range)]
+        return (min(numbers), max(numbers)) if numbers else (np.nan, np.nan), time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(estimate, keys))
+    low = np.array([r[0][0] for r in results])
+    high = np.array([r[0][1] for r in results])
+    answered = ~np.isnan(low)
+    return {
+        "stories": len(keys),
+        "answered": int(answered.sum()),
+        "range_hit_rate": float(((actual >= low) & (actual <= high))[answered].mean()) if answered.any() else None,
+        # The low end is the page's default estimate.
+        "mean_abs_error": float(np.abs(low - actual)[answered].mean()) if answered.any() else None,
+        "ms_per_story": 1000 * float(np.mean([r[1] for r in results])) if results else None,
+    }
+
+
+_lock = threading.Lock()
+_estimators = {}
+
+
+def get_pre_estimator(store, points_field):
+    """Return the shared pre-estimator for this store and story-points field."""
+    key = (str(store.path), points_field)
+    with _lock:
+        estimator = _estimators.get(key)
+        if estimator is None:
+            estimator = PreEstimator(get_story_index(store, points_field))
+            _estimators[key] = estimator
+        return estimator
+
+
+def main(argv=None):
+    from core.cli import add_connection_arguments, check_connection_arguments
+    from core.issue_store import get_issue_store
+    from core.jira_client import close_connection, get_jira
+    from core.jira_fields import get_field_registry
+
+    parser = argparse.ArgumentParser(description="Backtest the instant pre-estimate against known story points.")
+    add_connection_arguments(parser)
+    parser.add_argument("--sample", type=int, default=500, help="estimated stories to backtest")
+    parser.add_argument("--llm", type=int, default=0, help="also run the LLM estimator on this many of them")
+    parser.add_argument("--threshold", type=float, default=PRE_ESTIMATE_CONFIDENCE,
+                        help="confidence from which the pre-estimate replaces the LLM")
+    args = parser.parse_args(argv)
+    check_connection_arguments(parser, args)
+
+    jira = get_jira(args.host, args.email, args.token)
+    points_field = get_field_registry(args.host, args.email, args.token).story_points_field()
+    store = get_issue_store(args.host, args.email, args.token, args.project)
+    store.track_fields([points_field])
+    store.ensure_loaded(jira)
+    try:
+        report = get_pre_estimator(store, points_field).backtest(args.sample, args.threshold)
+        if report is None:
+            print(f"Fewer than {MIN_HISTORY} estimated stories; nothing to backtest.")
+            return 1
+        rows = [("pre-estimate", report)]
+        if args.llm:
+            count = min(args.llm, report["stories"])
+            rows.append(("llm", llm_backtest(store, points_field, report["keys"][:count], report["actual"][:count])))
+    finally:
+        close_connection(args.host, args.email, args.token)
+
+    print(f"{'estimator':<14} {'stories':>8} {'in range':>9} {'abs error':>10} {'ms/story':>10}")
+    for name, r in rows:
+        def show(value, spec):
+            return format(value, spec) if value is not None else "-"
+        print(f"{name:<14} {r['stories']:>8} {show(r['range_hit_rate'], '>9.1%')} "
+              f"{show(r['mean_abs_error'], '>10.2f')} {show(r['ms_per_story'], '>10.1f')}")
+    share, hit_rate = report["confident_share"], report["confident_hit_rate"]
+    print(f"\nAt confidence >= {args.threshold}: {share:.0%} of stories skip the LLM"
+          + (f", {hit_rate:.1%} of them in range." if hit_rate is not None else "."))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
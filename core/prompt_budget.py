@@ -0,0 +1,156 @@
+"""Token budgets for prompt inputs.
+
+Story descriptions often carry pasted logs, stack traces, images and Jira
+markup that add tokens without helping the model. ``fit_inputs`` strips that
+noise from each prompt variable that is over its budget and then truncates
+whatever is still over, keeping the head and tail of the text, so every call
+stays within a predictable size. Variables within budget are sent as is.
+"""
+import re
+from dataclasses import dataclass, field
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with langchain-openai
+    tiktoken = None
+
+# Per-prompt token budgets for each template variable. Variables that are not
+# listed are passed through untouched.
+PROMPT_BUDGETS = {
+    "refiner": {"user_story": 2500},
+    "task_breakdown": {"user_story": 1000, "acceptance_criteria": 1500},
+    "estimator": {"summary": 200, "description": 1500, "examples": 2500},
+    "business_value": {"user_story": 2500, "context": 1000},
+    "granularity": {"user_story": 2500},
+    "story_analysis": {"user_story": 2500, "context": 1000, "examples": 2500},
+}
+# Budget for each similar story's description in the estimator examples.
+EXAMPLE_DESCRIPTION_TOKENS = 300
+
+LOG_BLOCK_KEEP_LINES = 6
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktoken downloads its tables on first use; offline we estimate instead.
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    """Number of tokens in ``text`` for the gpt-4o family (about 4 characters a token without tiktoken)."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if not encoding:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _shorten_block(lines):
+    if len(lines) <= 2 * LOG_BLOCK_KEEP_LINES:
+        return lines
+    omitted = len(lines) - 2 * LOG_BLOCK_KEEP_LINES
+    return (
+        lines[:LOG_BLOCK_KEEP_LINES]
+        + [f"[... {omitted} lines omitted ...]"]
+        + lines[-LOG_BLOCK_KEEP_LINES:]
+    )
+
+
+_CODE_BLOCK = re.compile(r"\{(code|noformat)[^}]*\}(.*?)\{\1\}", re.S)
+_FENCED_BLOCK = re.compile(r"```[^\n]*\n(.*?)```", re.S)
+_LOG_LINE = re.compile(
+    r"^\s*(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}|\[?(TRACE|DEBUG|INFO|WARN|WARNING|ERROR|FATAL)\]?\s|at [\w$.<>]+\(|File \".*\", line \d+)"
+)
+_NOISE = [
+    (re.compile(r"!\S+?\.(png|jpe?g|gif|svg)(\|[^!]*)?!", re.I), ""),  # embedded images
+    (re.compile(r"\[~accountid:[^\]]+\]"), "@user"),                    # mentions
+    (re.compile(r"\{color(:[^}]*)?\}"), ""),                            # colour tags
+    # HTML tags, but not comparisons ("a < b > c") or generics ("List<Product>").
+    (re.compile(r"</[A-Za-z][\w-]*\s*>|(?<![\w<])<[A-Za-z][\w-]*(\s[^<>\n]*)?/?>"), ""),
+    (re.compile(r"\[([^|\]]+)\|[^\]]+\]"), r"\1"),                      # [text|url] links
+]
+
+
+def compact(text):
+    """Strip markup and shorten code/log blocks and runs of log lines in ``text``."""
+    if not text:
+        return ""
+    text = _CODE_BLOCK.sub(lambda m: "\n".join(_shorten_block(m.group(2).strip().splitlines())), text)
+    text = _FENCED_BLOCK.sub(lambda m: "\n".join(_shorten_block(m.group(1).strip().splitlines())), text)
+    for pattern, replacement in _NOISE:
+        text = pattern.sub(replacement, text)
+
+    lines, log_run, previous = [], [], None
+    for line in text.splitlines():
+        line = line.rstrip()
+        if _LOG_LINE.match(line):
+            log_run.append(line)
+            continue
+        if log_run:
+            lines += _shorten_block(log_run)
+            log_run = []
+        if not line and previous == "":
+            continue  # runs of blank lines
+        lines.append(line)
+        previous = line
+    lines += _shorten_block(log_run)
+    return "\n".join(lines).strip()
+
+
+def truncate(text, max_tokens):
+    """Cut ``text`` to about ``max_tokens``, keeping its beginning and end."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    marker = "\n[... truncated to fit the token budget ...]\n"
+    # Characters per token for this text, used to pick the cut points.
+    ratio = len(text) / max(count_tokens(text), 1)
+    keep = max(int((max_tokens - count_tokens(marker)) * ratio), 0)
+    head = text[: keep * 2 // 3]
+    tail = text[len(text) - keep // 3:] if keep // 3 else ""
+    return head + marker + tail
+
+
+def fit(text, max_tokens):
+    """Compact and truncate ``text`` to ``max_tokens`` if it is over; text within budget is left alone."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    return truncate(compact(text), max_tokens)
+
+
+@dataclass
+class BudgetReport:
+    original_tokens: int = 0
+    final_tokens: int = 0
+    trimmed: list = field(default_factory=list)
+
+    @property
+    def saved_tokens(self):
+        return self.original_tokens - self.final_tokens
+
+
+def fit_inputs(prompt_name, inputs):
+    """Apply ``PROMPT_BUDGETS[prompt_name]`` to ``inputs``.
+
+    Returns the fitted inputs and a ``BudgetReport`` of the tokens saved.
+    """
+    budgets = PROMPT_BUDGETS.get(prompt_name, {})
+    fitted, report = dict(inputs), BudgetReport()
+    for name, max_tokens in budgets.items():
+        value = inputs.get(name)
+        if not isinstance(value, str):
+            continue
+        before = count_tokens(value)
+        fitted[name] = fit(value, max_tokens)
+        after = count_tokens(fitted[name])
+        report.original_tokens += before
+        report.final_tokens += after
+        if after < before:
+            report.trimmed.append(name)
+    return fitted, report
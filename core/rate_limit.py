@@ -0,0 +1,317 @@
+"""Process-wide rate limiting and adaptive concurrency for OpenAI and Jira.
+
+Every call to a backend (``openai``, or ``jira:<host>`` per Jira site) goes
+through that backend's ``Limiter``, whichever page, session, job or batch
+run makes it:
+
+* a token bucket caps the request rate (``JIRA_RATE_PER_SECOND``, and
+  ``OPENAI_RATE_PER_SECOND`` if set; 0 means no cap, as OpenAI's limits
+  depend on the account's tier);
+* a concurrency limit adapts to the backend, AIMD style: it grows by one
+  for every ``limit`` successful calls and halves on a throttled (429) or
+  failed (5xx, timeout) call, at most once a second, between 1 and
+  ``*_MAX_CONCURRENCY``;
+* a throttled call pauses the whole backend for its ``Retry-After``, or an
+  exponential backoff with jitter, and is then retried, up to
+  ``RATE_LIMIT_RETRIES`` times.
+
+Calls that find no free slot wait in the limiter's queue. ``limiter_stats``
+reports queue depth, waits, throttles and the current limits for the
+performance panel and the Prometheus export.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, ConnectTimeout
+from urllib3.exceptions import NewConnectionError
+
+from core.config import get_setting
+
+OPENAI_RATE_PER_SECOND = get_setting("OPENAI_RATE_PER_SECOND", 0.0)
+OPENAI_MAX_CONCURRENCY = get_setting("OPENAI_MAX_CONCURRENCY", 16)
+JIRA_RATE_PER_SECOND = get_setting("JIRA_RATE_PER_SECOND", 20.0)
+JIRA_MAX_CONCURRENCY = get_setting("JIRA_MAX_CONCURRENCY", 16)
+RATE_LIMIT_RETRIES = get_setting("RATE_LIMIT_RETRIES", 5)
+BACKOFF_SECONDS = 1.0
+# A burst of failures from calls already in flight halves the limit only once.
+DECREASE_INTERVAL_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+# Jira answers 503 as well as 429 when it throttles.
+THROTTLE_STATUSES = {429, 503}
+RETRYABLE_STATUSES = {500, 502, 504, 529}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout", "ReadTimeout"}
+# Jira requests that are safe to send twice. A POST (e.g. a bulk create) or
+# PUT (whose "update" operations, such as adding a comment, may apply twice)
+# is only retried when the server throttled it or it never left this process.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "DELETE", "OPTIONS"}
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a ``Retry-After`` header (seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """``("throttled" | "failed", retry_after)`` for a retryable exception, else None."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    headers = getattr(response, "headers", None) or {}
+    if status == 429:
+        return "throttled", parse_retry_after(headers.get("retry-after") or headers.get("Retry-After"))
+    if status in RETRYABLE_STATUSES or (status is None and type(error).__name__ in RETRYABLE_ERRORS):
+        return "failed", None
+    return None
+
+
+def not_sent(error):
+    """Whether a ``requests`` error happened before the request reached the server."""
+    if isinstance(error, ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, RequestsConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class Limiter:
+    """Token bucket plus adaptive concurrency limit for one backend."""
+
+    def __init__(self, name, rate, max_concurrency, retries=RATE_LIMIT_RETRIES):
+        self.name = name
+        self.rate = rate
+        self.burst = max(rate, 1.0)
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.limit = float(max_concurrency)
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased_at = float("-inf")
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._stats = {"calls": 0, "throttled": 0, "failed": 0, "retries": 0,
+                       "waited": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def _refill(self, now):
+        if not self.rate:
+            return
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the backend's concurrent slots, waiting for it and for a rate token."""
+        started = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self._paused_until:
+                        self._cond.wait(self._paused_until - now)
+                    elif self._in_flight >= int(self.limit):
+                        self._cond.wait()
+                    elif self.rate and self._tokens < 1:
+                        self._cond.wait((1 - self._tokens) / self.rate)
+                    else:
+                        break
+            finally:
+                self._waiting -= 1
+            if self.rate:
+                self._tokens -= 1
+            self._in_flight += 1
+            waited = time.monotonic() - started
+            self._stats["calls"] += 1
+            if waited > 0.001:
+                self._stats["waited"] += 1
+                self._stats["wait_seconds"] += waited
+                self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def succeeded(self):
+        with self._cond:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def _back_off(self, outcome, retry_after, attempt):
+        with self._cond:
+            self._stats[outcome] += 1
+            now = time.monotonic()
+            if now - self._decreased_at >= DECREASE_INTERVAL_SECONDS:
+                self.limit = max(1.0, self.limit / 2)
+                self._decreased_at = now
+            if outcome == "throttled" or retry_after:
+                delay = retry_after if retry_after is not None else self.backoff(attempt)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def throttled(self, retry_after=None, attempt=0):
+        """The backend pushed back: halve concurrency and pause it for ``retry_after`` or a backoff."""
+        self._back_off("throttled", retry_after, attempt)
+
+    def failed(self, attempt=0):
+        """A call failed in a way that suggests overload: halve concurrency."""
+        self._back_off("failed", None, attempt)
+
+    def backoff(self, attempt):
+        """Exponential backoff with full jitter for retry ``attempt`` (0-based)."""
+        return random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt))
+
+    def retrying(self, attempt):
+        """Count a retry; False once ``retries`` are used up."""
+        if attempt >= self.retries:
+            return False
+        with self._cond:
+            self._stats["retries"] += 1
+        return True
+
+    def _should_retry(self, error, attempt):
+        """Record a failed call; the seconds to sleep before retrying it, or None to give up."""
+        verdict = classify_error(error)
+        if verdict is None:
+            return None
+        outcome, retry_after = verdict
+        if outcome == "throttled":
+            self.throttled(retry_after, attempt)
+        else:
+            self.failed(attempt)
+        if not self.retrying(attempt):
+            return None
+        # A throttled backend is paused, so the next ``slot`` does the waiting.
+        return self.backoff(attempt) if outcome == "failed" else 0.0
+
+    def call(self, fn, *args, **kwargs):
+        """``fn(*args, **kwargs)`` in a slot, retrying throttled and transient failures."""
+        attempt = 0
+        while True:
+            with self.slot():
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self._should_retry(e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    self.succeeded()
+                    return result
+            time.sleep(delay)
+            attempt += 1
+
+    def stream(self, fn, *args, **kwargs):
+        """Yield from ``fn(*args, **kwargs)`` in a slot, retrying failures before the first item."""
+        attempt = 0
+        while True:
+            started = False
+            with self.slot():
+                try:
+                    for item in fn(*args, **kwargs):
+                        started = True
+                        yield item
+                except Exception as e:
+                    delay = None if started else self._should_retry(e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    self.succeeded()
+                    return
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._stats,
+                "limit": int(self.limit),
+                "in_flight": self._in_flight,
+                "queued": self._waiting,
+                "paused_seconds": max(0.0, self._paused_until - time.monotonic()),
+            }
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """``HTTPAdapter`` that sends through a ``Limiter`` and retries throttled responses.
+
+    Throttled responses (429, 503) and connection failures before sending
+    are retried for any method; other transient failures (5xx, timeouts,
+    dropped connections) only for idempotent methods.
+    """
+
+    def __init__(self, limiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        idempotent = request.method in IDEMPOTENT_METHODS
+        replayable = request.body is None or isinstance(request.body, (bytes, str))
+        attempt = 0
+        while True:
+            with self.limiter.slot():
+                try:
+                    response = super().send(request, **kwargs)
+                except Exception as e:
+                    unsent = not_sent(e)
+                    if not (unsent or classify_error(e)):
+                        raise
+                    self.limiter.failed(attempt)
+                    if not ((idempotent or unsent) and replayable and self.limiter.retrying(attempt)):
+                        raise
+                    response = None
+            if response is None:
+                time.sleep(self.limiter.backoff(attempt))
+                attempt += 1
+                continue
+            if response.status_code in THROTTLE_STATUSES:
+                self.limiter.throttled(parse_retry_after(response.headers.get("Retry-After")), attempt)
+            elif response.status_code in RETRYABLE_STATUSES:
+                self.limiter.failed(attempt)
+            else:
+                self.limiter.succeeded()
+                return response
+            retry = response.status_code in THROTTLE_STATUSES or idempotent
+            if not (retry and replayable and self.limiter.retrying(attempt)):
+                return response
+            response.close()
+            if response.status_code in RETRYABLE_STATUSES:
+                time.sleep(self.limiter.backoff(attempt))
+            attempt += 1
+
+
+_lock = threading.Lock()
+_limiters = {}
+
+
+def get_limiter(name):
+    """Return the process-wide limiter for ``openai`` or ``jira:<host>``."""
+    with _lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            if name == "openai":
+                limiter = Limiter(name, OPENAI_RATE_PER_SECOND, OPENAI_MAX_CONCURRENCY)
+            else:
+                limiter = Limiter(name, JIRA_RATE_PER_SECOND, JIRA_MAX_CONCURRENCY)
+            _limiters[name] = limiter
+        return limiter
+
+
+def limiter_stats():
+    """``{backend: stats}`` for every limiter in use."""
+    with _lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in sorted(limiters.items())}
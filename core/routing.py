@@ -0,0 +1,156 @@
+"""Model routing: answer with a small model first, escalate when the answer is weak.
+
+Each agent runs through a cascade of models: ``LLM_CASCADE`` (gpt-4o-mini,
+then gpt-4o, by default) or ``LLM_CASCADE_<AGENT>`` for a single agent, as a
+comma-separated list. A model's answer is kept when the agent's check
+accepts it, i.e. it parses and, where the agent reports one, its confidence
+reaches ``ESCALATION_CONFIDENCE``. Otherwise, or when the call fails, the
+next model is asked. The last model's answer is always kept. Setting the
+cascade to a single model turns routing off.
+
+Every routed call is recorded as a ``route`` span naming the model that
+answered, and ``escalation_stats`` reports escalation rates per agent.
+"""
+import re
+from functools import partial
+
+from core import telemetry
+from core.config import get_setting
+from core.jobs import RESTART
+from core.llm import BATCH_CONCURRENCY, run_prompt, run_prompt_batch, stream_prompt
+from core.parsing import (
+    parse_business_value_output, parse_estimator_output, parse_granularity_verdict, parse_refined_output,
+)
+
+CASCADE = get_setting("LLM_CASCADE", "gpt-4o-mini,gpt-4o")
+ESCALATION_CONFIDENCE = get_setting("ESCALATION_CONFIDENCE", 0.6)
+
+
+def cascade(agent):
+    """Models to try for ``agent``, cheapest first."""
+    value = get_setting(f"LLM_CASCADE_{agent.upper()}", "") or CASCADE
+    return [model.strip() for model in value.split(",") if model.strip()]
+
+
+def confidence_reason(confidence):
+    """Why a 0–1 confidence calls for escalation, or None if it is high enough."""
+    try:
+        value = float(re.search(r"\d*\.?\d+", str(confidence)).group())
+    except AttributeError:
+        return "no confidence"
+    return "low confidence" if value < ESCALATION_CONFIDENCE else None
+
+
+# ---- Checks: the reason to escalate an output, or None to accept it ----
+def _check_refiner(output):
+    summary, criteria = parse_refined_output(output)
+    return None if summary and criteria else "malformed output"
+
+
+def _check_task_breakdown(output):
+    return None if re.search(r"^\s*(?:[-*•]|\d+[.)])\s+\S", output, re.M) else "no tasks"
+
+
+def _check_estimator(output):
+    point_range, confidence, _ = parse_estimator_output(output)
+    if not point_range:
+        return "malformed output"
+    return confidence_reason(confidence)
+
+
+def _check_business_value(output):
+    score, priority, _ = parse_business_value_output(output)
+    return None if score and priority else "malformed output"
+
+
+def _check_granularity(output):
+    return None if parse_granularity_verdict(output) is not None else "ambiguous verdict"
+
+
+CHECKS = {
+    "refiner": _check_refiner,
+    "task_breakdown": _check_task_breakdown,
+    "estimator": _check_estimator,
+    "business_value": _check_business_value,
+    "granularity": _check_granularity,
+}
+
+
+def _accept_all(output):
+    return None
+
+
+def run_routed(agent, template, inputs, check=None, models=None, **kwargs):
+    """``run_prompt`` through the agent's cascade; returns the accepted completion.
+
+    ``check`` overrides the agent's entry in ``CHECKS`` and ``models`` its
+    cascade. Other keyword arguments go to ``run_prompt``.
+    """
+    check = check or CHECKS.get(agent, _accept_all)
+    models = models or cascade(agent)
+    reasons = []
+    with telemetry.span("route", agent) as attrs:
+        for n, model in enumerate(models):
+            last = n == len(models) - 1
+            try:
+                output = run_prompt(template, inputs, model=model, **kwargs)
+            except Exception as e:
+                if last:
+                    raise
+                reasons.append(f"{model}: {type(e).__name__}")
+                continue
+            reason = None if last else check(output)
+            if reason is None:
+                break
+            reasons.append(f"{model}: {reason}")
+        attrs.update(model=model, escalated=bool(reasons), reasons="; ".join(reasons))
+    return output
+
+
+def stream_routed(agent, template, inputs, check=None, models=None, **kwargs):
+    """``stream_prompt`` through the agent's cascade.
+
+    Yields ``RESTART`` before streaming the next model's answer, so consumers
+    such as ``jobs.collect`` drop the rejected text.
+    """
+    check = check or CHECKS.get(agent, _accept_all)
+    models = models or cascade(agent)
+    reasons = []
+    with telemetry.span("route", agent) as attrs:
+        for n, model in enumerate(models):
+            last = n == len(models) - 1
+            if n:
+                yield RESTART
+            chunks = []
+            try:
+                for chunk in stream_prompt(template, inputs, model=model, **kwargs):
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                if last:
+                    raise
+                reasons.append(f"{model}: {type(e).__name__}")
+                continue
+            reason = None if last else check("".join(chunks))
+            if reason is None:
+                break
+            reasons.append(f"{model}: {reason}")
+        attrs.update(model=model, escalated=bool(reasons), reasons="; ".join(reasons))
+
+
+def run_routed_batch(agent, template, inputs_list, max_concurrency=BATCH_CONCURRENCY, **kwargs):
+    """``run_prompt_batch`` through the agent's cascade: yields ``(index, completion or exception)``."""
+    return run_prompt_batch(template, inputs_list, max_concurrency, run=partial(run_routed, agent), **kwargs)
+
+
+def escalation_stats(since=None):
+    """``{agent: {"calls", "escalations", "rate", "seconds"}}`` over the recorded route spans."""
+    stats = {}
+    for s in telemetry.spans(since=since, kind="route"):
+        entry = stats.setdefault(s.name, {"calls": 0, "escalations": 0, "seconds": 0.0})
+        entry["calls"] += 1
+        entry["escalations"] += bool(s.attrs.get("escalated"))
+        entry["seconds"] += s.seconds
+    for entry in stats.values():
+        entry["rate"] = entry["escalations"] / entry["calls"]
+    return stats
@@ -0,0 +1,154 @@
+"""Process-wide caches with single-flight loading, shared by every session.
+
+Streamlit serves every user from one process, so identical work requested
+by several sessions at once should be done once. A ``SharedCache`` keeps
+results for ``ttl`` seconds in a bounded LRU (``SHARED_CACHE_MAX_ENTRIES``
+entries, ``SHARED_CACHE_MAX_BYTES`` of sized values). A key that is being
+loaded is never loaded twice: concurrent callers wait for the first one and
+share its result or exception. With ``ttl=0`` a cache only coalesces
+in-flight loads.
+
+Keys must carry whatever scopes the result, such as a digest of the Jira
+credentials it was fetched with, so sessions only share what they could
+have fetched themselves.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from core.config import get_setting
+
+SHARED_CACHE_MAX_ENTRIES = get_setting("SHARED_CACHE_MAX_ENTRIES", 1024)
+SHARED_CACHE_MAX_BYTES = get_setting("SHARED_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+
+class Flight:
+    """A load in progress that other callers can wait for."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SharedCache:
+    """Bounded LRU cache with TTL eviction and single-flight loads."""
+
+    def __init__(self, name, ttl, max_entries=SHARED_CACHE_MAX_ENTRIES, max_bytes=SHARED_CACHE_MAX_BYTES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires, size, value)
+        self._flights = {}
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def lookup(self, key):
+        """``(True, value)`` for a fresh entry, else ``(False, None)``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return True, entry[2]
+                self._drop(key)
+            return False, None
+
+    def begin(self, key):
+        """Claim the load of ``key``: returns a new ``Flight``, or the one already running."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._stats["coalesced"] += 1
+                return flight, False
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                # Loaded by another caller since ``lookup``.
+                flight = Flight()
+                flight.value = entry[2]
+                flight._done.set()
+                self._stats["hits"] += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self._stats["misses"] += 1
+            return flight, True
+
+    def finish(self, key, flight, value=None, error=None, store=True, size=0):
+        """Publish the result of a load claimed with ``begin`` and keep it for ``ttl`` if ``store``."""
+        with self._lock:
+            self._flights.pop(key, None)
+            if error is None and store and self.ttl > 0 and size <= self.max_bytes:
+                if key in self._entries:
+                    self._drop(key)
+                self._entries[key] = (time.monotonic() + self.ttl, size, value)
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+                    self._stats["evictions"] += 1
+        flight.value, flight.error = value, error
+        flight._done.set()
+
+    def get_or_load(self, key, load, cacheable=None, size=None):
+        """The cached value of ``key``, else ``load()``'s result, shared with concurrent callers.
+
+        ``cacheable(value)`` decides whether a result is kept, and
+        ``size(value)`` its size in bytes for the memory bound.
+        """
+        found, value = self.lookup(key)
+        if found:
+            return value
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait()
+        try:
+            value = load()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, value, store=cacheable is None or cacheable(value),
+                    size=size(value) if size else 0)
+        return value
+
+    def invalidate(self, match=None):
+        """Drop every entry, or those whose key satisfies ``match(key)``."""
+        with self._lock:
+            for key in [k for k in self._entries if match is None or match(k)]:
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes,
+                    "in_flight": len(self._flights)}
+
+
+_lock = threading.Lock()
+_caches = {}
+
+
+def get_shared_cache(name, ttl=0, **limits):
+    """Return the process-wide cache called ``name``, creating it with ``ttl`` and ``limits``."""
+    with _lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = SharedCache(name, ttl, **limits)
+        return cache
+
+
+def shared_cache_stats():
+    """``{name: stats}`` for every shared cache in use."""
+    with _lock:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in sorted(caches.items())}
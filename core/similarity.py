@@ -0,0 +1,277 @@
+"""Nearest-neighbour lookup of estimated stories for the Effort Estimator.
+
+Stories are embedded into fixed-size vectors and ranked by cosine
+similarity with NumPy. The default ``HashingEmbedder`` needs no network or
+model download: it hashes word unigrams and bigrams into buckets and the
+index weights them by inverse document frequency at query time, which gives
+TF-IDF ranking without a fitted vocabulary. Any object with an
+``embed(texts) -> np.ndarray`` method can be plugged in instead.
+"""
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from core import telemetry
+from core.config import get_setting
+from core.prompt_budget import EXAMPLE_DESCRIPTION_TOKENS, fit
+
+EMBEDDER = get_setting("SIMILARITY_EMBEDDER", "hashing")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its of on or so that the "
+    "this to was we will with user want can should".split()
+)
+
+
+def tokenize(text):
+    words = [w for w in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(w) > 1 and w not in STOP_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class HashingEmbedder:
+    """Sublinear term counts of hashed unigrams and bigrams."""
+
+    # Tells the index to apply IDF weights over its own documents.
+    idf_weighting = True
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = [zlib.crc32(token.encode("utf-8")) % self.dim for token in tokenize(text)]
+            if buckets:
+                vectors[row] = np.log1p(np.bincount(buckets, minlength=self.dim))
+        return vectors
+
+
+class OpenAIEmbedder:
+    """Dense embeddings from the OpenAI embeddings API."""
+
+    idf_weighting = False
+
+    def __init__(self, model="text-embedding-3-small"):
+        from langchain_openai import OpenAIEmbeddings
+        self._embeddings = OpenAIEmbeddings(model=model, api_key=get_setting("OPENAI_API_KEY"))
+
+    def embed(self, texts):
+        return np.asarray(self._embeddings.embed_documents(list(texts)), dtype=np.float32)
+
+
+def get_embedder(name=EMBEDDER):
+    if name == "openai":
+        return OpenAIEmbedder()
+    return HashingEmbedder()
+
+
+class SimilarityIndex:
+    """In-memory cosine top-k index that supports incremental upserts and removals."""
+
+    def __init__(self, embedder=None):
+        self.embedder = embedder or HashingEmbedder()
+        self._keys = []
+        self._rows = {}
+        self._payloads = []
+        self._vectors = None
+        # Unit-length (and IDF-weighted) copy of the vectors, rebuilt lazily after changes.
+        self._prepared = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def copy(self):
+        """Independent copy that can be changed without affecting readers of this one."""
+        other = SimilarityIndex(self.embedder)
+        other._keys = list(self._keys)
+        other._rows = dict(self._rows)
+        other._payloads = list(self._payloads)
+        other._vectors = None if self._vectors is None else self._vectors.copy()
+        other._prepared = self._prepared
+        return other
+
+    def upsert(self, items):
+        """Add or replace ``(key, text, payload)`` items."""
+        items = list(items)
+        if not items:
+            return
+        vectors = self.embedder.embed([text for _, text, _ in items])
+        if self._vectors is None:
+            self._vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        new_rows = []
+        for (key, _, payload), vector in zip(items, vectors):
+            row = self._rows.get(key)
+            if row is None:
+                new_rows.append(vector)
+                self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                self._payloads.append(payload)
+            else:
+                self._vectors[row] = vector
+                self._payloads[row] = payload
+        if new_rows:
+            self._vectors = np.vstack([self._vectors, np.asarray(new_rows)])
+        self._prepared = None
+
+    def remove(self, keys):
+        drop = [self._rows[key] for key in keys if key in self._rows]
+        if not drop:
+            return
+        keep = np.setdiff1d(np.arange(len(self._keys)), drop)
+        self._vectors = self._vectors[keep]
+        self._keys = [self._keys[i] for i in keep]
+        self._payloads = [self._payloads[i] for i in keep]
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self._prepared = None
+
+    def _prepare(self):
+        if self._prepared is None:
+            matrix = self._vectors
+            idf = None
+            if getattr(self.embedder, "idf_weighting", False):
+                doc_freq = np.count_nonzero(matrix, axis=0)
+                idf = (np.log((1 + len(self._keys)) / (1 + doc_freq)) + 1).astype(np.float32)
+                matrix = matrix * idf
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._prepared = (matrix / np.where(norms == 0, 1.0, norms), idf)
+        return self._prepared
+
+    def query(self, text, k=5, exclude=()):
+        """Return up to ``k`` ``(key, score, payload)`` tuples, most similar first."""
+        if not self._keys:
+            return []
+        matrix, idf = self._prepare()
+        query = self.embedder.embed([text])[0]
+        if idf is not None:
+            query = query * idf
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        for key in exclude:
+            if key in self._rows:
+                scores[self._rows[key]] = -np.inf
+        top = np.argsort(-scores)[:k]
+        return [
+            (self._keys[i], float(scores[i]), self._payloads[i])
+            for i in top if np.isfinite(scores[i])
+        ]
+
+    @property
+    def keys(self):
+        return self._keys
+
+    @property
+    def payloads(self):
+        return self._payloads
+
+    def rows(self, keys):
+        return np.array([self._rows[key] for key in keys], dtype=np.int64)
+
+    def neighbours(self, texts=None, keys=None, k=5):
+        """``(rows, scores)`` arrays of the ``k`` most similar rows for each query, most similar first.
+
+        Queries are ``texts``, or indexed ``keys`` whose own row is left out
+        (leave-one-out). Rows index ``keys`` and ``payloads``.
+        """
+        matrix, idf = self._prepare()
+        if keys is not None:
+            own = self.rows(keys)
+            queries = matrix[own]
+        else:
+            queries = self.embedder.embed(list(texts))
+            if idf is not None:
+                queries = queries * idf
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1.0, norms)
+        scores = queries @ matrix.T
+        if keys is not None:
+            scores[np.arange(len(own)), own] = -np.inf
+        k = min(k, len(self._keys) - (keys is not None))
+        if k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(scores, rows, axis=1)
+        order = np.argsort(-top, axis=1)
+        return np.take_along_axis(rows, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+def story_text(issue):
+    """Text embedded for a story: summary, description and components."""
+    components = " ".join(f"component {c.name}" for c in (getattr(issue.fields, "components", None) or []))
+    return f"{issue.fields.summary or ''}\n{getattr(issue.fields, 'description', '') or ''}\n{components}"
+
+
+class StoryIndex:
+    """Similarity index over a store's estimated stories, kept in step with its syncs.
+
+    ``index`` is a snapshot that is never changed once published: a refresh
+    updates a copy and swaps it in with one assignment, so a reader that
+    takes ``index`` once sees consistent keys, vectors and payloads while
+    another session refreshes.
+    """
+
+    def __init__(self, store, points_field, embedder=None):
+        self.store = store
+        self.points_field = points_field
+        self.index = SimilarityIndex(embedder or get_embedder())
+        self._generation = None
+        self._revision = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Fold in issues written since the last refresh; rebuild after a full reload."""
+        with self._lock:
+            index, since = self.index, self._revision
+            generation = self.store.generation
+            if generation != self._generation:
+                index, since = SimilarityIndex(index.embedder), 0
+            revision = self.store.revision
+            if revision == since:
+                if index is not self.index:
+                    self.index, self._revision, self._generation = index, since, generation
+                return
+            index = index.copy() if index is self.index else index
+            if since:
+                unestimated = self.store.issues(changed_after=since, missing_field=self.points_field)
+                index.remove([i.key for i in unestimated])
+            estimated = self.store.issues(changed_after=since, has_field=self.points_field)
+            index.upsert((i.key, story_text(i), i) for i in estimated)
+            self.index = index
+            self._revision, self._generation = revision, generation
+
+    def similar(self, text, k=5, exclude=()):
+        self.refresh()
+        return self.index.query(text, k=k, exclude=exclude)
+
+
+def similar_story_examples(store, points_field, summary, description, component, exclude_key=None, n=5):
+    """Prompt text listing the ``n`` estimated stories most similar to this one."""
+    with telemetry.span("app", "similar_stories"):
+        matches = get_story_index(store, points_field).similar(
+            f"{summary}\n{description}\ncomponent {component}",
+            k=n, exclude=[exclude_key]
+        )
+    examples = []
+    for key, score, issue in matches:
+        example_component = issue.fields.components[0].name if issue.fields.components else "General"
+        example_description = fit(getattr(issue.fields, 'description', '') or '', EXAMPLE_DESCRIPTION_TOKENS)
+        example = f"- Summary: {issue.fields.summary}\n  Description: {example_description or '[No Description]'}\n  Component: {example_component}\n  Story Points: {getattr(issue.fields, points_field, 'N/A')}"
+        examples.append(example)
+    return "\n".join(examples) if examples else "[No similar stories found]"
+
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def get_story_index(store, points_field):
+    """Return the shared story index for this store and story-points field."""
+    key = (str(store.path), points_field)
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = StoryIndex(store, points_field)
+            _indexes[key] = index
+        return index
@@ -0,0 +1,334 @@
+"""Timing spans for Jira requests, LLM calls and other hot paths.
+
+Every Jira HTTP response, model call and wrapped block of app code is
+recorded as a ``Span`` in a bounded, process-wide buffer. LLM spans carry
+prompt and completion tokens and an estimated cost, and ``route`` spans
+record which model of a cascade answered. Spans recorded while a page runs
+carry its Streamlit session id, so the sidebar panel shows what this
+session's previous rerun spent its time on. The spans can be exported as JSON
+lines, and the Prometheus export reports counters kept since the process
+started (the span buffer only holds the latest ones), along with the state
+of the rate limiters and shared caches. With
+``TELEMETRY_EXPORT_PATH`` set, spans are also appended to that JSONL file as
+they are recorded.
+"""
+import json
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from urllib.parse import urlparse
+
+from core.config import get_setting
+from core.rate_limit import limiter_stats
+from core.shared_cache import shared_cache_stats
+
+MAX_SPANS = get_setting("TELEMETRY_MAX_SPANS", 5000)
+EXPORT_PATH = get_setting("TELEMETRY_EXPORT_PATH", "")
+# USD per million (prompt, completion) tokens.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+_ISSUE_KEY = re.compile(r"/[A-Z][A-Z0-9_]+-\d+(?=/|$)")
+_PROJECT = re.compile(r"/project/[^/]+")
+_NUMBER = re.compile(r"(?<!/api)/\d+(?=/|$)")
+
+
+@dataclass
+class Span:
+    kind: str
+    name: str
+    start: float
+    seconds: float
+    attrs: dict = field(default_factory=dict)
+    # Streamlit session that recorded the span; None for jobs, syncs and the CLI.
+    session: str = None
+
+
+def _new_totals():
+    return {"durations": {}, "payload": {}, "tokens": {}, "costs": {}, "routes": {}}
+
+
+def _count(totals, s):
+    """Add span ``s`` to the Prometheus counters in ``totals``."""
+    key = _labels(kind=s.kind, name=s.name)
+    total, count = totals["durations"].get(key, (0.0, 0))
+    totals["durations"][key] = (total + s.seconds, count + 1)
+    if s.kind == "llm":
+        model = s.attrs.get("model")
+        for kind in ("prompt", "completion"):
+            token_key = _labels(model=model, type=kind)
+            totals["tokens"][token_key] = totals["tokens"].get(token_key, 0) + (s.attrs.get(f"{kind}_tokens") or 0)
+        cost_key = _labels(model=model)
+        totals["costs"][cost_key] = totals["costs"].get(cost_key, 0.0) + (s.attrs.get("cost_usd") or 0.0)
+    if s.kind == "jira":
+        totals["payload"][key] = totals["payload"].get(key, 0) + s.attrs.get("bytes", 0)
+    if s.kind == "route":
+        calls, escalations = totals["routes"].get(s.name, (0, 0))
+        totals["routes"][s.name] = (calls + 1, escalations + bool(s.attrs.get("escalated")))
+
+
+def _current_session():
+    """Id of the Streamlit session running this thread's script, or None."""
+    if "streamlit" not in sys.modules:
+        return None
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+_lock = threading.Lock()
+_export_lock = threading.Lock()
+_spans = deque(maxlen=MAX_SPANS)
+# Cumulative counters for the Prometheus export; they outlive evicted spans.
+_totals = _new_totals()
+
+
+def record(span):
+    if span.session is None:
+        span.session = _current_session()
+    with _lock:
+        _spans.append(span)
+        _count(_totals, span)
+    if EXPORT_PATH:
+        with _export_lock, open(EXPORT_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(asdict(span)) + "\n")
+
+
+def spans(since=None, kind=None, session=None):
+    """Recorded spans, oldest first, optionally only those started after ``since``.
+
+    ``session`` keeps only the spans recorded by that Streamlit session.
+    """
+    with _lock:
+        items = list(_spans)
+    return [
+        s for s in items
+        if (since is None or s.start >= since) and (kind is None or s.kind == kind)
+        and (session is None or s.session == session)
+    ]
+
+
+def clear():
+    """Forget the buffered spans; the Prometheus counters keep counting."""
+    with _lock:
+        _spans.clear()
+
+
+@contextmanager
+def span(kind, name, **attrs):
+    """Time the enclosed block; the yielded dict can be filled with more attributes."""
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record(Span(kind, name, start, time.perf_counter() - started, attrs))
+
+
+# ---- Jira ----
+def _route(url):
+    path = urlparse(url).path
+    path = _ISSUE_KEY.sub("/{key}", path)
+    path = _PROJECT.sub("/project/{key}", path)
+    return _NUMBER.sub("/{id}", path)
+
+
+def _record_response(response, *args, **kwargs):
+    seconds = response.elapsed.total_seconds()
+    record(Span(
+        "jira",
+        f"{response.request.method} {_route(response.url)}",
+        time.time() - seconds,
+        seconds,
+        {"status": response.status_code, "bytes": len(response.content or b""),
+         **({"shared": True} if getattr(response, "shared", False) else {})},
+    ))
+    return response
+
+
+def instrument_session(session):
+    """Record a span for every response received through ``session``."""
+    hooks = session.hooks.setdefault("response", [])
+    if _record_response not in hooks:
+        hooks.append(_record_response)
+
+
+# ---- LLM ----
+def llm_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of a call, or None for models without a known price."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def record_llm(name, model, start, seconds, prompt_tokens, completion_tokens, cached=False):
+    record(Span("llm", name, start, seconds, {
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": 0.0 if cached else llm_cost(model, prompt_tokens, completion_tokens),
+        "cached": cached,
+    }))
+
+
+# ---- Export ----
+def to_jsonl(items=None):
+    return "".join(json.dumps(asdict(s)) + "\n" for s in (spans() if items is None else items))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def to_prometheus(items=None):
+    """Prometheus text-format metrics: counters since the process started, or over ``items``."""
+    if items is None:
+        with _lock:
+            totals = {name: dict(values) for name, values in _totals.items()}
+    else:
+        totals = _new_totals()
+        for s in items:
+            _count(totals, s)
+    durations, tokens, costs = totals["durations"], totals["tokens"], totals["costs"]
+    payload, routes = totals["payload"], totals["routes"]
+
+    lines = [
+        "# HELP agile_span_seconds Time spent in instrumented calls.",
+        "# TYPE agile_span_seconds summary",
+    ]
+    for key, (total, count) in sorted(durations.items()):
+        lines += [f"agile_span_seconds_sum{{{key}}} {total:.6f}", f"agile_span_seconds_count{{{key}}} {count}"]
+    lines += ["# HELP agile_jira_response_bytes_total Jira response payload bytes.",
+              "# TYPE agile_jira_response_bytes_total counter"]
+    lines += [f"agile_jira_response_bytes_total{{{key}}} {value}" for key, value in sorted(payload.items())]
+    lines += ["# HELP agile_llm_tokens_total LLM tokens by model and type.",
+              "# TYPE agile_llm_tokens_total counter"]
+    lines += [f"agile_llm_tokens_total{{{key}}} {value}" for key, value in sorted(tokens.items())]
+    lines += ["# HELP agile_llm_cost_usd_total Estimated LLM cost in USD.",
+              "# TYPE agile_llm_cost_usd_total counter"]
+    lines += [f"agile_llm_cost_usd_total{{{key}}} {value:.6f}" for key, value in sorted(costs.items())]
+    lines += ["# HELP agile_route_calls_total Routed agent calls.",
+              "# TYPE agile_route_calls_total counter"]
+    lines += [f"agile_route_calls_total{{{_labels(agent=agent)}}} {calls}"
+              for agent, (calls, _) in sorted(routes.items())]
+    lines += ["# HELP agile_route_escalations_total Routed agent calls escalated to a larger model.",
+              "# TYPE agile_route_escalations_total counter"]
+    lines += [f"agile_route_escalations_total{{{_labels(agent=agent)}}} {escalations}"
+              for agent, (_, escalations) in sorted(routes.items())]
+    limits = limiter_stats()
+    for metric, stat, kind, help_text in [
+        ("agile_limiter_concurrency_limit", "limit", "gauge", "Current adaptive concurrency limit."),
+        ("agile_limiter_in_flight", "in_flight", "gauge", "Calls holding a slot."),
+        ("agile_limiter_queued", "queued", "gauge", "Calls waiting for a slot."),
+        ("agile_limiter_wait_seconds_total", "wait_seconds", "counter", "Time calls spent waiting for a slot."),
+        ("agile_limiter_throttled_total", "throttled", "counter", "Calls the backend throttled."),
+        ("agile_limiter_retries_total", "retries", "counter", "Calls retried after throttling or a failure."),
+    ]:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f"{metric}{{{_labels(backend=name)}}} {s[stat]}" for name, s in limits.items()]
+    caches = shared_cache_stats()
+    for stat, help_text in [
+        ("hits", "Lookups answered from a shared cache."),
+        ("misses", "Loads a shared cache had to run."),
+        ("coalesced", "Calls that shared another session's in-flight load."),
+        ("evictions", "Entries evicted to stay within the memory bounds."),
+    ]:
+        metric = f"agile_shared_cache_{stat}_total"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f"{metric}{{{_labels(cache=name)}}} {s[stat]}" for name, s in caches.items()]
+    lines += ["# HELP agile_shared_cache_bytes Memory held by a shared cache.", "# TYPE agile_shared_cache_bytes gauge"]
+    lines += [f"agile_shared_cache_bytes{{{_labels(cache=name)}}} {s['bytes']}" for name, s in caches.items()]
+    return "\n".join(lines) + "\n"
+
+
+# ---- Sidebar panel ----
+def render_sidebar_panel():
+    """Optional sidebar panel with the spans of this session's previous rerun.
+
+    Only spans recorded by this session's own script runs are shown, not
+    those of other users, background jobs or store refreshes.
+
+    Call it near the top of a page: it shows what happened since the last
+    call in this session and then starts a new window, so runs that end in
+    ``st.stop()`` are still covered.
+    """
+    import streamlit as st
+
+    window_start = st.session_state.get("telemetry_window_start")
+    st.session_state["telemetry_window_start"] = time.time()
+    if not st.sidebar.toggle("⏱️ Performance panel", key="telemetry_panel",
+                             value=get_setting("TELEMETRY_PANEL", False)):
+        return
+    session = _current_session()
+    items = spans(since=window_start, session=session) if window_start and session else []
+    with st.sidebar.expander("Previous rerun", expanded=True):
+        if not items:
+            st.caption("No Jira or LLM calls recorded yet.")
+        else:
+            jira_spans = [s for s in items if s.kind == "jira"]
+            llm_spans = [s for s in items if s.kind == "llm"]
+            route_spans = [s for s in items if s.kind == "route"]
+            cost = sum(s.attrs.get("cost_usd") or 0.0 for s in llm_spans)
+            st.caption(
+                f"Jira: {len(jira_spans)} requests · {sum(s.seconds for s in jira_spans):.2f}s  \n"
+                f"LLM: {len(llm_spans)} calls · {sum(s.seconds for s in llm_spans):.2f}s · "
+                f"{sum(s.attrs.get('prompt_tokens', 0) + s.attrs.get('completion_tokens', 0) for s in llm_spans)} tokens · "
+                f"${cost:.4f}"
+                + (f"  \nEscalated: {sum(bool(s.attrs.get('escalated')) for s in route_spans)} of "
+                   f"{len(route_spans)} routed calls" if route_spans else "")
+            )
+            st.dataframe(
+                [
+                    {"kind": s.kind, "name": s.name, "ms": round(s.seconds * 1000, 1),
+                     **{k: v for k, v in s.attrs.items() if k != "model"}}
+                    for s in sorted(items, key=lambda s: -s.seconds)
+                ],
+                hide_index=True,
+            )
+        from core.routing import escalation_stats
+        routing = escalation_stats()
+        if routing:
+            st.caption("Model escalations per agent (recent calls)")
+            st.dataframe(
+                [{"agent": agent, "calls": s["calls"], "escalated": s["escalations"], "rate": f"{s['rate']:.0%}"}
+                 for agent, s in sorted(routing.items())],
+                hide_index=True,
+            )
+        limits = limiter_stats()
+        if limits:
+            st.caption("Rate limits per backend")
+            st.dataframe(
+                [{"backend": name, "limit": s["limit"], "in flight": s["in_flight"], "queued": s["queued"],
+                  "avg wait ms": round(1000 * s["wait_seconds"] / s["waited"], 1) if s["waited"] else 0.0,
+                  "max wait ms": round(1000 * s["max_wait_seconds"], 1),
+                  "throttled": s["throttled"], "retries": s["retries"]}
+                 for name, s in limits.items()],
+                hide_index=True,
+            )
+        caches = shared_cache_stats()
+        if caches:
+            st.caption("Shared across sessions")
+            st.dataframe(
+                [{"cache": name, "hits": s["hits"], "loads": s["misses"], "coalesced": s["coalesced"],
+                  "entries": s["entries"], "KB": round(s["bytes"] / 1024, 1)}
+                 for name, s in caches.items()],
+                hide_index=True,
+            )
+        st.download_button("Export spans (JSONL)", to_jsonl(), "spans.jsonl", "application/json", key="telemetry_jsonl")
+        st.download_button("Export metrics (Prometheus)", to_prometheus(), "metrics.prom", "text/plain",
+                           key="telemetry_prom")
@@ -0,0 +1,123 @@
+"""Page chrome shared by the agent pages: header, sidebar, Jira connection and Full Analysis button.
+
+Every page starts the same way: page config and title, the LLM cache and
+performance panels in the sidebar, then either the Jira connection form or
+a "connected" banner with a Disconnect button. The core modules imported
+here load Jira, LangChain and OpenAI only when a page connects or runs an
+agent, so a page paints its connection form without waiting for them.
+"""
+import streamlit as st
+
+from core.jira_client import attach_session, detach_session, get_jira
+from core.jobs import render_sidebar_jobs
+from core.llm_cache import get_response_cache
+from core.telemetry import render_sidebar_panel
+
+CONNECTION_KEYS = ("jira_host", "jira_email", "jira_api_token", "jira_project_key", "connected")
+FULL_ANALYSIS_LABEL = "🧠 Full Analysis"
+FULL_ANALYSIS_HELP = "Refine, estimate, assess value and check granularity in one call shared by all agents"
+
+
+def page_header(page_title, title):
+    """Configure the page, show its title and the shared sidebar panels."""
+    st.set_page_config(page_title=page_title, layout="wide")
+    st.title(title)
+    cache_stats = get_response_cache().stats()
+    st.sidebar.caption(
+        f"LLM cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · {cache_stats['entries']} stored"
+    )
+    render_sidebar_panel()
+    render_sidebar_jobs()
+
+
+def _session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+def _session_liveness():
+    """``is_active(session_id)`` for the running server, or None outside one (e.g. under AppTest)."""
+    from streamlit.runtime import Runtime
+
+    return Runtime.instance().is_active_session if Runtime.exists() else None
+
+
+def full_analysis_button(in_form=False, key=None):
+    """The button every agent page offers for the combined story analysis; True when pressed."""
+    if in_form:
+        return st.form_submit_button(FULL_ANALYSIS_LABEL, help=FULL_ANALYSIS_HELP)
+    return st.button(FULL_ANALYSIS_LABEL, key=key, help=FULL_ANALYSIS_HELP)
+
+
+def clear_connection_state(page_keys=()):
+    """Forget this session's Jira connection, with the page's own ``page_keys``.
+
+    The pooled client, its issue stores and field registry are shared with
+    other sessions using the same credentials, so they are only closed when
+    this was the last live session attached to them.
+    """
+    if st.session_state.get("connected", False):
+        detach_session(
+            _session_id(),
+            st.session_state["jira_host"],
+            st.session_state["jira_email"],
+            st.session_state["jira_api_token"],
+            is_active=_session_liveness(),
+        )
+    for k in [*CONNECTION_KEYS, *page_keys]:
+        if k in st.session_state:
+            del st.session_state[k]
+
+
+def connection_form(page_keys=()):
+    """Show the Disconnect button and banner, or the connection form; True once connected.
+
+    ``page_keys`` are the page's session keys to clear on disconnect.
+    """
+    if st.session_state.get("connected", False):
+        colc, cold = st.columns([10, 1])
+        with cold:
+            if st.button("Disconnect"):
+                clear_connection_state(page_keys)
+                st.rerun()
+
+    if not st.session_state.get("connected", False):
+        st.subheader("Connect to Jira")
+        with st.form("connection_form"):
+            jira_host = st.text_input("Jira Host URL (e.g. https://yourdomain.atlassian.net)", value=st.session_state.get("jira_host", ""))
+            jira_email = st.text_input("Jira Email", value=st.session_state.get("jira_email", ""))
+            jira_api_token = st.text_input("Jira API Token", type="password", value=st.session_state.get("jira_api_token", ""))
+            jira_project_key = st.text_input("Jira Project Key", value=st.session_state.get("jira_project_key", ""))
+            submitted = st.form_submit_button("Connect")
+
+        if submitted:
+            if not (jira_host and jira_email and jira_api_token and jira_project_key):
+                st.warning("Please fill in all fields to connect.")
+            else:
+                st.session_state["jira_host"] = jira_host.strip()
+                st.session_state["jira_email"] = jira_email.strip()
+                st.session_state["jira_api_token"] = jira_api_token.strip()
+                st.session_state["jira_project_key"] = jira_project_key.strip()
+                try:
+                    get_jira(jira_host, jira_email, jira_api_token)
+                    st.session_state["connected"] = True
+                    st.success(f"Connected as {jira_email} to JIRA: {jira_project_key}")
+                except Exception as e:
+                    st.session_state["connected"] = False
+                    st.error(f"Failed to connect to Jira: {e}")
+    else:
+        st.success(
+            f"Connected as {st.session_state['jira_email']} to JIRA: {st.session_state['jira_project_key']}",
+            icon="🔗"
+        )
+    if st.session_state.get("connected", False):
+        attach_session(
+            _session_id(),
+            st.session_state["jira_host"],
+            st.session_state["jira_email"],
+            st.session_state["jira_api_token"],
+            is_active=_session_liveness(),
+        )
+    return st.session_state.get("connected", False)
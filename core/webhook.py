@@ -0,0 +1,249 @@
+"""Jira webhook receiver that keeps story analyses current.
+
+Register a Jira webhook for "Issue created" and "Issue updated" (JQL
+``project = PROJ``) pointing at ``http://<this host>:8765/webhook`` and run
+
+    python -m core.webhook --project PROJ --port 8765
+
+An event only queues its issue. Edits are debounced: an issue is handled
+``WEBHOOK_DEBOUNCE_SECONDS`` after its last event, so a burst of edits costs
+one analysis. Due issues are pulled in with one delta sync of the issue
+store and re-analysed with ``get_story_analysis``, the combined refine,
+estimate, value and granularity result the pages reuse while it is fresh.
+Updates that leave the story text alone (status, story points, Business
+Value, ...) keep a fresh analysis instead of paying for a new one, which also
+stops the toolkit's own write-backs from causing work.
+
+With ``WEBHOOK_SECRET`` set, requests must pass it as ``?secret=`` or sign
+the body with it in an ``X-Hub-Signature: sha256=...`` header. The receiver
+listens on ``127.0.0.1`` by default; since every accepted event can cost an
+LLM analysis and a Jira write, it refuses to listen on any other address
+(``--bind 0.0.0.0``, or ``WEBHOOK_BIND``) without a secret.
+"""
+import argparse
+import hashlib
+import hmac
+import ipaddress
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from core import telemetry
+from core.analysis import ANALYSIS_KIND, get_story_analysis
+from core.cli import add_connection_arguments, check_connection_arguments
+from core.config import get_setting
+from core.issue_store import get_issue_store
+from core.jira_client import close_connection, get_jira
+from core.jira_fields import get_field_registry
+from core.llm import BATCH_CONCURRENCY
+
+DEBOUNCE_SECONDS = get_setting("WEBHOOK_DEBOUNCE_SECONDS", 30.0)
+WEBHOOK_SECRET = get_setting("WEBHOOK_SECRET", "")
+WEBHOOK_PORT = get_setting("WEBHOOK_PORT", 8765)
+WEBHOOK_BIND = get_setting("WEBHOOK_BIND", "127.0.0.1")
+# Changelog fields the combined analysis reads; other updates leave it valid.
+ANALYZED_FIELDS = {"summary", "description", "components", "component"}
+
+
+def parse_event(payload, project_key):
+    """Return ``(issue_key, text_changed)`` for an event about the project, else None."""
+    key = (payload.get("issue") or {}).get("key") or ""
+    if not key.upper().startswith(f"{project_key.upper()}-"):
+        return None
+    event = payload.get("webhookEvent")
+    if event == "jira:issue_created":
+        return key, True
+    if event == "jira:issue_updated":
+        items = (payload.get("changelog") or {}).get("items") or []
+        return key, any((item.get("fieldId") or item.get("field") or "").lower() in ANALYZED_FIELDS for item in items)
+    return None
+
+
+class ReanalysisQueue:
+    """Debounced queue of issues whose analysis should be refreshed."""
+
+    def __init__(self, jira, store, points_field, debounce=DEBOUNCE_SECONDS, workers=BATCH_CONCURRENCY, log=print):
+        self.jira = jira
+        self.store = store
+        self.points_field = points_field
+        self.debounce = debounce
+        self.workers = workers
+        self.log = log
+        self._cond = threading.Condition()
+        self._due = {}  # issue key -> (monotonic deadline, analysis can be carried forward)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="webhook-reanalysis", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def add(self, issue_key, text_changed=True):
+        """Queue an issue, pushing back its deadline if it is already waiting.
+
+        Whether a fresh analysis survives the update is decided now, before
+        any sync has stored the new version of the issue.
+        """
+        carry = not text_changed and self.store.analysis(issue_key, ANALYSIS_KIND) is not None
+        with self._cond:
+            _, carried = self._due.get(issue_key, (None, True))
+            self._due[issue_key] = (time.monotonic() + self.debounce, carried and carry)
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._due)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    now = time.monotonic()
+                    ready = {key: carry for key, (deadline, carry) in self._due.items() if deadline <= now}
+                    if ready:
+                        break
+                    self._cond.wait(min(d for d, _ in self._due.values()) - now if self._due else None)
+                for key in ready:
+                    del self._due[key]
+            try:
+                self.process(ready)
+            except Exception as e:
+                self.log(f"Re-analysis of {len(ready)} issues failed, requeued: {e}")
+                with self._cond:
+                    for key, carry in ready.items():
+                        self._due.setdefault(key, (time.monotonic() + self.debounce, carry))
+
+    def process(self, changes):
+        """Sync the store and refresh the analyses of ``{issue_key: carry}``."""
+        with telemetry.span("app", "webhook.reanalyze", issues=len(changes)) as span:
+            carry = [key for key, can_carry in changes.items() if can_carry]
+            self.store.sync(self.jira)
+            for key in carry:
+                self.store.carry_analysis(key, ANALYSIS_KIND)
+            issues = [issue for issue in map(self.store.get, changes) if issue is not None]
+            stale = [issue for issue in issues if self.store.analysis(issue.key, ANALYSIS_KIND) is None]
+            span.update(carried=len(carry), analysed=len(stale))
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for key, error in pool.map(self._analyse, stale):
+                    self.log(f"{key}: {error or 're-analysed'}")
+
+    def _analyse(self, issue):
+        try:
+            get_story_analysis(self.store, issue, self.points_field)
+            return issue.key, None
+        except Exception as e:
+            return issue.key, f"analysis failed: {e}"
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """``POST /webhook`` queues the event's issue; ``GET /health`` reports the queue length."""
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/webhook":
+            return self._reply(404, {"error": "not found"})
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self._authorized(parse_qs(url.query).get("secret", [""])[0], body):
+            return self._reply(401, {"error": "bad secret"})
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            return self._reply(400, {"error": "invalid JSON"})
+        event = parse_event(payload, self.server.project_key)
+        if event:
+            self.server.queue.add(*event)
+        self._reply(202, {"queued": event[0] if event else None})
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            return self._reply(404, {"error": "not found"})
+        self._reply(200, {"pending": self.server.queue.pending()})
+
+    def _authorized(self, secret, body):
+        if not self.server.secret:
+            return True
+        signature = self.headers.get("X-Hub-Signature", "")
+        if signature:
+            expected = "sha256=" + hmac.new(self.server.secret.encode(), body, hashlib.sha256).hexdigest()
+            return hmac.compare_digest(signature, expected)
+        return hmac.compare_digest(secret, self.server.secret)
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def is_loopback(bind):
+    """True if ``bind`` only accepts connections from this machine."""
+    if bind == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(bind).is_loopback
+    except ValueError:
+        return False
+
+
+def make_server(queue, project_key, port=WEBHOOK_PORT, bind=WEBHOOK_BIND, secret=WEBHOOK_SECRET):
+    if not secret and not is_loopback(bind):
+        raise ValueError(f"refusing to listen on {bind or 'all interfaces'} without WEBHOOK_SECRET")
+    server = ThreadingHTTPServer((bind, port), WebhookHandler)
+    server.queue = queue
+    server.project_key = project_key
+    server.secret = secret
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_connection_arguments(parser)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    parser.add_argument("--bind", default=WEBHOOK_BIND,
+                        help="address to listen on; other than loopback, WEBHOOK_SECRET must be set")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS,
+                        help="seconds to wait after an issue's last event")
+    parser.add_argument("--workers", type=int, default=BATCH_CONCURRENCY, help="concurrent analyses")
+    args = parser.parse_args(argv)
+    check_connection_arguments(parser, args)
+    if not WEBHOOK_SECRET and not is_loopback(args.bind):
+        parser.error(f"--bind {args.bind} accepts events from other machines; set WEBHOOK_SECRET first")
+
+    jira = get_jira(args.host, args.email, args.token)
+    points_field = get_field_registry(args.host, args.email, args.token).story_points_field()
+    store = get_issue_store(args.host, args.email, args.token, args.project)
+    store.track_fields([points_field])
+    store.ensure_loaded(jira)
+    queue = ReanalysisQueue(jira, store, points_field, debounce=args.debounce, workers=args.workers).start()
+    server = make_server(queue, args.project, args.port, args.bind)
+    print(f"Listening for {args.project} issue events on http://{args.bind}:{args.port}/webhook")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.stop()
+        close_connection(args.host, args.email, args.token)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,168 +1,208 @@
 import streamlit as st
-from jira import JIRA
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableSequence
+from core.jira_client import get_jira, update_issues
+from core.issue_store import get_issue_store, SELECTBOX_LIMIT
+from core.jira_fields import get_field_registry
+from core.analysis import StoryAnalysis, get_story_analysis
+from core.dedup import get_duplicate_index
+from core.jobs import collect, finished_job, report_progress, show_running, submit_job
+from core.llm import BATCH_CONCURRENCY
+from core.prompt_budget import fit_inputs
+from core.parsing import REFINED_LABEL, UNREFINED_FILTERS, build_refined_description, is_refined, parse_refined_output
+from core.prompts import REFINER_PROMPT, TASK_BREAKDOWN_PROMPT
+from core.routing import run_routed, run_routed_batch, stream_routed
+from core.ui import connection_form, full_analysis_button, page_header
 
-st.set_page_config(page_title="User Story Refiner AI", layout="wide")
-st.title("📘 User Story Refiner AI")
-
-# ---- PROMPTS ----
-REFINER_PROMPT = """
-You are a User Story Refiner Agent. Given a user story or backlog item (which may be unclear, incomplete, or poorly written), your tasks are:
-1. Rewrite the story for clarity and completeness using the INVEST criteria.
-2. Add actionable acceptance criteria in bullet points.
-3. Suggest improvements if information is missing.
-
-Input User Story/Backlog Item:
-{user_story}
-
-Output (in this format):
----
-**Refined User Story:**  
-<improved version>
-
-**Acceptance Criteria:**  
-- <criterion 1>
-- <criterion 2>
----
-"""
-
-TASK_BREAKDOWN_PROMPT = """
-You are a software analyst. Given the following user story and its acceptance criteria, break it down into a clear, actionable list of implementation tasks for the development team.
-
-User Story:
-{user_story}
-
-Acceptance Criteria:
-{acceptance_criteria}
-
-Output (as a bullet list of tasks):
--
-"""
+page_header("User Story Refiner AI", "📘 User Story Refiner AI")
 
 # ---- JIRA SUB-TASK HELPERS ----
-def get_subtask_issue_type(jira, project_key):
-    """Get the sub-task issue type name for the project."""
-    project = jira.project(project_key)
-    for issue_type in project.issueTypes:
-        if issue_type.subtask:
-            return issue_type.name
-    raise Exception("Sub-task issue type not found in this project!")
+SUBTASK_CHUNK_SIZE = 50  # Jira's limit for one bulk-create request
 
-def create_jira_subtask(jira, parent_issue_key, summary, project_key, subtask_issue_type):
-    """Create a sub-task under the specified parent."""
-    issue_dict = {
+def subtask_fields(parent_issue_key, summary, project_key, subtask_issue_type):
+    """Fields for a sub-task under the specified parent."""
+    return {
         'project': {'key': project_key},
         'parent': {'key': parent_issue_key},
         'summary': summary[:255],
         'description': '',
         'issuetype': {'name': subtask_issue_type},
     }
-    return jira.create_issue(fields=issue_dict)
 
-def clear_connection_state():
-    for k in [
-        "jira_host", "jira_email", "jira_api_token", "jira_project_key",
-        "connected", "last_refined_summary",
-        "last_refined_criteria", "last_selected_issue_key", "last_task_breakdown", "last_task_breakdown_lines"
-    ]:
-        if k in st.session_state:
-            del st.session_state[k]
+def create_jira_subtasks(jira, parent_issue_key, summaries, project_key, subtask_issue_type):
+    """Bulk-create sub-tasks under the parent, skipping ones it already has.
+
+    Returns ``(created_keys, skipped_summaries, failures)`` where ``failures``
+    is a list of ``(summary, error)`` pairs.
+    """
+    parent = jira.issue(parent_issue_key, fields="subtasks")
+    existing = {sub.fields.summary.strip().lower() for sub in parent.fields.subtasks}
+    to_create, skipped = [], []
+    for summary in summaries:
+        normalized = summary[:255].strip().lower()
+        if normalized in existing:
+            skipped.append(summary)
+            continue
+        existing.add(normalized)
+        to_create.append(summary)
 
-# --- DISCONNECT BUTTON (TOP RIGHT IF CONNECTED) ---
-if st.session_state.get("connected", False):
-    colc, cold = st.columns([10, 1])
-    with cold:
-        if st.button("Disconnect"):
-            clear_connection_state()
-            st.rerun()
+    created_keys, failures = [], []
+    for start in range(0, len(to_create), SUBTASK_CHUNK_SIZE):
+        chunk = to_create[start:start + SUBTASK_CHUNK_SIZE]
+        field_list = [
+            subtask_fields(parent_issue_key, summary, project_key, subtask_issue_type)
+            for summary in chunk
+        ]
+        try:
+            results = jira.create_issues(field_list, prefetch=False)
+        except Exception as e:
+            failures += [(summary, str(e)) for summary in chunk]
+            continue
+        for summary, result in zip(chunk, results):
+            if result["status"] == "Success":
+                created_keys.append(result["issue"].key)
+            else:
+                failures.append((summary, result["error"]))
+    return created_keys, skipped, failures
 
-# ---- Step 1: Jira Connection Form ----
-if not st.session_state.get("connected", False):
-    st.subheader("Connect to Jira")
-    with st.form("connection_form"):
-        jira_host = st.text_input("Jira Host URL (e.g. https://yourdomain.atlassian.net)", value=st.session_state.get("jira_host", ""))
-        jira_email = st.text_input("Jira Email", value=st.session_state.get("jira_email", ""))
-        jira_api_token = st.text_input("Jira API Token", type="password", value=st.session_state.get("jira_api_token", ""))
-        jira_project_key = st.text_input("Jira Project Key", value=st.session_state.get("jira_project_key", ""))
-        submitted = st.form_submit_button("Connect")
+# ---- BATCH REFINEMENT ----
+def refine_batch(batch_issues, max_concurrency):
+    """Refine stories in a background job, keeping each result as it arrives.
 
-    if submitted:
-        if not (jira_host and jira_email and jira_api_token and jira_project_key):
-            st.warning("Please fill in all fields to connect.")
+    Returns ``(refined, failures)``: refined stories by key, in backlog
+    order, and ``"KEY: reason"`` for the ones that could not be refined.
+    """
+    batch_inputs = [
+        fit_inputs("refiner", {"user_story": f"{i.fields.summary}\n\n{i.fields.description or ''}".strip()})[0]
+        for i in batch_issues
+    ]
+    refined, failures = {}, []
+    results = run_routed_batch("refiner", REFINER_PROMPT, batch_inputs, max_concurrency=max_concurrency)
+    for done, (index, output) in enumerate(results, start=1):
+        issue = batch_issues[index]
+        if isinstance(output, Exception):
+            failures.append(f"{issue.key}: OpenAI Error: {output}")
         else:
-            st.session_state["jira_host"] = jira_host.strip()
-            st.session_state["jira_email"] = jira_email.strip()
-            st.session_state["jira_api_token"] = jira_api_token.strip()
-            st.session_state["jira_project_key"] = jira_project_key.strip()
-            try:
-                jira = JIRA(server=jira_host, basic_auth=(jira_email, jira_api_token))
-                st.session_state["connected"] = True
-                st.success(f"Connected as {jira_email} to JIRA: {jira_project_key}")
-            except Exception as e:
-                st.session_state["connected"] = False
-                st.error(f"Failed to connect to Jira: {e}")
-else:
-    st.success(
-        f"Connected as {st.session_state['jira_email']} to JIRA: {st.session_state['jira_project_key']}",
-        icon="🔗"
-    )
+            refined_summary, refined_criteria = parse_refined_output(output)
+            if refined_summary:
+                refined[issue.key] = {
+                    "original_summary": issue.fields.summary,
+                    "summary": refined_summary,
+                    "criteria": refined_criteria,
+                }
+            else:
+                failures.append(f"{issue.key}: could not parse the refined output")
+        report_progress(done, len(batch_issues), f"Refined {done} of {len(batch_issues)} stories")
+    return {i.key: refined[i.key] for i in batch_issues if i.key in refined}, failures
+
+PAGE_STATE_KEYS = [
+    "last_refined_summary", "last_refined_criteria", "last_selected_issue_key",
+    "last_task_breakdown", "last_task_breakdown_lines", "batch_refined",
+]
+
+connected = connection_form(PAGE_STATE_KEYS)
 
 # Only continue if connected
-if st.session_state.get("connected", False):
+if connected:
     jira_host = st.session_state["jira_host"]
     jira_email = st.session_state["jira_email"]
     jira_api_token = st.session_state["jira_api_token"]
     jira_project_key = st.session_state["jira_project_key"]
 
-    def get_llm():
-        return ChatOpenAI(model="gpt-4o", temperature=0, api_key=st.secrets["OPENAI_API_KEY"])
-
-    def parse_refined_output(output):
-        lines = output.splitlines()
-        refined_summary_lines = []
-        refined_criteria_lines = []
-        mode = None
-        for line in lines:
-            if "**Refined User Story:**" in line:
-                mode = "summary"
-                continue
-            if "**Acceptance Criteria:**" in line:
-                mode = "criteria"
-                continue
-            if line.strip() == "---":
-                mode = None
-                continue
-            if mode == "summary":
-                refined_summary_lines.append(line.strip())
-            elif mode == "criteria":
-                refined_criteria_lines.append(line.strip())
-        return (
-            " ".join(refined_summary_lines).strip(),
-            "\n".join(refined_criteria_lines).strip()
-        )
-
     try:
-        jira = JIRA(server=jira_host, basic_auth=(jira_email, jira_api_token))
-        jql = f'project={jira_project_key} ORDER BY created ASC'
-        issues = jira.search_issues(jql, maxResults=20)
+        jira = get_jira(jira_host, jira_email, jira_api_token)
+        story_points_field = get_field_registry(jira_host, jira_email, jira_api_token).story_points_field()
+        store = get_issue_store(jira_host, jira_email, jira_api_token, jira_project_key)
+        store.track_fields([story_points_field])
+        store.ensure_loaded(jira)
+        store.start_background_refresh(jira)
+        total_issues = store.count()
     except Exception as e:
         st.error(f"Failed to load issues: {e}")
-        issues = []
+        total_issues = 0
+
+    if total_issues:
+        # --------- BATCH REFINEMENT ---------
+        with st.expander("📦 Batch Refine the Backlog"):
+            batch_unrefined = st.checkbox("Only stories not yet refined", value=True, key="batch_unrefined")
+            batch_search = st.text_input("Only stories matching (key or summary)", value="", key="batch_search")
+            bcol1, bcol2 = st.columns(2)
+            with bcol1:
+                batch_limit = st.number_input("Maximum stories", min_value=1, max_value=1000, value=60, step=10)
+            with bcol2:
+                batch_concurrency = st.slider("Concurrent AI calls", min_value=1, max_value=16, value=BATCH_CONCURRENCY)
+            batch_filters = {"search": batch_search, **(UNREFINED_FILTERS if batch_unrefined else {})}
+            st.caption(f"{min(store.count(**batch_filters), int(batch_limit))} stories will be refined.")
+
+            if st.button("🔁 Refine Batch", key="refine_batch_btn"):
+                batch_issues = store.issues(limit=int(batch_limit), **batch_filters)
+                submit_job("refine:batch", f"Refining {len(batch_issues)} stories",
+                           refine_batch, batch_issues, batch_concurrency)
+            batch_job = finished_job("refine:batch")
+            if batch_job and batch_job.error:
+                st.error(f"Batch refinement failed: {batch_job.error}")
+            elif batch_job:
+                st.session_state["batch_refined"], failures = batch_job.result
+                if failures:
+                    st.warning("Some stories were not refined:\n\n- " + "\n- ".join(failures))
+            show_running("refine:batch")
+
+            if st.session_state.get("batch_refined"):
+                import pandas as pd
+
+                st.markdown("**Review the refined stories** (edit or untick before applying):")
+                review = st.data_editor(
+                    pd.DataFrame([
+                        {
+                            "Apply": True,
+                            "Key": key,
+                            "Original Summary": result["original_summary"],
+                            "Refined Summary": result["summary"],
+                            "Acceptance Criteria": result["criteria"],
+                        }
+                        for key, result in st.session_state["batch_refined"].items()
+                    ]),
+                    disabled=["Key", "Original Summary"],
+                    hide_index=True,
+                    key="batch_review",
+                )
+                if st.button("📌 Apply Selected to Jira", key="apply_batch_btn"):
+                    with st.spinner("Updating Jira..."):
+                        applied, failures = update_issues(
+                            jira,
+                            [
+                                (row["Key"], {
+                                    "summary": row["Refined Summary"][:255],
+                                    "description": build_refined_description(
+                                        row["Refined Summary"], row["Acceptance Criteria"]
+                                    ),
+                                })
+                                for row in review.to_dict("records") if row["Apply"]
+                            ],
+                            add_labels=[REFINED_LABEL],
+                        )
+                        for key in applied:
+                            del st.session_state["batch_refined"][key]
+                        store.sync(jira)
+                    if applied:
+                        st.success(f"Updated {len(applied)} issues in Jira: {', '.join(applied)}")
+                    if failures:
+                        st.error(
+                            "Failed to update Jira:\n\n- "
+                            + "\n- ".join(f"{key}: {error}" for key, error in failures)
+                        )
 
-    if issues:
         show_only_unrefined = st.checkbox("Show only unrefined stories", value=False)
+        search = st.text_input("Search stories by key or summary", value="")
+        filters = {"search": search, **(UNREFINED_FILTERS if show_only_unrefined else {})}
+        issues = store.issues(limit=SELECTBOX_LIMIT, **filters)
+        matching = store.count(**filters)
+        if matching > len(issues):
+            st.caption(f"Showing {len(issues)} of {matching} matching stories. Search to narrow the list.")
 
         filtered_issues = []
         issue_titles = []
 
         for i in issues:
-            desc = i.fields.description or ""
-            refined_flag = "_Refined by AI agent_" in desc
-            if show_only_unrefined and refined_flag:
-                continue
-            label = f"{'✅ ' if refined_flag else ''}{i.key}: {i.fields.summary}"
+            label = f"{'✅ ' if is_refined(i) else ''}{i.key}: {i.fields.summary}"
             issue_titles.append(label)
             filtered_issues.append(i)
 
@@ -184,31 +224,40 @@ if st.session_state.get("connected", False):
             st.subheader("✨ Refined Output")
             with st.form("refine_form", clear_on_submit=True):
                 submitted = st.form_submit_button("🔁 Refine Story")
-                if submitted:
-                    with st.spinner("Refining with AI..."):
-                        chain = LLMChain(
-                            llm=get_llm(),
-                            prompt=PromptTemplate.from_template(REFINER_PROMPT)
-                        )
-                        try:
-                            refined = chain.run({"user_story": story_input})
-                        except Exception as e:
-                            st.error(f"OpenAI Error: {e}")
-                            refined = ""
-                        refined_summary, refined_criteria = parse_refined_output(refined)
-                        st.markdown(f"**Refined Summary:** {refined_summary}")
-                        st.markdown("**Acceptance Criteria:**")
-                        if "**Suggestions for Improvement:**" in refined_criteria:
-                            criteria_part, suggestions_part = refined_criteria.split("**Suggestions for Improvement:**", 1)
-                            st.markdown(f"- " + "\n- ".join([line for line in criteria_part.strip().splitlines() if line]))
-                            st.markdown("**Suggestions for Improvement:**")
-                            st.markdown(f"- " + "\n- ".join([line for line in suggestions_part.strip().splitlines() if line]))
-                        else:
-                            st.markdown(f"- " + "\n- ".join([line for line in refined_criteria.strip().splitlines() if line]))
-                        # Store for update
-                        st.session_state["last_refined_summary"] = refined_summary
-                        st.session_state["last_refined_criteria"] = refined_criteria
-                        st.session_state["last_selected_issue_key"] = selected_issue.key
+                analyze = full_analysis_button(in_form=True)
+                refine_job_name = f"refine:{selected_issue.key}"
+                if analyze:
+                    submit_job(refine_job_name, f"Analyzing {selected_issue.key}",
+                               get_story_analysis, store, selected_issue, story_points_field)
+                elif submitted:
+                    inputs, budget = fit_inputs("refiner", {"user_story": story_input})
+                    if budget.saved_tokens:
+                        st.caption(f"Trimmed {budget.saved_tokens} tokens of logs and markup from the prompt.")
+                    # The completion streams into the job's partial output while it runs
+                    submit_job(refine_job_name, f"Refining {selected_issue.key}",
+                               collect, stream_routed("refiner", REFINER_PROMPT, inputs))
+                refine_job = finished_job(refine_job_name)
+                if refine_job:
+                    if refine_job.error:
+                        st.error(f"OpenAI Error: {refine_job.error}")
+                    refined = refine_job.result or ""
+                    if isinstance(refined, StoryAnalysis):
+                        refined = refined.refiner_output()
+                    refined_summary, refined_criteria = parse_refined_output(refined)
+                    st.markdown(f"**Refined Summary:** {refined_summary}")
+                    st.markdown("**Acceptance Criteria:**")
+                    if "**Suggestions for Improvement:**" in refined_criteria:
+                        criteria_part, suggestions_part = refined_criteria.split("**Suggestions for Improvement:**", 1)
+                        st.markdown(f"- " + "\n- ".join([line for line in criteria_part.strip().splitlines() if line]))
+                        st.markdown("**Suggestions for Improvement:**")
+                        st.markdown(f"- " + "\n- ".join([line for line in suggestions_part.strip().splitlines() if line]))
+                    else:
+                        st.markdown(f"- " + "\n- ".join([line for line in refined_criteria.strip().splitlines() if line]))
+                    # Store for update
+                    st.session_state["last_refined_summary"] = refined_summary
+                    st.session_state["last_refined_criteria"] = refined_criteria
+                    st.session_state["last_selected_issue_key"] = selected_issue.key
+            show_running(f"refine:{selected_issue.key}")
 
             # Show Update Jira if a refined output is present for this story
             if (
@@ -216,17 +265,17 @@ if st.session_state.get("connected", False):
                 and st.session_state.get("last_selected_issue_key") == selected_issue.key
             ):
                 if st.button("📌 Update Jira", key="update_jira_btn"):
-                    refined_description = (
-                        f"**Refined User Story:**  {st.session_state['last_refined_summary']}\n\n"
-                        f"**Acceptance Criteria:**  \n"
-                        f"- " + "\n- ".join(st.session_state['last_refined_criteria'].splitlines()) +
-                        "\n\n_Refined by AI agent_"
+                    refined_description = build_refined_description(
+                        st.session_state['last_refined_summary'],
+                        st.session_state['last_refined_criteria']
                     )
                     try:
                         jira.issue(selected_issue.key).update(
                             summary=st.session_state['last_refined_summary'][:255],
-                            description=refined_description
+                            description=refined_description,
+                            update={"labels": [{"add": REFINED_LABEL}]},
                         )
+                        store.sync(jira)
                         st.success(f"Issue {selected_issue.key} updated in Jira!")
                     except Exception as e:
                         st.error(f"Failed to update Jira: {e}")
@@ -237,41 +286,66 @@ if st.session_state.get("connected", False):
                 and st.session_state.get("last_selected_issue_key") == selected_issue.key
             ):
                 if st.button("🛠️ Break Down Into Tasks"):
-                    with st.spinner("Breaking down into tasks..."):
-                        chain = LLMChain(
-                            llm=get_llm(),
-                            prompt=PromptTemplate.from_template(TASK_BREAKDOWN_PROMPT)
+                    inputs, budget = fit_inputs("task_breakdown", {
+                        "user_story": st.session_state["last_refined_summary"],
+                        "acceptance_criteria": st.session_state["last_refined_criteria"]
+                    })
+                    submit_job(f"tasks:{selected_issue.key}", f"Breaking down {selected_issue.key}",
+                               run_routed, "task_breakdown", TASK_BREAKDOWN_PROMPT, inputs)
+                tasks_job = finished_job(f"tasks:{selected_issue.key}")
+                if tasks_job and tasks_job.error:
+                    st.error(f"OpenAI Error: {tasks_job.error}")
+                elif tasks_job:
+                    st.markdown("**Implementation Tasks:**")
+                    task_lines = [line.lstrip('- ').strip() for line in tasks_job.result.strip().splitlines() if line.strip()]
+                    for task in task_lines:
+                        st.checkbox(task, key=task)
+                    existing = get_duplicate_index(store).existing_matches(task_lines, exclude=[selected_issue.key])
+                    if existing:
+                        st.warning(
+                            "Some tasks look like existing issues:\n\n- "
+                            + "\n- ".join(
+                                f"{task} → " + ", ".join(f"{key}: {summary}" for key, summary, _ in matches[:3])
+                                for task, matches in existing.items()
+                            )
                         )
-                        tasks_output = chain.run({
-                            "user_story": st.session_state["last_refined_summary"],
-                            "acceptance_criteria": st.session_state["last_refined_criteria"]
-                        })
-                        st.markdown("**Implementation Tasks:**")
-                        task_lines = [line.lstrip('- ').strip() for line in tasks_output.strip().splitlines() if line.strip()]
-                        for task in task_lines:
-                            st.checkbox(task, key=task)
-                        st.session_state["last_task_breakdown"] = "\n".join([f"- [ ] {task}" for task in task_lines])
-                        st.session_state["last_task_breakdown_lines"] = task_lines  # <-- Store the list for sub-task creation
+                    st.session_state["last_task_breakdown"] = "\n".join([f"- [ ] {task}" for task in task_lines])
+                    st.session_state["last_task_breakdown_lines"] = task_lines  # <-- Store the list for sub-task creation
+                show_running(f"tasks:{selected_issue.key}")
 
                 # ------ BUTTON TO CREATE SUB-TASKS ------
                 if st.session_state.get("last_task_breakdown_lines"):
                     if st.button("📎 Create Jira Sub-tasks", key="create_jira_subtasks_btn"):
                         try:
-                            subtask_issue_type = get_subtask_issue_type(jira, jira_project_key)
-                            parent_issue_key = selected_issue.key
-                            created_keys = []
-                            for task_summary in st.session_state["last_task_breakdown_lines"]:
-                                new_issue = create_jira_subtask(
-                                    jira,
-                                    parent_issue_key=parent_issue_key,
-                                    summary=task_summary,
-                                    project_key=jira_project_key,
-                                    subtask_issue_type=subtask_issue_type,
-                                )
-                                created_keys.append(new_issue.key)
-                            st.success(f"Created sub-tasks: {', '.join(created_keys)}")
+                            subtask_issue_type = get_field_registry(
+                                jira_host, jira_email, jira_api_token
+                            ).subtask_issue_type(jira_project_key)
+                            submit_job(
+                                f"subtasks:{selected_issue.key}", f"Creating sub-tasks of {selected_issue.key}",
+                                create_jira_subtasks,
+                                jira,
+                                parent_issue_key=selected_issue.key,
+                                summaries=st.session_state["last_task_breakdown_lines"],
+                                project_key=jira_project_key,
+                                subtask_issue_type=subtask_issue_type,
+                            )
                         except Exception as e:
                             st.error(f"Failed to create sub-tasks: {e}")
+                    subtasks_job = finished_job(f"subtasks:{selected_issue.key}")
+                    if subtasks_job and subtasks_job.error:
+                        st.error(f"Failed to create sub-tasks: {subtasks_job.error}")
+                    elif subtasks_job:
+                        created_keys, skipped, failures = subtasks_job.result
+                        if created_keys:
+                            st.success(f"Created sub-tasks: {', '.join(created_keys)}")
+                        if skipped:
+                            st.info(f"Skipped {len(skipped)} tasks that already exist as sub-tasks.")
+                        if failures:
+                            st.error(
+                                "Failed to create some sub-tasks:\n\n- "
+                                + "\n- ".join(f"{summary}: {error}" for summary, error in failures)
+                            )
+                    show_running(f"subtasks:{selected_issue.key}")
 
                 # ------ Optional: Also keep "Update Jira with Tasks" if you want old behavior ------
                 if st.session_state.get("last_task_breakdown"):
@@ -287,8 +361,10 @@ if st.session_state.get("connected", False):
                         try:
                             jira.issue(selected_issue.key).update(
                                 summary=st.session_state['last_refined_summary'][:255],
-                                description=refined_description
+                                description=refined_description,
+                                update={"labels": [{"add": REFINED_LABEL}]},
                             )
+                            store.sync(jira)
                             st.success(f"Issue {selected_issue.key} updated in Jira with tasks!")
                         except Exception as e:
                             st.error(f"Failed to update Jira: {e}")
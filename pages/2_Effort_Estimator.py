@@ -1,134 +1,50 @@
 import streamlit as st
-from jira import JIRA
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableSequence
-
-st.set_page_config(page_title="AI Effort Estimator", layout="wide")
-st.title("📏 AI-Based Effort Estimator for Jira Stories")
-
-# ---- Prompt Template ----
-ESTIMATOR_PROMPT = """
-You are an agile estimation agent. Given a new Jira user story and several similar stories (with known story points and outcomes), suggest a draft story point estimate range (e.g., 5–8 points) and a confidence score from 0 to 1, justifying your answer.
-
-NEW STORY:
-Summary: {summary}
-Description: {description}
-Component: {component}
-
-SIMILAR STORIES:
-{examples}
-
-Output (use this format):
----
-**Estimated Story Point Range:** <range>
-**Confidence Score:** <score between 0–1>
-**Reasoning:** <short justification>
----
-"""
-
-def clear_connection_state():
-    for k in [
-        "jira_host", "jira_email", "jira_api_token", "jira_project_key",
-        "connected"
-    ]:
-        if k in st.session_state:
-            del st.session_state[k]
-
-def get_llm():
-    return ChatOpenAI(model="gpt-4o", temperature=0, api_key=st.secrets["OPENAI_API_KEY"])
-
-def parse_estimator_output(output):
-    import re
-    range_ = ""
-    confidence = ""
-    reasoning = ""
-    range_match = re.search(r"\*\*Estimated Story Point Range:\*\*\s*([^\n]*)", output)
-    conf_match = re.search(r"\*\*Confidence Score:\*\*\s*([^\n]*)", output)
-    reasoning_match = re.search(r"\*\*Reasoning:\*\*\s*([\s\S]*)", output)
-    if range_match:
-        range_ = range_match.group(1).strip()
-    if conf_match:
-        confidence = conf_match.group(1).strip()
-    if reasoning_match:
-        reasoning = reasoning_match.group(1).strip().split('\n---')[0].strip()
-    return range_, confidence, reasoning
-
-def get_similar_stories(jira, project_key, component, current_issue_key=None, n=5):
-    jql = (
-        f'project={project_key} AND "Story Points" is not EMPTY '
-        f'AND component="{component}" ORDER BY updated DESC'
-    )
-    try:
-        issues = jira.search_issues(jql, maxResults=15)
-    except Exception as e:
-        issues = []
-    examples = []
-    for issue in issues:
-        if issue.key == current_issue_key:
-            continue
-        example = f"- Summary: {issue.fields.summary}\n  Description: {getattr(issue.fields, 'description', '') or '[No Description]'}\n  Component: {component}\n  Story Points: {getattr(issue.fields, 'customfield_10016', 'N/A')}"
-        examples.append(example)
-        if len(examples) >= n:
-            break
-    return "\n".join(examples) if examples else "[No similar stories found]"
-
-# ---- DISCONNECT BUTTON ----
-if st.session_state.get("connected", False):
-    colc, cold = st.columns([10, 1])
-    with cold:
-        if st.button("Disconnect"):
-            clear_connection_state()
-            st.rerun()
-
-# ---- Connection Form ----
-if not st.session_state.get("connected", False):
-    st.subheader("Connect to Jira")
-    with st.form("connection_form"):
-        jira_host = st.text_input("Jira Host URL (e.g. https://yourdomain.atlassian.net)", value=st.session_state.get("jira_host", ""))
-        jira_email = st.text_input("Jira Email", value=st.session_state.get("jira_email", ""))
-        jira_api_token = st.text_input("Jira API Token", type="password", value=st.session_state.get("jira_api_token", ""))
-        jira_project_key = st.text_input("Jira Project Key", value=st.session_state.get("jira_project_key", ""))
-        submitted = st.form_submit_button("Connect")
-
-    if submitted:
-        if not (jira_host and jira_email and jira_api_token and jira_project_key):
-            st.warning("Please fill in all fields to connect.")
-        else:
-            st.session_state["jira_host"] = jira_host.strip()
-            st.session_state["jira_email"] = jira_email.strip()
-            st.session_state["jira_api_token"] = jira_api_token.strip()
-            st.session_state["jira_project_key"] = jira_project_key.strip()
-            try:
-                jira = JIRA(server=jira_host, basic_auth=(jira_email, jira_api_token))
-                st.session_state["connected"] = True
-                st.success(f"Connected as {jira_email} to JIRA: {jira_project_key}")
-            except Exception as e:
-                st.session_state["connected"] = False
-                st.error(f"Failed to connect to Jira: {e}")
-
-else:
-    st.success(
-        f"Connected as {st.session_state['jira_email']} to JIRA: {st.session_state['jira_project_key']}",
-        icon="🔗"
-    )
+from core.jira_client import get_jira
+from core.issue_store import get_issue_store, SELECTBOX_LIMIT
+from core.jira_fields import get_field_registry
+from core.similarity import similar_story_examples
+from core.pre_estimate import PRE_ESTIMATE_CONFIDENCE, get_pre_estimator
+from core.analysis import StoryAnalysis, get_story_analysis
+from core.jobs import finished_job, show_running, submit_job
+from core.prompt_budget import fit_inputs
+from core.parsing import parse_estimator_output, save_estimate
+from core.prompts import ESTIMATOR_PROMPT
+from core.routing import run_routed
+from core.ui import connection_form, full_analysis_button, page_header
+
+page_header("AI Effort Estimator", "📏 AI-Based Effort Estimator for Jira Stories")
+
+connected = connection_form()
 
 # ---- Main Effort Estimator Logic ----
-if st.session_state.get("connected", False):
+if connected:
     jira_host = st.session_state["jira_host"]
     jira_email = st.session_state["jira_email"]
     jira_api_token = st.session_state["jira_api_token"]
     jira_project_key = st.session_state["jira_project_key"]
 
     try:
-        jira = JIRA(server=jira_host, basic_auth=(jira_email, jira_api_token))
-        jql = f'project={jira_project_key} AND issuetype=Story AND "Story Points" is EMPTY ORDER BY created ASC'
-        issues = jira.search_issues(jql, maxResults=20)
+        jira = get_jira(jira_host, jira_email, jira_api_token)
+        story_points_field = get_field_registry(jira_host, jira_email, jira_api_token).story_points_field()
+        store = get_issue_store(jira_host, jira_email, jira_api_token, jira_project_key)
+        store.track_fields([story_points_field])
+        store.ensure_loaded(jira)
+        store.start_background_refresh(jira)
+        filters = {"issuetype": "Story", "missing_field": story_points_field}
+        total_issues = store.count(**filters)
     except Exception as e:
         st.error(f"Failed to load issues: {e}")
-        issues = []
-
-    if issues:
+        total_issues = 0
+
+    if total_issues:
+        search = st.text_input("Search stories by key or summary", value="")
+        issues = store.issues(limit=SELECTBOX_LIMIT, search=search, **filters)
+        matching = store.count(search=search, **filters)
+        if matching > len(issues):
+            st.caption(f"Showing {len(issues)} of {matching} matching stories. Search to narrow the list.")
+        if not issues:
+            st.warning("No matching stories found.")
+            st.stop()
         issue_titles = [f"{i.key}: {i.fields.summary}" for i in issues]
         selected = st.selectbox("Select a user story for estimation:", issue_titles)
         selected_issue = issues[issue_titles.index(selected)]
@@ -142,28 +58,60 @@ if st.session_state.get("connected", False):
         st.markdown(f"**Description:** {description}")
         st.markdown(f"**Component:** {component}")
 
+        try:
+            pre_estimate = get_pre_estimator(store, story_points_field).estimate(selected_issue)
+        except Exception as e:
+            pre_estimate = None
+            st.caption(f"No instant estimate: {e}")
+        if pre_estimate:
+            st.info(
+                f"⚡ Instant estimate: `{pre_estimate.point_range}` points · "
+                f"confidence {pre_estimate.confidence:.2f} · from {len(pre_estimate.neighbours)} similar stories"
+            )
+
         with st.form("estimate_form", clear_on_submit=True):
             st.subheader("🤖 AI Effort Estimation")
+            analyze = full_analysis_button(in_form=True)
+            estimate_job_name = f"estimate:{selected_issue.key}"
+            if analyze:
+                submit_job(estimate_job_name, f"Analyzing {selected_issue.key}",
+                           get_story_analysis, store, selected_issue, story_points_field)
             if st.form_submit_button("Estimate Story Points"):
-                with st.spinner("Fetching similar stories and estimating..."):
-                    similar_examples = get_similar_stories(jira, jira_project_key, component, current_issue_key=selected_issue.key, n=5)
-                    chain = LLMChain(
-                        llm=get_llm(),
-                        prompt=PromptTemplate.from_template(ESTIMATOR_PROMPT)
+                if pre_estimate and pre_estimate.confidence >= PRE_ESTIMATE_CONFIDENCE:
+                    # Confident enough: keep the instant estimate and skip the LLM call.
+                    st.session_state["last_est_range"] = pre_estimate.point_range
+                    st.session_state["last_confidence"] = f"{pre_estimate.confidence:.2f}"
+                    st.session_state["last_reasoning"] = pre_estimate.reasoning()
+                    save_estimate(store, selected_issue.key, pre_estimate.point_range, pre_estimate.confidence,
+                                  pre_estimate.reasoning(), source="pre-estimate")
+                    st.caption("Used the instant estimate; no LLM call needed.")
+                else:
+                    similar_examples = similar_story_examples(
+                        store, story_points_field, summary, description, component,
+                        exclude_key=selected_issue.key, n=5
                     )
-                    try:
-                        result = chain.run({
-                            "summary": summary,
-                            "description": description,
-                            "component": component,
-                            "examples": similar_examples
-                        })
-                        est_range, conf, reasoning = parse_estimator_output(result)
-                        st.session_state["last_est_range"] = est_range
-                        st.session_state["last_confidence"] = conf
-                        st.session_state["last_reasoning"] = reasoning
-                    except Exception as e:
-                        st.error(f"OpenAI Error: {e}")
+                    inputs, budget = fit_inputs("estimator", {
+                        "summary": summary,
+                        "description": description,
+                        "component": component,
+                        "examples": similar_examples
+                    })
+                    if budget.saved_tokens:
+                        st.caption(f"Trimmed {budget.saved_tokens} tokens of logs and markup from the prompt.")
+                    submit_job(estimate_job_name, f"Estimating {selected_issue.key}", run_routed, "estimator", ESTIMATOR_PROMPT, inputs)
+            estimate_job = finished_job(estimate_job_name)
+            if estimate_job and estimate_job.error:
+                st.error(f"OpenAI Error: {estimate_job.error}")
+            elif estimate_job:
+                result = estimate_job.result
+                if isinstance(result, StoryAnalysis):
+                    est_range, conf, reasoning = result.point_range, str(result.confidence), result.estimate_reasoning
+                else:
+                    est_range, conf, reasoning = parse_estimator_output(result)
+                    save_estimate(store, selected_issue.key, est_range, conf, reasoning)
+                st.session_state["last_est_range"] = est_range
+                st.session_state["last_confidence"] = conf
+                st.session_state["last_reasoning"] = reasoning
 
             # Show results if available
             if st.session_state.get("last_est_range"):
@@ -176,14 +124,15 @@ if st.session_state.get("connected", False):
                 )
                 if st.form_submit_button("Save to Jira"):
                     try:
-                        story_points_field = "customfield_10016"
-                        selected_issue.update(fields={story_points_field: float(final_estimate)})
+                        jira.issue(selected_issue.key).update(fields={story_points_field: float(final_estimate)})
+                        store.sync(jira)
                         st.success(f"Story points updated to {final_estimate} for {selected_issue.key}!")
                         for k in ["last_est_range", "last_confidence", "last_reasoning"]:
                             if k in st.session_state:
                                 del st.session_state[k]
                     except Exception as e:
                         st.error(f"Failed to update Jira: {e}")
+        show_running(f"estimate:{selected_issue.key}")
 
     else:
         st.warning("No unestimated user stories found in the selected project.")
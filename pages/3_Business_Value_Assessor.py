@@ -1,180 +1,171 @@
 import streamlit as st
-from jira import JIRA
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableSequence
-import requests
-from requests.auth import HTTPBasicAuth
-
-st.set_page_config(page_title="Business Value Assessment AI", layout="wide")
-st.title("📊 Business Value Assessment AI")
-
-# --- PROMPT ---
-BUSINESS_VALUE_PROMPT = """
-You are a Business Value Analyst Agent. Given a user story or backlog item, along with any context such as goals, risks, deadlines, dependencies, or effort/complexity, your tasks are:
-
-1. Assess the business value of the item considering:
-    - Business value or customer impact
-    - Deadlines or time sensitivity
-    - Dependencies on or by other work
-    - Risk of delay or failure
-    - Effort or complexity
-    - Alignment with strategic goals or company objectives
-    - Urgency (regulatory, competitive, or other time-sensitive factors)
-    - Potential Return on Investment (ROI)
-2. Suggest a **business value score** (High, Medium, Low).
-3. Suggest a **priority** (High/Medium/Low or Must-have/Should-have/Nice-to-have) with a brief justification.
-4. If important info is missing, state what is needed.
-
-**Input:**  
-User Story:  
-{user_story}
-
-Context (if any):  
-{context}
-
-**Output (format):**
----
-**Business Value Assessment:**  
-<bullet points for each factor above>
-
-**Business Value Score:** High/Medium/Low
-
-**Priority Suggestion:** Must-have/Should-have/Nice-to-have  
-Justification: <your justification>
-
-<If info is missing, mention what's needed>
----
-"""
-
-def clear_connection_state():
-    for k in [
-        "jira_host", "jira_email", "jira_api_token", "jira_project_key",
-        "connected", "custom_field_id", "last_assessment",
-        "last_selected_issue_key"
-    ]:
-        if k in st.session_state:
-            del st.session_state[k]
-
-# --- DISCONNECT BUTTON ---
-if st.session_state.get("connected", False):
-    colc, cold = st.columns([10, 1])
-    with cold:
-        if st.button("Disconnect"):
-            clear_connection_state()
-            st.rerun()
-
-# --- CONNECTION FORM ---
-if not st.session_state.get("connected", False):
-    st.subheader("Connect to Jira")
-    with st.form("connection_form"):
-        jira_host = st.text_input("Jira Host URL (e.g. https://yourdomain.atlassian.net)", value=st.session_state.get("jira_host", ""))
-        jira_email = st.text_input("Jira Email", value=st.session_state.get("jira_email", ""))
-        jira_api_token = st.text_input("Jira API Token", type="password", value=st.session_state.get("jira_api_token", ""))
-        jira_project_key = st.text_input("Jira Project Key", value=st.session_state.get("jira_project_key", ""))
-        submitted = st.form_submit_button("Connect")
-
-    if submitted:
-        # Basic validation
-        if not (jira_host and jira_email and jira_api_token and jira_project_key):
-            st.warning("Please fill in all fields to connect.")
+from core.jira_client import get_jira, update_issues
+from core.jira_fields import BUSINESS_VALUE_FIELD_DESCRIPTION, BUSINESS_VALUE_FIELD_NAME, get_field_registry
+from core.issue_store import get_issue_store, SELECTBOX_LIMIT
+from core.analysis import StoryAnalysis, get_story_analysis
+from core.jobs import collect, finished_job, report_progress, show_running, submit_job
+from core.llm import BATCH_CONCURRENCY
+from core.prompt_budget import fit_inputs
+from core.parsing import PRIORITY_RANK, SCORE_RANK, VALUE_ASSESSED_LABEL, save_business_value
+from core.prompts import BUSINESS_VALUE_PROMPT
+from core.routing import run_routed_batch, stream_routed
+from core.ui import connection_form, full_analysis_button, page_header
+
+page_header("Business Value Assessment AI", "📊 Business Value Assessment AI")
+
+
+def score_batch(store, batch_issues, max_concurrency):
+    """Score stories in a background job, saving each assessment to the store as it arrives.
+
+    Returns ``"KEY: reason"`` for the stories that could not be scored.
+    """
+    batch_inputs = [
+        fit_inputs("business_value", {
+            "user_story": f"{i.fields.summary}\n\n{i.fields.description or ''}".strip(),
+            "context": "",
+        })[0]
+        for i in batch_issues
+    ]
+    failures = []
+    results = run_routed_batch(
+        "business_value", BUSINESS_VALUE_PROMPT, batch_inputs, max_concurrency=max_concurrency,
+        temperature=0.2, max_tokens=1024
+    )
+    for done, (index, output) in enumerate(results, start=1):
+        issue = batch_issues[index]
+        if isinstance(output, Exception):
+            failures.append(f"{issue.key}: OpenAI Error: {output}")
         else:
-            st.session_state["jira_host"] = jira_host.strip()
-            st.session_state["jira_email"] = jira_email.strip()
-            st.session_state["jira_api_token"] = jira_api_token.strip()
-            st.session_state["jira_project_key"] = jira_project_key.strip()
-            try:
-                jira = JIRA(server=jira_host, basic_auth=(jira_email, jira_api_token))
-                st.session_state["connected"] = True
-                st.success(f"Connected as {jira_email} to JIRA: {jira_project_key}")
-            except Exception as e:
-                st.session_state["connected"] = False
-                st.error(f"Failed to connect to Jira: {e}")
+            save_business_value(store, issue.key, output)
+        report_progress(done, len(batch_issues), f"Scored {done} of {len(batch_issues)} stories")
+    return failures
+
+
+PAGE_STATE_KEYS = ["custom_field_id", "last_assessment", "last_selected_issue_key"]
+
+connected = connection_form(PAGE_STATE_KEYS)
 
 # --- IF CONNECTED, MAIN UI ---
-if st.session_state.get("connected", False):
+if connected:
     jira_host = st.session_state["jira_host"]
     jira_email = st.session_state["jira_email"]
     jira_api_token = st.session_state["jira_api_token"]
     jira_project_key = st.session_state["jira_project_key"]
 
-    # --- Custom Field Creation/Retrieval ---
-    def get_custom_field_id(field_name):
-        url = f"{jira_host}/rest/api/3/field"
-        auth = HTTPBasicAuth(jira_email, jira_api_token)
-        headers = {"Accept": "application/json"}
-        response = requests.get(url, headers=headers, auth=auth)
-        if response.status_code == 200:
-            fields = response.json()
-            for field in fields:
-                if field['name'] == field_name:
-                    return field['id']
-        return None
-
-    def create_custom_field(field_name, description, field_type="com.atlassian.jira.plugin.system.customfieldtypes:textarea"):
-        url = f"{jira_host}/rest/api/3/field"
-        auth = HTTPBasicAuth(jira_email, jira_api_token)
-        headers = {"Accept": "application/json", "Content-Type": "application/json"}
-        payload = {
-            "name": field_name,
-            "description": description,
-            "type": field_type,
-            "searcherKey": "textsearcher"
-        }
-        response = requests.post(url, json=payload, headers=headers, auth=auth)
-        if response.status_code == 201:
-            return response.json().get('id')
-        elif response.status_code == 400 and "A custom field with this name already exists" in response.text:
-            return None
-        else:
-            return None
-
-    FIELD_NAME = "Business Value"
-    FIELD_DESCRIPTION = "Business Value assessment generated by AI."
-    custom_field_id = get_custom_field_id(FIELD_NAME)
-    custom_field_status = ""
-
-    if not custom_field_id:
-        new_field_id = create_custom_field(FIELD_NAME, FIELD_DESCRIPTION)
-        if new_field_id:
-            st.success(f"Custom field '{FIELD_NAME}' created in Jira.")
-            custom_field_id = new_field_id
-        else:
-            custom_field_id = get_custom_field_id(FIELD_NAME)
-            if custom_field_id:
-                st.info(f"Custom field '{FIELD_NAME}' already exists in Jira.")
-            else:
-                st.error(f"Could not create or find the custom field '{FIELD_NAME}'.")
+    # --- Custom Field Creation/Retrieval (cached field registry) ---
+    try:
+        field_registry = get_field_registry(jira_host, jira_email, jira_api_token)
+        custom_field_id, created = field_registry.ensure_field(BUSINESS_VALUE_FIELD_NAME, BUSINESS_VALUE_FIELD_DESCRIPTION)
+        story_points_field = field_registry.story_points_field()
+    except Exception as e:
+        st.error(f"Failed to load Jira fields: {e}")
+        custom_field_id, created, story_points_field = None, False, None
+
+    if created:
+        st.success(f"Custom field '{BUSINESS_VALUE_FIELD_NAME}' created in Jira.")
+    elif custom_field_id:
+        st.info(f"Custom field '{BUSINESS_VALUE_FIELD_NAME}' found in Jira.")
     else:
-        st.info(f"Custom field '{FIELD_NAME}' found in Jira.")
+        st.error(f"Could not create or find the custom field '{BUSINESS_VALUE_FIELD_NAME}'.")
 
     st.session_state["custom_field_id"] = custom_field_id
 
     # --- Jira Instance ---
     try:
-        jira = JIRA(server=jira_host, basic_auth=(jira_email, jira_api_token))
+        jira = get_jira(jira_host, jira_email, jira_api_token)
     except Exception as e:
         st.error(f"Failed to connect to Jira after authentication: {e}")
         st.stop()
 
     # --- Fetch Issues ---
     try:
-        jql = f'project={jira_project_key} ORDER BY created ASC'
-        issues = jira.search_issues(jql, maxResults=30)
+        store = get_issue_store(jira_host, jira_email, jira_api_token, jira_project_key)
+        store.track_fields([custom_field_id, story_points_field])
+        store.ensure_loaded(jira)
+        store.start_background_refresh(jira)
+        total_issues = store.count()
     except Exception as e:
         st.error(f"Failed to load issues: {e}")
-        issues = []
+        total_issues = 0
+
+    if total_issues and custom_field_id:
+        # --------- BACKLOG SCORING ---------
+        with st.expander("📦 Score the Backlog"):
+            unassessed = {"missing_field": custom_field_id, "without_label": VALUE_ASSESSED_LABEL}
+            bcol1, bcol2 = st.columns(2)
+            with bcol1:
+                batch_limit = st.number_input("Maximum stories", min_value=1, max_value=5000, value=200, step=50)
+            with bcol2:
+                batch_concurrency = st.slider("Concurrent AI calls", min_value=1, max_value=16, value=BATCH_CONCURRENCY)
+            st.caption(f"{min(store.count(**unassessed), int(batch_limit))} unassessed stories will be scored.")
+
+            if st.button("🔍 Score Unassessed Stories", key="score_batch_btn"):
+                batch_issues = store.issues(limit=int(batch_limit), **unassessed)
+                submit_job("assess:batch", f"Scoring {len(batch_issues)} stories",
+                           score_batch, store, batch_issues, batch_concurrency)
+            batch_job = finished_job("assess:batch")
+            if batch_job and batch_job.error:
+                st.error(f"Batch scoring failed: {batch_job.error}")
+            elif batch_job and batch_job.result:
+                st.warning("Some stories were not scored:\n\n- " + "\n- ".join(batch_job.result))
+            show_running("assess:batch")
+
+            scored = store.analyses("business_value")
+            if scored:
+                import pandas as pd
+
+                ranked = pd.DataFrame([
+                    {
+                        "Key": a["key"],
+                        "Summary": a["summary"],
+                        "Value Score": a["data"]["score"] or "?",
+                        "Priority": a["data"]["priority"] or "?",
+                        "In Jira": a["data"]["written"],
+                        "Justification": a["data"]["justification"],
+                        "_score": SCORE_RANK.get(a["data"]["score"].lower(), 0),
+                        "_priority": PRIORITY_RANK.get(a["data"]["priority"].lower(), 0),
+                    }
+                    for a in scored
+                ]).sort_values(["_score", "_priority", "Key"], ascending=[False, False, True])
+                ranked.insert(0, "Rank", range(1, len(ranked) + 1))
+                st.dataframe(ranked.drop(columns=["_score", "_priority"]), hide_index=True)
+
+                pending = [a for a in scored if not a["data"]["written"]]
+                if pending and st.button(f"📌 Write {len(pending)} Scores to Jira", key="write_scores_btn"):
+                    with st.spinner("Updating Jira..."):
+                        updated, failures = update_issues(
+                            jira, [(a["key"], {custom_field_id: a["data"]["assessment"]}) for a in pending],
+                            add_labels=[VALUE_ASSESSED_LABEL],
+                        )
+                        for a in pending:
+                            if a["key"] in updated:
+                                save_business_value(store, a["key"], a["data"]["assessment"], written=True)
+                        store.sync(jira)
+                    if updated:
+                        st.success(f"Business Value updated for {len(updated)} issues in Jira.")
+                    if failures:
+                        st.error(
+                            "Failed to update Jira:\n\n- "
+                            + "\n- ".join(f"{key}: {error}" for key, error in failures)
+                        )
 
-    if issues and custom_field_id:
         show_only_unassessed = st.checkbox("Show only stories without Business Value", value=False)
+        search = st.text_input("Search stories by key or summary", value="")
+        filters = {
+            "search": search,
+            "missing_field": custom_field_id if show_only_unassessed else None,
+            "without_label": VALUE_ASSESSED_LABEL if show_only_unassessed else None,
+        }
+        issues = store.issues(limit=SELECTBOX_LIMIT, **filters)
+        matching = store.count(**filters)
+        if matching > len(issues):
+            st.caption(f"Showing {len(issues)} of {matching} matching stories. Search to narrow the list.")
         filtered_issues = []
         issue_titles = []
 
         for i in issues:
             business_value_content = getattr(i.fields, custom_field_id, None)
-            is_unassessed = not business_value_content
-            if show_only_unassessed and not is_unassessed:
-                continue
+            is_unassessed = not business_value_content and VALUE_ASSESSED_LABEL not in (getattr(i.fields, "labels", None) or [])
             label = f"{'✅ ' if not is_unassessed else ''}{i.key}: {i.fields.summary}"
             issue_titles.append(label)
             filtered_issues.append(i)
@@ -198,27 +189,36 @@ if st.session_state.get("connected", False):
             with st.form("assessment_form", clear_on_submit=True):
                 context = st.text_area("Additional Context (optional)", value="")
                 submitted = st.form_submit_button("🔍 Assess Business Value")
-                if submitted:
-                    with st.spinner("Assessing with AI..."):
-                        llm = ChatOpenAI(
-                            model="gpt-4o",
-                            api_key=st.secrets["OPENAI_API_KEY"],
-                            temperature=0.2,
-                            max_tokens=1024
-                        )
-                        chain = LLMChain(
-                            llm=llm,
-                            prompt=PromptTemplate.from_template(BUSINESS_VALUE_PROMPT)
-                        )
-                        try:
-                            assessment = chain.run({"user_story": story_input, "context": context})
-                        except Exception as e:
-                            st.error(f"OpenAI Error: {e}")
-                            assessment = ""
-                        if assessment:
-                            st.markdown(f"**Business Value Assessment Output:**\n\n{assessment}")
-                            st.session_state["last_assessment"] = assessment
-                            st.session_state["last_selected_issue_key"] = selected_issue.key
+                analyze = full_analysis_button(in_form=True)
+                assess_job_name = f"assess:{selected_issue.key}"
+                if analyze:
+                    submit_job(assess_job_name, f"Analyzing {selected_issue.key}",
+                               get_story_analysis, store, selected_issue, story_points_field, context=context)
+                elif submitted:
+                    inputs, budget = fit_inputs("business_value", {"user_story": story_input, "context": context})
+                    if budget.saved_tokens:
+                        st.caption(f"Trimmed {budget.saved_tokens} tokens of logs and markup from the prompt.")
+                    submit_job(assess_job_name, f"Assessing {selected_issue.key}", collect, stream_routed(
+                        "business_value",
+                        BUSINESS_VALUE_PROMPT,
+                        inputs,
+                        temperature=0.2,
+                        max_tokens=1024
+                    ))
+                assess_job = finished_job(assess_job_name)
+                if assess_job and assess_job.error:
+                    st.error(f"OpenAI Error: {assess_job.error}")
+                elif assess_job:
+                    assessment = assess_job.result
+                    if isinstance(assessment, StoryAnalysis):
+                        assessment = assessment.business_value_output()
+                    st.markdown("**Business Value Assessment Output:**")
+                    st.markdown(assessment)
+                    if assessment:
+                        st.session_state["last_assessment"] = assessment
+                        st.session_state["last_selected_issue_key"] = selected_issue.key
+                        save_business_value(store, selected_issue.key, assessment)
+            show_running(f"assess:{selected_issue.key}")
 
             # Show Update Jira if an assessment is present for this story
             if (
@@ -228,7 +228,11 @@ if st.session_state.get("connected", False):
                 if st.button("📌 Update Jira with Business Value", key="update_jira_btn"):
                     update_fields = {custom_field_id: st.session_state["last_assessment"]}
                     try:
-                        jira.issue(selected_issue.key).update(fields=update_fields)
+                        jira.issue(selected_issue.key).update(
+                            fields=update_fields, update={"labels": [{"add": VALUE_ASSESSED_LABEL}]}
+                        )
+                        save_business_value(store, selected_issue.key, st.session_state["last_assessment"], written=True)
+                        store.sync(jira)
                         st.success(f"Business Value updated for {selected_issue.key} in Jira!")
                     except Exception as e:
                         st.error(f"Failed to update Jira: {e}")
@@ -1,99 +1,55 @@
+import time
 import streamlit as st
-from jira import JIRA
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnableSequence
+from core.jira_client import get_jira
+from core.issue_store import get_issue_store, SELECTBOX_LIMIT
+from core.jira_fields import get_field_registry
+from core.analysis import StoryAnalysis, get_story_analysis
+from core.dedup import DEDUP_THRESHOLD, get_duplicate_index, list_items
+from core.jobs import collect, finished_job, show_running, submit_job
+from core.prompt_budget import fit_inputs
+from core.parsing import parse_granularity_verdict, save_granularity
+from core.prompts import GRANULARITY_AGENT_PROMPT
+from core.routing import stream_routed
+from core.ui import connection_form, full_analysis_button, page_header
 
-st.set_page_config(page_title="Jira User Story Granularity Checker", layout="wide")
-st.title("🧩 Jira User Story Granularity Checker AI")
+page_header("Jira User Story Granularity Checker", "🧩 Jira User Story Granularity Checker AI")
 
-# ---- AGENTIC PROMPT ----
-GRANULARITY_AGENT_PROMPT = """
-You are an Agile requirements analyst and user story coach.
+PAGE_STATE_KEYS = ["last_checked_issue_key", "last_granularity_result"]
 
-Your job is to:
-- Decide if the following user story is granular (i.e., focused, specific, and achievable within a single sprint by one team).
-- If granular, reply only with "Yes" and a brief rationale.
-- If not granular, reply with "No", then explain why not, and suggest how to split or rewrite the story into smaller, granular stories if possible.
+connected = connection_form(PAGE_STATE_KEYS)
 
-User Story:
-{user_story}
-"""
-
-def clear_connection_state():
-    for k in [
-        "jira_host", "jira_email", "jira_api_token", "jira_project_key",
-        "connected",
-        "last_checked_issue_key", "last_granularity_result"
-    ]:
-        if k in st.session_state:
-            del st.session_state[k]
-
-# --- Disconnect Button (top right if connected) ---
-if st.session_state.get("connected", False):
-    colc, cold = st.columns([10, 1])
-    with cold:
-        if st.button("Disconnect"):
-            clear_connection_state()
-            st.rerun()
-
-# ---- Step 1: Jira Connection Form ----
-if not st.session_state.get("connected", False):
-    st.subheader("Connect to Jira")
-    with st.form("connection_form"):
-        jira_host = st.text_input("Jira Host URL (e.g. https://yourdomain.atlassian.net)", value=st.session_state.get("jira_host", ""))
-        jira_email = st.text_input("Jira Email", value=st.session_state.get("jira_email", ""))
-        jira_api_token = st.text_input("Jira API Token", type="password", value=st.session_state.get("jira_api_token", ""))
-        jira_project_key = st.text_input("Jira Project Key", value=st.session_state.get("jira_project_key", ""))
-        submitted = st.form_submit_button("Connect")
-
-    if submitted:
-        if not (jira_host and jira_email and jira_api_token and jira_project_key):
-            st.warning("Please fill in all fields to connect.")
-        else:
-            st.session_state["jira_host"] = jira_host.strip()
-            st.session_state["jira_email"] = jira_email.strip()
-            st.session_state["jira_api_token"] = jira_api_token.strip()
-            st.session_state["jira_project_key"] = jira_project_key.strip()
-            try:
-                jira = JIRA(server=jira_host, basic_auth=(jira_email, jira_api_token))
-                st.session_state["connected"] = True
-                st.success(f"Connected as {jira_email} to JIRA: {jira_project_key}")
-            except Exception as e:
-                st.session_state["connected"] = False
-                st.error(f"Failed to connect to Jira: {e}")
-else:
-    st.success(
-        f"Connected as {st.session_state['jira_email']} to JIRA: {st.session_state['jira_project_key']}",
-        icon="🔗"
-    )
-
-def get_llm():
-    return ChatOpenAI(model="gpt-4o", temperature=0, api_key=st.secrets["OPENAI_API_KEY"])
-
-def run_granularity_agent(user_story):
-    prompt = PromptTemplate.from_template(GRANULARITY_AGENT_PROMPT)
-    llm = get_llm()
-    chain = LLMChain(llm=llm, prompt=prompt)
-    return chain.run({"user_story": user_story})
+def stream_granularity_agent(user_story):
+    return stream_routed("granularity", GRANULARITY_AGENT_PROMPT, {"user_story": user_story})
 
 # -- Main App (after Jira connection) --
-if st.session_state.get("connected", False):
+if connected:
     jira_host = st.session_state["jira_host"]
     jira_email = st.session_state["jira_email"]
     jira_api_token = st.session_state["jira_api_token"]
     jira_project_key = st.session_state["jira_project_key"]
 
     try:
-        jira = JIRA(server=jira_host, basic_auth=(jira_email, jira_api_token))
-        jql = f'project={jira_project_key} ORDER BY created ASC'
-        issues = jira.search_issues(jql, maxResults=20)
+        jira = get_jira(jira_host, jira_email, jira_api_token)
+        story_points_field = get_field_registry(jira_host, jira_email, jira_api_token).story_points_field()
+        store = get_issue_store(jira_host, jira_email, jira_api_token, jira_project_key)
+        store.track_fields([story_points_field])
+        store.ensure_loaded(jira)
+        store.start_background_refresh(jira)
+        total_issues = store.count()
     except Exception as e:
         st.error(f"Failed to load issues: {e}")
-        issues = []
+        total_issues = 0
 
-    if issues:
+    if total_issues:
         st.subheader("Select a User Story")
+        search = st.text_input("Search stories by key or summary", value="")
+        issues = store.issues(limit=SELECTBOX_LIMIT, search=search)
+        matching = store.count(search=search)
+        if matching > len(issues):
+            st.caption(f"Showing {len(issues)} of {matching} matching stories. Search to narrow the list.")
+        if not issues:
+            st.warning("No matching stories found.")
+            st.stop()
         issue_titles = []
         filtered_issues = []
         for i in issues:
@@ -115,11 +71,29 @@ if st.session_state.get("connected", False):
 
         with col2:
             st.subheader("🔍 Granularity Check")
+            granularity_job_name = f"granularity:{selected_issue.key}"
             if st.button("Check Granularity", key="granularity_btn"):
-                with st.spinner("Analyzing granularity with AI..."):
-                    result = run_granularity_agent(user_story_text)
+                inputs, budget = fit_inputs("granularity", {"user_story": user_story_text})
+                if budget.saved_tokens:
+                    st.caption(f"Trimmed {budget.saved_tokens} tokens of logs and markup from the prompt.")
+                # The verdict streams into the job's partial output while it runs
+                submit_job(granularity_job_name, f"Checking {selected_issue.key}",
+                           collect, stream_granularity_agent(inputs["user_story"]))
+            if full_analysis_button(key="full_analysis_btn"):
+                submit_job(granularity_job_name, f"Analyzing {selected_issue.key}",
+                           get_story_analysis, store, selected_issue, story_points_field)
+            granularity_job = finished_job(granularity_job_name)
+            if granularity_job and granularity_job.error:
+                st.error(f"OpenAI Error: {granularity_job.error}")
+            elif granularity_job:
+                result = granularity_job.result
+                if isinstance(result, StoryAnalysis):
+                    result = result.granularity_output()
+                else:
+                    save_granularity(store, selected_issue.key, result)
                 st.session_state["last_checked_issue_key"] = selected_issue.key
                 st.session_state["last_granularity_result"] = result
+            show_running(granularity_job_name)
 
             # Show the result if exists and matches current issue
             if (
@@ -127,10 +101,38 @@ if st.session_state.get("connected", False):
                 and st.session_state.get("last_checked_issue_key") == selected_issue.key
             ):
                 result = st.session_state["last_granularity_result"]
-                if result.lower().startswith("yes"):
+                verdict = parse_granularity_verdict(result)
+                if verdict:
                     st.success(result)
+                elif verdict is None:
+                    st.warning(result)
                 else:
                     st.error(result)
+                    existing = get_duplicate_index(store).existing_matches(
+                        list_items(result), exclude=[selected_issue.key]
+                    )
+                    if existing:
+                        st.warning(
+                            "Some suggested splits look like existing issues:\n\n- "
+                            + "\n- ".join(
+                                f"{split} → " + ", ".join(f"{key}: {summary}" for key, summary, _ in matches[:3])
+                                for split, matches in existing.items()
+                            )
+                        )
+
+        # --------- NEAR-DUPLICATE STORIES ---------
+        with st.expander("🔁 Near-duplicate stories"):
+            threshold = st.slider("Similarity", 0.3, 1.0, float(DEDUP_THRESHOLD), 0.05, key="dedup_threshold")
+            if st.button("Find Near-duplicates", key="dedup_btn"):
+                index = get_duplicate_index(store)
+                started = time.perf_counter()
+                clusters = index.clusters(threshold)
+                elapsed = time.perf_counter() - started
+                st.caption(f"{len(clusters)} clusters among {len(index.stories)} stories in {elapsed:.2f}s.")
+                for keys in clusters[:50]:
+                    st.markdown(f"**{len(keys)} stories**\n\n" + "\n".join(
+                        f"- {key}: {index.summaries.get(key, '')}" for key in keys[:20]
+                    ) + (f"\n- … and {len(keys) - 20} more" if len(keys) > 20 else ""))
 
     else:
         st.warning("No issues found in the selected project.")
@@ -0,0 +1,23 @@
+import pytest
+
+from core.parsing import parse_business_value_output
+
+
+@pytest.mark.parametrize("output", [
+    "**Business Value Score:** High\n\n**Priority Suggestion:** Must-have  \nJustification: Unblocks checkout.",
+    "**Business Value Score:** **High**\n\n**Priority Suggestion:** **Must-have**\n**Justification:** Unblocks checkout.",
+    "Business Value Score: High\nPriority Suggestion: Must-have\nJustification: Unblocks checkout.",
+    "business value score: high\npriority suggestion: must-have\njustification: Unblocks checkout.",
+    "**Business Value Score**: _High_\n**Priority Suggestion**: *Must-have*\n*Justification:* Unblocks checkout.",
+])
+def test_business_value_variants(output):
+    assert parse_business_value_output(output) == ("High", "Must-have", "Unblocks checkout.")
+
+
+def test_business_value_missing_fields():
+    assert parse_business_value_output("I could not assess this story.") == ("", "", "")
+
+
+def test_business_value_score_is_a_whole_word():
+    score, _, _ = parse_business_value_output("**Business Value Score:** Lowish")
+    assert score == ""
@@ -0,0 +1,141 @@
+import io
+import time
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, ReadTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from core import rate_limit
+from core.rate_limit import Limiter, RateLimitedAdapter, parse_retry_after
+
+URL = "https://jira.example.com/rest/api/2/issue/PROJ-1"
+
+
+class StubTransport(HTTPAdapter):
+    """Answers each send with the next scripted status code or exception."""
+
+    def __init__(self, script, **kwargs):
+        self.script = list(script)
+        self.sent = []
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.sent.append((request.method, time.monotonic()))
+        outcome = self.script.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        status, headers = outcome if isinstance(outcome, tuple) else (outcome, {})
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.raw = io.BytesIO(b"")
+        response.request = request
+        return response
+
+
+class StubAdapter(RateLimitedAdapter, StubTransport):
+    def __init__(self, limiter, script):
+        self.limiter = limiter
+        StubTransport.__init__(self, script)
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = Limiter("jira:test", rate=0, max_concurrency=8, retries=3)
+    monkeypatch.setattr(limiter, "backoff", lambda attempt: 0.0)
+    return limiter
+
+
+def send(limiter, method, script, data=b"{}"):
+    adapter = StubAdapter(limiter, script)
+    request = requests.Request(method, URL, data=data if method != "GET" else None).prepare()
+    return adapter.send(request), adapter.sent
+
+
+def refused():
+    return RequestsConnectionError(MaxRetryError(None, URL, reason=NewConnectionError(None, "refused")))
+
+
+def test_get_is_retried_on_5xx(limiter):
+    response, sent = send(limiter, "GET", [502, 500, 200])
+    assert response.status_code == 200
+    assert len(sent) == 3
+
+
+@pytest.mark.parametrize("method", ["POST", "PUT"])
+def test_writes_are_not_retried_on_5xx(limiter, method):
+    response, sent = send(limiter, method, [502, 200])
+    assert response.status_code == 502
+    assert len(sent) == 1
+
+
+@pytest.mark.parametrize("method", ["POST", "PUT"])
+def test_writes_are_not_retried_after_a_read_timeout(limiter, method):
+    with pytest.raises(ReadTimeout):
+        send(limiter, method, [ReadTimeout("read timed out"), 200])
+
+
+@pytest.mark.parametrize("method", ["POST", "PUT"])
+def test_writes_are_retried_when_never_sent(limiter, method):
+    response, sent = send(limiter, method, [refused(), 201])
+    assert response.status_code == 201
+    assert len(sent) == 2
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_throttled_writes_are_retried(limiter, status):
+    response, sent = send(limiter, "POST", [status, 201])
+    assert response.status_code == 201
+    assert len(sent) == 2
+
+
+def test_429_waits_for_retry_after(limiter):
+    response, sent = send(limiter, "POST", [(429, {"Retry-After": "0.2"}), 201])
+    assert response.status_code == 201
+    assert sent[1][1] - sent[0][1] >= 0.19
+    assert limiter.stats()["throttled"] == 1
+
+
+def test_retries_give_up_with_the_last_response(limiter):
+    response, sent = send(limiter, "GET", [502] * 5)
+    assert response.status_code == 502
+    assert len(sent) == limiter.retries + 1
+
+
+def test_streamed_bodies_are_not_replayed(limiter):
+    adapter = StubAdapter(limiter, [502, 200])
+    request = requests.Request("GET", URL).prepare()
+    request.body = iter([b"chunk"])
+    assert adapter.send(request).status_code == 502
+    assert len(adapter.sent) == 1
+
+
+def test_limit_halves_once_per_burst_and_recovers(monkeypatch):
+    limiter = Limiter("jira:test", rate=0, max_concurrency=8)
+    limiter.throttled(retry_after=0)
+    limiter.throttled(retry_after=0)
+    assert limiter.limit == 4
+    monkeypatch.setattr(rate_limit, "DECREASE_INTERVAL_SECONDS", 0.0)
+    limiter.failed()
+    assert limiter.limit == 2
+    for _ in range(100):
+        limiter.succeeded()
+    assert limiter.limit == 8
+
+
+def test_limit_never_drops_below_one(monkeypatch):
+    monkeypatch.setattr(rate_limit, "DECREASE_INTERVAL_SECONDS", 0.0)
+    limiter = Limiter("jira:test", rate=0, max_concurrency=2)
+    for _ in range(5):
+        limiter.failed()
+    assert limiter.limit == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None